@@ -0,0 +1,154 @@
+# --- arranque.py ---
+# Arranque en segundo plano de los chatbots: mientras el usuario escribe su
+# primera pregunta se importan las librerías, se abre Chroma, se cargan los
+# modelos de Ollama en memoria y se toca el índice vectorial.
+
+import time
+import threading
+import importlib
+
+import requests
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+KEEP_ALIVE_SEGUNDOS = 30 * 60   # Tiempo que Ollama mantiene los modelos cargados tras cada uso
+TIMEOUT_CALENTAMIENTO = 300     # Cargar phi3:mini en frío puede tardar bastante
+MODULOS_PESADOS = (
+    "langchain_core.runnables",
+    "langchain_community.vectorstores",
+    "langchain_community.llms",
+    "langchain_ollama",
+    "chromadb",
+)
+COLECCION_CHROMA = "langchain"  # Nombre por defecto de la colección que crea LangChain
+# Chatbots cuya cadena RAG usan el servidor, el lote de respuestas y el benchmark.
+MODULOS_CHATBOT = {"web": "web_scraper_chatbot", "pdf": "pdf_chatbot", "unificado": "chatbot_unificado"}
+
+def importar_chatbot(corpus):
+    """
+    Importa el módulo del chatbot registrado para 'corpus' en MODULOS_CHATBOT.
+    """
+    return importlib.import_module(MODULOS_CHATBOT[corpus])
+
+class ArranqueEnSegundoPlano:
+    """
+    Construye la cadena RAG y precarga los modelos en un hilo aparte.
+    'esperar()' bloquea solo si el usuario pregunta antes de que termine.
+    """
+
+    def __init__(self, construir_cadena, base_url, modelo_llm, modelo_embedding, chroma_path):
+        self.construir_cadena = construir_cadena
+        self.base_url = base_url
+        self.modelo_llm = modelo_llm
+        self.modelo_embedding = modelo_embedding
+        self.chroma_path = chroma_path
+        self.tiempos = {}
+        self.avisos = []
+        self._cadena = None
+        self._error = None
+        self._vector_calentamiento = None
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True)
+        self._inicio = None
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        self._hilo.start()
+        return self
+
+    def listo(self):
+        return not self._hilo.is_alive()
+
+    def esperar(self):
+        """
+        Devuelve la cadena ya construida, o relanza el error del arranque.
+        """
+        self._hilo.join()
+        if self._error is not None:
+            raise self._error
+        return self._cadena
+
+    # --- Etapas ---
+
+    def _medir(self, etapa, funcion):
+        inicio = time.perf_counter()
+        try:
+            return funcion()
+        finally:
+            self.tiempos[etapa] = time.perf_counter() - inicio
+
+    def _importar(self):
+        for modulo in MODULOS_PESADOS:
+            importlib.import_module(modulo)
+
+    def _cargar_llm(self):
+        # Una petición sin prompt solo carga el modelo en memoria.
+        respuesta = requests.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.modelo_llm, "keep_alive": KEEP_ALIVE_SEGUNDOS},
+            timeout=TIMEOUT_CALENTAMIENTO,
+        )
+        respuesta.raise_for_status()
+
+    def _cargar_embedding(self):
+        respuesta = requests.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.modelo_embedding, "input": ["calentamiento"],
+                  "keep_alive": KEEP_ALIVE_SEGUNDOS},
+            timeout=TIMEOUT_CALENTAMIENTO,
+        )
+        respuesta.raise_for_status()
+        self._vector_calentamiento = respuesta.json()["embeddings"][0]
+
+    def _tocar_indice(self):
+        """
+        Hace una consulta mínima para que Chroma cargue el índice HNSW en memoria.
+        """
+        import chromadb
+        import chromadb.errors
+        # Las versiones antiguas de Chroma lanzan ValueError si la colección no existe.
+        no_encontrada = getattr(chromadb.errors, "NotFoundError", ValueError)
+        cliente = chromadb.PersistentClient(path=self.chroma_path)
+        try:
+            # 'get_or_create_collection' crearía una colección vacía como efecto secundario.
+            coleccion = cliente.get_collection(COLECCION_CHROMA)
+        except (ValueError, no_encontrada):
+            return
+        if coleccion.count() and self._vector_calentamiento is not None:
+            coleccion.query(query_embeddings=[self._vector_calentamiento], n_results=1)
+
+    def _calentar(self, etapa, funcion):
+        # Un fallo al calentar no impide usar el chatbot; solo se avisa en el reporte.
+        try:
+            self._medir(etapa, funcion)
+        except Exception as e:
+            self.avisos.append(f"{etapa}: {e}")
+
+    def _ejecutar(self):
+        try:
+            self._medir("importaciones", self._importar)
+
+            # Los modelos se cargan en Ollama mientras se abre Chroma.
+            hilos = [
+                threading.Thread(target=self._calentar, args=("carga_llm", self._cargar_llm)),
+                threading.Thread(target=self._calentar, args=("carga_embedding", self._cargar_embedding)),
+            ]
+            for hilo in hilos:
+                hilo.start()
+            self._cadena = self._medir("apertura_chroma_y_cadena", self.construir_cadena)
+            for hilo in hilos:
+                hilo.join()
+
+            self._calentar("indice_vectorial", self._tocar_indice)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.tiempos["total"] = time.perf_counter() - self._inicio
+
+    def reporte(self):
+        """
+        Imprime cuánto tardó cada etapa del arranque.
+        """
+        print("[arranque] " + " | ".join(
+            f"{etapa}: {segundos:.2f}s" for etapa, segundos in self.tiempos.items()
+        ))
+        for aviso in self.avisos:
+            print(f"[arranque] aviso, no se pudo precalentar {aviso}")
@@ -0,0 +1,680 @@
+# --- benchmark_rag.py ---
+# Banco de pruebas de latencia para la cadena RAG y de rendimiento de la ingesta.
+#
+#   # Reproducir las preguntas con el Ollama falso (no necesita modelos, apto para CI):
+#   python benchmark_rag.py ejecutar --corpus web --falso --salida base.json
+#   # ...cambiar chunk_size, k o la plantilla y volver a medir:
+#   python benchmark_rag.py ejecutar --corpus web --falso --salida nuevo.json
+#   # Comparar ambas corridas (termina con código 1 si hay regresiones):
+#   python benchmark_rag.py comparar base.json nuevo.json
+#   # Comparar Chroma con el índice NumPy exportado (latencia, memoria y recall@k):
+#   python benchmark_rag.py indice --corpus web
+#   # Comparar el divisor por caracteres con el estructurado (fragmentos, tiempos, contexto):
+#   python benchmark_rag.py division --falso
+#   # Saturar 'servidor_rag.py' y verificar los 503 con Retry-After (código 1 si falla):
+#   python benchmark_rag.py sobrecarga
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+
+from arranque import MODULOS_CHATBOT, importar_chatbot
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+PREGUNTAS_PATH = "preguntas_benchmark.jsonl"
+TOLERANCIA_REGRESION = 0.10   # Un empeoramiento mayor al 10% se marca como regresión
+UMBRAL_ABSOLUTO_S = 0.005     # Diferencias menores a 5 ms se consideran ruido
+PERCENTILES = (50, 95, 99)
+TIMEOUT_PROCESO_S = 600       # Espera máxima por la medición de un backend vectorial
+
+# --- UTILIDADES ---
+
+def percentil(valores, p):
+    """
+    Percentil por el método del rango más cercano (valores ya ordenados).
+    """
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, math.ceil(p / 100 * len(valores)) - 1))
+    return valores[indice]
+
+def resumir(muestras):
+    """
+    Devuelve n, media y percentiles (en segundos) de una lista de duraciones.
+    """
+    ordenadas = sorted(muestras)
+    resumen = {"n": len(ordenadas), "media": sum(ordenadas) / len(ordenadas) if ordenadas else None}
+    for p in PERCENTILES:
+        resumen[f"p{p}"] = percentil(ordenadas, p)
+    return resumen
+
+def cargar_preguntas(ruta):
+    preguntas = []
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        for linea in archivo:
+            if linea.strip():
+                preguntas.append(json.loads(linea)["pregunta"])
+    return preguntas
+
+def iniciar_ollama_falso():
+    """
+    Arranca el servidor falso de Ollama en un puerto libre y apunta
+    OLLAMA_BASE_URL hacia él. Debe llamarse antes de importar los chatbots.
+    """
+    import ollama_falso
+    servidor = ollama_falso.crear_servidor(puerto=0, retardo_por_token=0.005)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address
+    os.environ["OLLAMA_BASE_URL"] = f"http://{host}:{puerto}"
+    os.environ["OLLAMA_HOST"] = f"http://{host}:{puerto}"
+    return servidor
+
+# --- LATENCIA DE CONSULTA ---
+
+class ColectorTrazas:
+    """
+    Sustituye al trazador de 'trazas.py': guarda las trazas en memoria en
+    lugar de escribirlas en 'trazas/'.
+    """
+
+    def __init__(self):
+        self.trazas = []
+
+    def registrar(self, traza):
+        self.trazas.append(traza)
+
+def descomponer_cadena(rag_chain):
+    """
+    Separa la cadena de 'get_rag_chain()' en la recuperación (rama "context"
+    y pregunta), la construcción del prompt y la generación.
+    """
+    from langchain_core.runnables import RunnableSequence
+    from trazas import desenvolver_cadena
+
+    # El benchmark usa su propio callback de trazas, en memoria.
+    rag_chain, _ = desenvolver_cadena(rag_chain)
+    return {
+        "recuperacion": rag_chain.first,
+        "prompt": rag_chain.steps[1],
+        "generacion": RunnableSequence(*rag_chain.steps[2:]),
+    }
+
+def medir_consultas(rag_chain, preguntas, repeticiones=1):
+    """
+    Reproduce las preguntas a través de la cadena y devuelve las duraciones
+    por etapa. Las de la recuperación salen de su traza: embedding de la
+    pregunta, búsqueda léxica, búsqueda vectorial, el retriever completo y el
+    contexto ya ensamblado. Se suman la construcción del prompt y la generación.
+    Una etapa que no ocurre (p. ej. el embedding con el atajo léxico) no
+    aporta muestra en esa pregunta.
+    """
+    from trazas import TrazasCadenaRAG
+
+    piezas = descomponer_cadena(rag_chain)
+    colector = ColectorTrazas()
+    config = {"callbacks": [TrazasCadenaRAG(colector)]}
+    tiempos = {}
+
+    def registrar(etapa, duracion):
+        tiempos.setdefault(etapa, []).append(duracion)
+
+    for _ in range(repeticiones):
+        for pregunta in preguntas:
+            inicio_total = time.perf_counter()
+            entrada = piezas["recuperacion"].invoke(pregunta, config=config)
+            por_etapa = {}
+            for etapa in colector.trazas.pop()["etapas"]:
+                nombre = "contexto" if etapa["etapa"] == "total" else etapa["etapa"]
+                por_etapa[nombre] = por_etapa.get(nombre, 0.0) + etapa["segundos"]
+            for etapa, duracion in por_etapa.items():
+                registrar(etapa, duracion)
+
+            inicio = time.perf_counter()
+            prompt = piezas["prompt"].invoke(entrada)
+            registrar("construccion_prompt", time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            piezas["generacion"].invoke(prompt)
+            registrar("generacion", time.perf_counter() - inicio)
+            registrar("total", time.perf_counter() - inicio_total)
+
+    return {etapa: resumir(muestras) for etapa, muestras in tiempos.items()}
+
+# --- RENDIMIENTO DE LA INGESTA ---
+
+def crear_destino_temporal(carpeta, modelo_embedding):
+    """
+    Colección Chroma y caché de embeddings vacías dentro de 'carpeta', para
+    que todos los fragmentos pasen por Ollama y no se toquen las bases reales.
+    """
+    from langchain_community.vectorstores import Chroma
+    from langchain_ollama import OllamaEmbeddings
+    from cache_embeddings import EmbeddingsConCache
+
+    embeddings = EmbeddingsConCache(
+        modelo_embedding,
+        ruta=os.path.join(carpeta, "cache.sqlite3"),
+        embeddings_base=OllamaEmbeddings(
+            model=modelo_embedding,
+            base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
+        ),
+    )
+    vectorstore = Chroma(persist_directory=os.path.join(carpeta, "chroma"), embedding_function=embeddings)
+    return vectorstore, embeddings
+
+def medir_ingesta(nombre, documentos, dividir_documentos, modelo_embedding, preguntas=None, k=4):
+    """
+    Mide la división y el guardado con 'sincronizar_coleccion' (el mismo
+    camino que 'web_scraper_vectordb.py') en una base Chroma temporal.
+    Con 'preguntas', mide también los tokens del CONTEXTO que se arma con los
+    k fragmentos más cercanos a cada una.
+    """
+    from deduplicacion import contar_tokens, ensamblar_contexto
+    from web_scraper_vectordb import sincronizar_coleccion
+
+    if not documentos:
+        return {"omitido": "no hay documentos de entrada"}
+
+    carpeta = tempfile.mkdtemp(prefix=f"benchmark_{nombre}_")
+    try:
+        inicio = time.perf_counter()
+        fragmentos = dividir_documentos(documentos) or []
+        duracion_division = time.perf_counter() - inicio
+
+        vectorstore, embeddings = crear_destino_temporal(carpeta, modelo_embedding)
+        inicio = time.perf_counter()
+        sincronizar_coleccion(vectorstore, fragmentos)
+        duracion_embedding = time.perf_counter() - inicio
+        tokens_contexto = [
+            contar_tokens(ensamblar_contexto(vectorstore.similarity_search(pregunta, k=k)))
+            for pregunta in preguntas or []
+        ]
+        embeddings.cerrar()
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    resultado = {
+        "documentos": len(documentos),
+        "fragmentos": len(fragmentos),
+        "tokens_fragmentos": sum(contar_tokens(f.page_content) for f in fragmentos),
+        "division_s": duracion_division,
+        "embedding_y_guardado_s": duracion_embedding,
+        "fragmentos_por_s": len(fragmentos) / duracion_embedding if duracion_embedding else None,
+    }
+    if tokens_contexto:
+        resultado["tokens_contexto_medio"] = sum(tokens_contexto) / len(tokens_contexto)
+    return resultado
+
+def cargar_documentos_pdf(max_archivos=None):
+    import pdf_vectordb
+    rutas = pdf_vectordb.listar_archivos_fuente()[:max_archivos]
+    return [doc for ruta in rutas for doc in pdf_vectordb.cargar_archivo(ruta)]
+
+def cargar_documentos_web():
+    """
+    Usa las páginas ya guardadas en la caché HTTP para no depender de la red.
+    Devuelve None si aún no existe la caché.
+    """
+    import web_scraper_vectordb
+    from langchain_core.documents import Document
+
+    if not os.path.exists(web_scraper_vectordb.CACHE_HTTP_PATH):
+        return None
+    cache = web_scraper_vectordb.CacheHTTP()
+    documentos = []
+    for url, entrada in cache.indice.items():
+        if entrada.get("sha256"):
+            paginas = cache.leer_paginas_pdf(entrada["sha256"]) or []
+            documentos.extend(web_scraper_vectordb.documentos_pdf(url, paginas))
+        else:
+            documentos.append(Document(page_content=cache.leer_texto(url), metadata={"source": url}))
+    return documentos
+
+def medir_ingesta_pdf(max_archivos=None):
+    """
+    Indexa los archivos de 'data' con 'ingestar_en_paralelo' (el pipeline de
+    'pdf_vectordb.py': parseo, división, embedding y upsert) en una base
+    temporal. Devuelve el tiempo total y el tiempo ocupado de cada etapa.
+    """
+    import pdf_vectordb
+    from deduplicacion import IndiceMinHash
+
+    rutas = pdf_vectordb.listar_archivos_fuente()[:max_archivos]
+    if not rutas:
+        return {"omitido": f"no hay archivos en '{pdf_vectordb.DATA_PATH}'"}
+
+    carpeta = tempfile.mkdtemp(prefix="benchmark_pdf_")
+    try:
+        vectorstore, embeddings = crear_destino_temporal(carpeta, pdf_vectordb.MODELO_EMBEDDING)
+        hashes = {ruta: pdf_vectordb.calcular_hash_archivo(ruta) for ruta in rutas}
+        inicio = time.perf_counter()
+        stats = pdf_vectordb.ingestar_en_paralelo(
+            rutas, hashes, vectorstore, embeddings, IndiceMinHash(), lambda ruta, ids, conservados_en: None
+        )
+        duracion = time.perf_counter() - inicio
+        embeddings.cerrar()
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    fragmentos = stats["upsert"].elementos
+    return {
+        "archivos": len(rutas),
+        "fragmentos": fragmentos,
+        "total_s": duracion,
+        "etapas_ocupadas_s": {nombre: etapa.segundos for nombre, etapa in stats.items()},
+        "fragmentos_por_s": fragmentos / duracion if duracion else None,
+    }
+
+def medir_ingesta_web():
+    import web_scraper_vectordb
+
+    documentos = cargar_documentos_web()
+    if documentos is None:
+        return {"omitido": f"no existe '{web_scraper_vectordb.CACHE_HTTP_PATH}'; ejecuta primero web_scraper_vectordb.py"}
+    return medir_ingesta("web", documentos, web_scraper_vectordb.dividir_documentos,
+                         web_scraper_vectordb.MODELO_EMBEDDING)
+
+# --- DIVISORES: POR CARACTERES FRENTE AL ESTRUCTURADO ---
+
+def comparar_divisores(args):
+    """
+    Indexa cada corpus con los dos divisores en una base temporal y compara
+    fragmentos, tokens embebidos, tiempo de división y de embedding, y los
+    tokens del CONTEXTO armado con los k fragmentos más cercanos a cada pregunta.
+    """
+    import pdf_vectordb
+    import web_scraper_vectordb
+    from division_estructurada import DIVISORES
+
+    if args.falso:
+        iniciar_ollama_falso()
+    preguntas = cargar_preguntas(args.preguntas)
+    corpus = {
+        "pdf": (cargar_documentos_pdf(args.max_archivos), pdf_vectordb),
+        "web": (cargar_documentos_web(), web_scraper_vectordb),
+    }
+
+    resultados = {}
+    for nombre, (documentos, modulo) in corpus.items():
+        if not documentos:
+            print(f"{nombre}: omitido (no hay documentos; para la web ejecuta primero web_scraper_vectordb.py)")
+            continue
+        for divisor in DIVISORES:
+            print(f"Indexando '{nombre}' con el divisor '{divisor}'...")
+            resultados[f"{nombre}/{divisor}"] = medir_ingesta(
+                f"{nombre}_{divisor}", documentos,
+                lambda docs: modulo.dividir_documentos(docs, divisor=divisor),
+                modulo.MODELO_EMBEDDING, preguntas, args.k,
+            )
+
+    print(f"\n{'corpus/divisor':<24}{'fragmentos':>11}{'tokens':>9}{'división s':>12}"
+          f"{'embedding s':>13}{f'contexto k={args.k}':>16}")
+    for nombre, r in resultados.items():
+        print(f"{nombre:<24}{r['fragmentos']:>11}{r['tokens_fragmentos']:>9}{r['division_s']:>12.2f}"
+              f"{r['embedding_y_guardado_s']:>13.2f}{r.get('tokens_contexto_medio', 0):>16.0f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"k": args.k, "preguntas": len(preguntas), "divisores": resultados},
+                      archivo, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en '{args.salida}'.")
+
+# --- BACKENDS VECTORIALES: CHROMA FRENTE AL ÍNDICE NUMPY ---
+
+def rss_actual_mb():
+    """
+    Memoria residente del proceso en MB (None si el sistema no la expone).
+    """
+    try:
+        with open("/proc/self/status", "r") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+def _medir_backend(backend, ruta, vectores, k, repeticiones, cola):
+    """
+    Se ejecuta en un proceso aparte para que la memoria de cada backend se
+    mida por separado. Devuelve latencias, IDs recuperados y memoria.
+    """
+    import numpy as np
+    rss_inicial = rss_actual_mb()
+    inicio = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        from arranque import COLECCION_CHROMA
+        coleccion = chromadb.PersistentClient(path=ruta).get_collection(COLECCION_CHROMA)
+
+        def buscar(vector):
+            resultado = coleccion.query(query_embeddings=[vector], n_results=k,
+                                        include=["documents", "metadatas", "distances"])
+            return resultado["ids"][0]
+    else:
+        from indice_numpy import IndiceNumpy
+        indice = IndiceNumpy(ruta)
+
+        def buscar(vector):
+            return [indice.documento(fila).metadata["id"] for fila, _ in indice.buscar(vector, k)]
+    apertura = time.perf_counter() - inicio
+
+    ids = [buscar(vector) for vector in vectores]   # También sirve de calentamiento
+    latencias = []
+    for _ in range(repeticiones):
+        for vector in vectores:
+            inicio = time.perf_counter()
+            buscar(vector)
+            latencias.append(time.perf_counter() - inicio)
+    rss_final = rss_actual_mb()
+    cola.put({
+        "apertura_s": apertura,
+        "busqueda": resumir(latencias),
+        "ids": ids,
+        "rss_mb": rss_final,
+        "rss_incremento_mb": rss_final - rss_inicial if rss_final is not None else None,
+    })
+
+def tamano_en_disco_mb(ruta):
+    total = 0
+    for raiz, _, archivos in os.walk(ruta):
+        total += sum(os.path.getsize(os.path.join(raiz, nombre)) for nombre in archivos)
+    return total / 1024 / 1024
+
+def comparar_backends(args):
+    """
+    Compara Chroma con el índice NumPy (float16 e int8): latencia de búsqueda,
+    memoria residente y recall@k respecto de la búsqueda exacta en float32.
+    """
+    import multiprocessing
+    import numpy as np
+    from langchain_community.vectorstores import Chroma
+    from langchain_ollama import OllamaEmbeddings
+    from indice_numpy import exportar_desde_chroma, normalizar_filas, ruta_indice
+
+    if args.falso:
+        iniciar_ollama_falso()
+    chatbot = importar_chatbot(args.corpus)
+    embeddings = OllamaEmbeddings(model=chatbot.MODELO_EMBEDDING,
+                                  base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"))
+    preguntas = cargar_preguntas(args.preguntas)
+    vectores = embeddings.embed_documents(preguntas)
+
+    # Referencia: búsqueda exacta en float32 sobre todos los vectores guardados.
+    vectorstore = Chroma(persist_directory=chatbot.CHROMA_PATH)
+    datos = vectorstore._collection.get(include=["embeddings"])
+    matriz = normalizar_filas(np.asarray(datos["embeddings"], dtype=np.float32))
+    consultas = normalizar_filas(np.asarray(vectores, dtype=np.float32))
+    exactos = [[datos["ids"][i] for i in np.argsort(-(matriz @ q))[:args.k]] for q in consultas]
+
+    carpeta = tempfile.mkdtemp(prefix="benchmark_indice_")
+    try:
+        backends = {"chroma": chatbot.CHROMA_PATH}
+        for tipo in ("float16", "int8"):
+            destino = os.path.join(carpeta, tipo)
+            exportar_desde_chroma(vectorstore, destino, tipo)
+            backends[f"numpy_{tipo}"] = ruta_indice(destino)
+
+        contexto = multiprocessing.get_context("spawn")
+        resultados = {}
+        for nombre, ruta in backends.items():
+            cola = contexto.Queue()
+            proceso = contexto.Process(
+                target=_medir_backend,
+                args=("chroma" if nombre == "chroma" else "numpy", ruta, vectores, args.k, args.repeticiones, cola),
+            )
+            proceso.start()
+            try:
+                resultado = cola.get(timeout=TIMEOUT_PROCESO_S)
+            except queue.Empty:
+                proceso.terminate()
+                raise RuntimeError(f"La medición de '{nombre}' no terminó (código de salida {proceso.exitcode}).")
+            proceso.join()
+            aciertos = sum(len(set(ids) & set(ref)) for ids, ref in zip(resultado.pop("ids"), exactos))
+            resultado[f"recall@{args.k}"] = aciertos / (len(exactos) * args.k)
+            resultado["disco_mb"] = tamano_en_disco_mb(ruta)
+            resultados[nombre] = resultado
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"\n{len(matriz)} fragmentos, {len(preguntas)} preguntas x{args.repeticiones}, k={args.k}")
+    print(f"{'backend':<16}{'p50 ms':>9}{'p95 ms':>9}{'apertura s':>12}{'RSS MB':>9}{'+RSS MB':>9}"
+          f"{'disco MB':>10}{'recall':>8}")
+    for nombre, r in resultados.items():
+        rss = f"{r['rss_mb']:>9.1f}{r['rss_incremento_mb']:>9.1f}" if r["rss_mb"] is not None else f"{'-':>9}{'-':>9}"
+        print(f"{nombre:<16}{r['busqueda']['p50'] * 1000:>9.3f}{r['busqueda']['p95'] * 1000:>9.3f}"
+              f"{r['apertura_s']:>12.3f}{rss}{r['disco_mb']:>10.1f}{r[f'recall@{args.k}']:>8.3f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"corpus": args.corpus, "k": args.k, "fragmentos": len(matriz),
+                       "backends": resultados}, archivo, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en '{args.salida}'.")
+
+# --- SOBRECARGA DEL SERVIDOR RAG ---
+
+async def _saturar_servidor(app, pregunta, concurrentes):
+    """
+    Levanta 'app' en un puerto libre, le envía 'concurrentes' preguntas a la
+    vez (la mitad en streaming) y devuelve [(estado, Retry-After)] y '/estado'.
+    """
+    import aiohttp
+    from aiohttp import web
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    sitio = web.TCPSite(runner, "127.0.0.1", 0)
+    await sitio.start()
+    host, puerto = runner.addresses[0][:2]
+    url = f"http://{host}:{puerto}"
+    try:
+        async with aiohttp.ClientSession() as sesion:
+            async def preguntar(i):
+                ruta = "/preguntar/stream" if i % 2 else "/preguntar"
+                async with sesion.post(url + ruta, json={"pregunta": pregunta}) as respuesta:
+                    await respuesta.read()
+                    return respuesta.status, respuesta.headers.get("Retry-After")
+
+            respuestas = await asyncio.gather(*(preguntar(i) for i in range(concurrentes)))
+            # Con la carga ya atendida, una pregunta más debe responderse con normalidad.
+            respuestas.append(await preguntar(0))
+            async with sesion.get(url + "/estado") as respuesta:
+                estado = await respuesta.json()
+    finally:
+        await runner.cleanup()
+    return respuestas, estado
+
+def probar_sobrecarga(args):
+    """
+    Comprueba contra el Ollama falso que 'servidor_rag.py' limita la carga: las
+    preguntas que no caben en la cola reciben 503 con Retry-After, las demás
+    200, y al terminar no quedan turnos ni lugares de cola ocupados.
+    """
+    import servidor_rag
+
+    iniciar_ollama_falso()
+    chatbot = importar_chatbot(args.corpus)
+    app = servidor_rag.crear_app(chatbot.get_rag_chain(), max_generaciones=args.max_generaciones,
+                                 max_en_cola=args.max_en_cola, timeout_cola=args.timeout_cola)
+    pregunta = cargar_preguntas(args.preguntas)[0]
+    respuestas, estado = asyncio.run(_saturar_servidor(app, pregunta, args.concurrentes))
+
+    rechazadas = [r for r in respuestas if r[0] == 503]
+    atendidas = [r for r in respuestas if r[0] == 200]
+    print(f"{len(respuestas)} preguntas: {len(atendidas)} atendidas, {len(rechazadas)} rechazadas con 503")
+    print(f"/estado: {estado}")
+
+    fallos = []
+    if len(atendidas) + len(rechazadas) != len(respuestas):
+        fallos.append(f"códigos inesperados: {sorted({r[0] for r in respuestas} - {200, 503})}")
+    if not rechazadas:
+        fallos.append("ninguna pregunta se rechazó; la cola no limita la carga")
+    if any(retry is None for _, retry in rechazadas):
+        fallos.append("hay respuestas 503 sin encabezado Retry-After")
+    if respuestas[-1][0] != 200:
+        fallos.append(f"tras la carga, una pregunta nueva recibió {respuestas[-1][0]}")
+    if estado["en_curso"] or estado["en_cola"]:
+        fallos.append("quedaron turnos o lugares de cola sin liberar")
+    if (estado["rechazadas"], estado["atendidas"]) != (len(rechazadas), len(atendidas)):
+        fallos.append("los contadores de '/estado' no coinciden con las respuestas")
+
+    if fallos:
+        print("\nFallos:")
+        for fallo in fallos:
+            print(f"   - {fallo}")
+        sys.exit(1)
+    print("\nEl servidor rechaza el exceso de carga con 503 y Retry-After.")
+
+# --- COMPARACIÓN DE CORRIDAS ---
+
+def comparar(base, nueva, tolerancia=TOLERANCIA_REGRESION):
+    """
+    Compara dos resultados y devuelve la lista de regresiones encontradas.
+    Una etapa empeora si su p50 o p95 crece más que 'tolerancia' (y más de
+    UMBRAL_ABSOLUTO_S); la ingesta
+    empeora si sus fragmentos por segundo bajan más que 'tolerancia'.
+    """
+    regresiones = []
+    print(f"{'etapa':<22}{'métrica':>8}{'base':>12}{'nueva':>12}{'cambio':>10}")
+    for etapa, stats_nueva in nueva.get("consultas", {}).items():
+        stats_base = base.get("consultas", {}).get(etapa)
+        if not stats_base:
+            continue
+        for metrica in ("p50", "p95", "p99"):
+            antes, despues = stats_base.get(metrica), stats_nueva.get(metrica)
+            if not antes or despues is None:
+                continue
+            cambio = (despues - antes) / antes
+            marca = ""
+            if metrica in ("p50", "p95") and cambio > tolerancia and despues - antes > UMBRAL_ABSOLUTO_S:
+                marca = "  ⚠️ REGRESIÓN"
+                regresiones.append(f"{etapa} {metrica}: {antes:.4f}s -> {despues:.4f}s ({cambio:+.0%})")
+            print(f"{etapa:<22}{metrica:>8}{antes:>11.4f}s{despues:>11.4f}s{cambio:>+10.0%}{marca}")
+
+    for corpus, stats_nueva in nueva.get("ingesta", {}).items():
+        antes = base.get("ingesta", {}).get(corpus, {}).get("fragmentos_por_s")
+        despues = stats_nueva.get("fragmentos_por_s")
+        if not antes or despues is None:
+            continue
+        cambio = (despues - antes) / antes
+        marca = ""
+        if cambio < -tolerancia:
+            marca = "  ⚠️ REGRESIÓN"
+            regresiones.append(f"ingesta {corpus}: {antes:.1f} -> {despues:.1f} fragmentos/s ({cambio:+.0%})")
+        print(f"{'ingesta ' + corpus:<22}{'frag/s':>8}{antes:>12.1f}{despues:>12.1f}{cambio:>+10.0%}{marca}")
+    return regresiones
+
+# --- PUNTO DE ENTRADA ---
+
+def ejecutar(args):
+    if args.falso:
+        iniciar_ollama_falso()
+        print(f"Usando el Ollama falso en {os.environ['OLLAMA_BASE_URL']}")
+
+    chatbot = importar_chatbot(args.corpus)
+    preguntas = cargar_preguntas(args.preguntas)
+    resultado = {
+        "corpus": args.corpus,
+        "falso": args.falso,
+        "preguntas": len(preguntas),
+        "repeticiones": args.repeticiones,
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    print(f"Reproduciendo {len(preguntas)} preguntas x{args.repeticiones} con '{chatbot.__name__}'...")
+    resultado["consultas"] = medir_consultas(chatbot.get_rag_chain(), preguntas, args.repeticiones)
+    for etapa, stats in resultado["consultas"].items():
+        print(f"   {etapa:<22} p50={stats['p50']:.4f}s p95={stats['p95']:.4f}s p99={stats['p99']:.4f}s")
+
+    if not args.sin_ingesta:
+        print("Midiendo la ingesta...")
+        resultado["ingesta"] = {
+            "pdf": medir_ingesta_pdf(args.max_archivos),
+            "web": medir_ingesta_web(),
+        }
+        for corpus, stats in resultado["ingesta"].items():
+            if "omitido" in stats:
+                print(f"   {corpus}: omitido ({stats['omitido']})")
+            else:
+                print(f"   {corpus}: {stats['fragmentos']} fragmentos, {stats['fragmentos_por_s']:.1f} fragmentos/s")
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en '{args.salida}'.")
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia de la cadena RAG y de la ingesta.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    p_ejecutar = subparsers.add_parser("ejecutar", help="Reproduce las preguntas y mide cada etapa.")
+    p_ejecutar.add_argument("--corpus", choices=sorted(MODULOS_CHATBOT), default="web")
+    p_ejecutar.add_argument("--preguntas", default=PREGUNTAS_PATH, help="Archivo JSONL con {\"pregunta\": ...} por línea.")
+    p_ejecutar.add_argument("--repeticiones", type=int, default=1)
+    p_ejecutar.add_argument("--falso", action="store_true", help="Usa el Ollama falso determinista en lugar de los modelos.")
+    p_ejecutar.add_argument("--sin-ingesta", action="store_true", help="Mide solo las consultas.")
+    p_ejecutar.add_argument("--max-archivos", type=int, default=None, help="Limita los PDFs usados en la ingesta.")
+    p_ejecutar.add_argument("--salida", default="benchmark_resultados.json")
+
+    p_indice = subparsers.add_parser("indice", help="Compara Chroma con el índice NumPy (latencia, memoria, recall@k).")
+    p_indice.add_argument("--corpus", choices=("pdf", "web"), default="web")
+    p_indice.add_argument("--preguntas", default=PREGUNTAS_PATH)
+    p_indice.add_argument("--repeticiones", type=int, default=20)
+    p_indice.add_argument("--k", type=int, default=4)
+    p_indice.add_argument("--falso", action="store_true", help="Vectoriza las preguntas con el Ollama falso.")
+    p_indice.add_argument("--salida", default=None)
+
+    p_division = subparsers.add_parser("division", help="Compara el divisor por caracteres con el estructurado.")
+    p_division.add_argument("--preguntas", default=PREGUNTAS_PATH)
+    p_division.add_argument("--k", type=int, default=4)
+    p_division.add_argument("--max-archivos", type=int, default=None, help="Limita los PDFs indexados.")
+    p_division.add_argument("--falso", action="store_true", help="Usa el Ollama falso determinista.")
+    p_division.add_argument("--salida", default=None)
+
+    p_sobrecarga = subparsers.add_parser("sobrecarga", help="Satura el servidor RAG (con el Ollama falso) y verifica los 503.")
+    p_sobrecarga.add_argument("--corpus", choices=sorted(MODULOS_CHATBOT), default="web")
+    p_sobrecarga.add_argument("--preguntas", default=PREGUNTAS_PATH)
+    p_sobrecarga.add_argument("--concurrentes", type=int, default=20)
+    p_sobrecarga.add_argument("--max-generaciones", type=int, default=1)
+    p_sobrecarga.add_argument("--max-en-cola", type=int, default=2)
+    p_sobrecarga.add_argument("--timeout-cola", type=float, default=30)
+
+    p_comparar = subparsers.add_parser("comparar", help="Compara dos resultados y marca regresiones.")
+    p_comparar.add_argument("base")
+    p_comparar.add_argument("nueva")
+    p_comparar.add_argument("--tolerancia", type=float, default=TOLERANCIA_REGRESION)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parsear_argumentos()
+    if args.comando == "ejecutar":
+        ejecutar(args)
+    elif args.comando == "indice":
+        comparar_backends(args)
+    elif args.comando == "division":
+        comparar_divisores(args)
+    elif args.comando == "sobrecarga":
+        probar_sobrecarga(args)
+    else:
+        with open(args.base, "r", encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        with open(args.nueva, "r", encoding="utf-8") as archivo:
+            nueva = json.load(archivo)
+        regresiones = comparar(base, nueva, args.tolerancia)
+        if regresiones:
+            print("\nRegresiones detectadas:")
+            for regresion in regresiones:
+                print(f"   - {regresion}")
+            sys.exit(1)
+        print("\nSin regresiones.")
@@ -0,0 +1,120 @@
+# --- cache_embeddings.py ---
+# Caché persistente de embeddings compartida por 'pdf_vectordb.py' y 'web_scraper_vectordb.py'.
+
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+CACHE_EMBEDDINGS_PATH = "cache_embeddings.sqlite3"
+TAMANO_LOTE_OLLAMA = 128    # Fragmentos enviados a Ollama en cada llamada
+MAX_PARAMETROS_SQLITE = 500 # Claves consultadas por sentencia SELECT
+
+def hash_texto(texto):
+    """
+    Devuelve el hash SHA-256 del texto, usado como clave de la caché.
+    """
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+class EmbeddingsConCache(Embeddings):
+    """
+    Envoltorio de un modelo de embeddings que guarda cada vector en SQLite,
+    indexado por (modelo, hash del texto). Solo los textos que no están en la
+    caché se envían al modelo, agrupados en lotes grandes.
+    """
+
+    def __init__(self, modelo, ruta=CACHE_EMBEDDINGS_PATH, embeddings_base=None,
+                 tamano_lote=TAMANO_LOTE_OLLAMA):
+        self.modelo = modelo
+        self.embeddings_base = embeddings_base or OllamaEmbeddings(model=modelo)
+        self.tamano_lote = tamano_lote
+        self.aciertos = 0
+        self.fallos = 0
+        self.repetidos = 0        # Copias de un texto ya pendiente en el mismo lote
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " modelo TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (modelo, hash))"
+        )
+        self._conexion.commit()
+
+    def _buscar(self, hashes):
+        """
+        Devuelve {hash: vector} para los hashes que ya están en la caché.
+        """
+        encontrados = {}
+        hashes = list(hashes)
+        with self._lock:
+            for inicio in range(0, len(hashes), MAX_PARAMETROS_SQLITE):
+                lote = hashes[inicio:inicio + MAX_PARAMETROS_SQLITE]
+                marcadores = ",".join("?" * len(lote))
+                filas = self._conexion.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE modelo = ? AND hash IN ({marcadores})",
+                    [self.modelo, *lote],
+                )
+                for clave, blob in filas:
+                    encontrados[clave] = array("f", blob).tolist()
+        return encontrados
+
+    def _guardar(self, pares):
+        """
+        Inserta en la caché una lista de pares (hash, vector).
+        """
+        with self._lock:
+            self._conexion.executemany(
+                "INSERT OR REPLACE INTO embeddings (modelo, hash, vector) VALUES (?, ?, ?)",
+                [(self.modelo, clave, array("f", vector).tobytes()) for clave, vector in pares],
+            )
+            self._conexion.commit()
+
+    def embed_documents(self, texts):
+        hashes = [hash_texto(texto) for texto in texts]
+        vectores = self._buscar(set(hashes))
+
+        # Textos únicos que faltan: los fragmentos repetidos se embeben una sola vez.
+        pendientes = {}
+        for clave, texto in zip(hashes, texts):
+            if clave in vectores:
+                self.aciertos += 1
+            elif clave in pendientes:
+                # No es un acierto: el vector tampoco estaba en SQLite.
+                self.repetidos += 1
+            else:
+                pendientes[clave] = texto
+        self.fallos += len(pendientes)
+
+        claves_pendientes = list(pendientes)
+        for inicio in range(0, len(claves_pendientes), self.tamano_lote):
+            lote = claves_pendientes[inicio:inicio + self.tamano_lote]
+            nuevos = self.embeddings_base.embed_documents([pendientes[clave] for clave in lote])
+            self._guardar(zip(lote, nuevos))
+            vectores.update(zip(lote, nuevos))
+
+        return [list(vectores[clave]) for clave in hashes]
+
+    def embed_query(self, text):
+        return self.embeddings_base.embed_query(text)
+
+    def reporte(self):
+        """
+        Imprime cuántos fragmentos se sirvieron desde la caché y cuántos se calcularon.
+        """
+        total = self.aciertos + self.fallos + self.repetidos
+        porcentaje = 100 * self.aciertos / total if total else 0.0
+        print(
+            f"Caché de embeddings ({self.modelo}): {self.aciertos} aciertos, "
+            f"{self.fallos} calculados con Ollama, {self.repetidos} repetidos en el lote "
+            f"({porcentaje:.1f}% de aciertos)."
+        )
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
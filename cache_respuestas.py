@@ -0,0 +1,195 @@
+# --- cache_respuestas.py ---
+# Caché semántica de respuestas que envuelve la cadena RAG de los chatbots.
+
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+UMBRAL_SIMILITUD = 0.95            # Similitud coseno mínima para reutilizar una respuesta
+MAX_ENTRADAS = 256                 # Preguntas guardadas antes de desalojar la menos usada (LRU)
+TTL_SEGUNDOS = 7 * 24 * 60 * 60    # Una respuesta caduca a la semana
+SUFIJOS_IGNORADOS = ("-wal", "-shm", "-journal")
+ARCHIVOS_INGESTA = ("indice_lexico.json", "manifiesto.json")   # Los reescribe cada ingesta
+
+def normalizar_pregunta(pregunta):
+    """
+    Pasa la pregunta a minúsculas, quita acentos y signos de puntuación y
+    colapsa los espacios, para que variaciones triviales compartan entrada.
+    """
+    texto = unicodedata.normalize("NFKD", pregunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+def huella_coleccion(chroma_path):
+    """
+    Calcula una huella de la carpeta de Chroma que cambia cuando se reindexa la
+    colección. Chroma actualiza la fecha de sus archivos con solo consultarlos y
+    su tamaño crece por páginas, así que se usa la fecha de los archivos que los
+    scripts de ingesta reescriben siempre (índice léxico y manifiesto). Solo si
+    no existe ninguno se recurre al tamaño de los archivos de Chroma.
+    """
+    huella = []
+    for nombre in ARCHIVOS_INGESTA:
+        ruta = os.path.join(chroma_path, nombre)
+        if os.path.exists(ruta):
+            huella.append((nombre, os.stat(ruta).st_mtime_ns))
+    if huella:
+        return tuple(huella)
+    for raiz, _, archivos in os.walk(chroma_path):
+        for nombre in archivos:
+            if nombre.endswith(SUFIJOS_IGNORADOS):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            huella.append((os.path.relpath(ruta, chroma_path), os.stat(ruta).st_size))
+    return tuple(sorted(huella))
+
+class CacheSemanticoRespuestas:
+    """
+    Envuelve una cadena RAG y reutiliza la respuesta de una pregunta anterior
+    cuando la nueva pregunta es casi idéntica (similitud coseno de sus
+    embeddings por encima de 'umbral'). Expone 'invoke' y 'stream' igual que
+    la cadena original, de modo que puede usarse en su lugar.
+    'atajo_lexico(pregunta)' indica si el retriever resolverá la pregunta sin
+    embedding; en ese caso la caché solo busca la pregunta normalizada exacta
+    y tampoco calcula el embedding.
+    """
+
+    def __init__(self, rag_chain, embeddings, chroma_path, umbral=UMBRAL_SIMILITUD,
+                 max_entradas=MAX_ENTRADAS, ttl_segundos=TTL_SEGUNDOS, atajo_lexico=None):
+        self.rag_chain = rag_chain
+        self.embeddings = embeddings
+        self.chroma_path = chroma_path
+        self.atajo_lexico = atajo_lexico
+        self.umbral = umbral
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        # pregunta normalizada -> (vector normalizado o None, respuesta, instante de creación)
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._huella = huella_coleccion(chroma_path)
+
+    # --- Gestión de la caché ---
+
+    def _verificar_coleccion(self):
+        """
+        Vacía la caché si la colección de Chroma cambió desde la última consulta.
+        """
+        huella = huella_coleccion(self.chroma_path)
+        if huella != self._huella:
+            self._entradas.clear()
+            self._huella = huella
+            self.invalidaciones += 1
+
+    def _purgar_caducadas(self, ahora):
+        caducadas = [clave for clave, (_, _, creada) in self._entradas.items()
+                     if ahora - creada > self.ttl_segundos]
+        for clave in caducadas:
+            del self._entradas[clave]
+
+    def _vectorizar(self, clave):
+        vector = np.asarray(self.embeddings.embed_query(clave), dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+
+    def buscar(self, pregunta):
+        """
+        Devuelve (respuesta, clave, vector). 'respuesta' es None si no hay
+        ninguna pregunta guardada lo bastante parecida.
+        """
+        clave = normalizar_pregunta(pregunta)
+        with self._lock:
+            self._verificar_coleccion()
+            self._purgar_caducadas(time.time())
+            # Atajo: la misma pregunta normalizada no necesita embedding.
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave][1], clave, None
+            candidatas = [(c, entrada) for c, entrada in self._entradas.items() if entrada[0] is not None]
+
+        if self.atajo_lexico is not None and self.atajo_lexico(pregunta):
+            # El retriever no calculará el embedding; la caché tampoco.
+            with self._lock:
+                self.fallos += 1
+            return None, clave, None
+
+        vector = self._vectorizar(clave)
+        if candidatas:
+            matriz = np.stack([entrada[0] for _, entrada in candidatas])
+            similitudes = matriz @ vector
+            mejor = int(np.argmax(similitudes))
+            if similitudes[mejor] >= self.umbral:
+                clave_similar, (_, respuesta, _) = candidatas[mejor]
+                with self._lock:
+                    if clave_similar in self._entradas:
+                        self._entradas.move_to_end(clave_similar)
+                    self.aciertos += 1
+                return respuesta, clave, vector
+
+        with self._lock:
+            self.fallos += 1
+        return None, clave, vector
+
+    def guardar(self, clave, vector, respuesta):
+        # Sin vector (atajo léxico), la entrada solo sirve para la pregunta exacta.
+        with self._lock:
+            self._entradas[clave] = (vector, respuesta, time.time())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    # --- Interfaz compatible con la cadena RAG ---
+
+    def invoke(self, pregunta):
+        respuesta, clave, vector = self.buscar(pregunta)
+        if respuesta is not None:
+            return respuesta
+        respuesta = self.rag_chain.invoke(pregunta)
+        self.guardar(clave, vector, respuesta)
+        return respuesta
+
+    def stream(self, pregunta):
+        respuesta, clave, vector = self.buscar(pregunta)
+        if respuesta is not None:
+            yield respuesta
+            return
+        partes = []
+        for parte in self.rag_chain.stream(pregunta):
+            partes.append(parte)
+            yield parte
+        # Solo se guarda si la generación terminó (no si se canceló a medias).
+        self.guardar(clave, vector, "".join(partes))
+
+    # --- Estadísticas ---
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "entradas": len(self._entradas),
+            "invalidaciones": self.invalidaciones,
+        }
+
+    def reporte(self):
+        stats = self.estadisticas()
+        print(
+            f"Caché de respuestas: {stats['aciertos']} aciertos, {stats['fallos']} fallos "
+            f"({100 * stats['tasa_aciertos']:.1f}% de aciertos), {stats['entradas']} preguntas guardadas, "
+            f"{stats['invalidaciones']} invalidaciones por cambios en '{self.chroma_path}'."
+        )
@@ -0,0 +1,87 @@
+import os
+import sys
+
+from arranque import ArranqueEnSegundoPlano
+from web_scraper_chatbot import ensamblar_cadena, transmitir_respuesta, mostrar_metricas
+
+# Chatbot que responde con los PDFs y con las páginas web a la vez: la pregunta
+# se vectoriza una sola vez y se busca en ambas colecciones en paralelo.
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+CHROMA_PATH_PDF = "chroma_db_pdf"
+CHROMA_PATH_WEB = "chroma_db_web"
+MODELO_OLLAMA = "phi3:mini"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+MODELO_EMBEDDING = "nomic-embed-text"   # Debe ser el mismo con el que se indexaron ambas colecciones
+BACKEND_VECTORIAL = os.environ.get("RAG_BACKEND_VECTORIAL", "chroma")   # "chroma" o "numpy"
+
+# --- FUNCIÓN DE CONFIGURACIÓN DE LA CADENA RAG ---
+def get_rag_chain(embeddings=None):
+    """
+    Configura la cadena RAG sobre las dos colecciones. Lanza ValueError si
+    alguna se indexó con un modelo de embeddings distinto de MODELO_EMBEDDING.
+    'embeddings' permite usar otro modelo ya configurado (p. ej. el de 'respuestas_lote.py').
+    """
+    from langchain_ollama import OllamaEmbeddings
+    from indice_numpy import abrir_vectorstore
+    from recuperacion_unificada import crear_retriever_unificado
+    from trazas import EmbeddingsTrazados, instrumentar_cadena
+
+    embeddings = embeddings or EmbeddingsTrazados(OllamaEmbeddings(model=MODELO_EMBEDDING, base_url=OLLAMA_BASE_URL))
+    colecciones = {
+        nombre: (abrir_vectorstore(ruta, embeddings, BACKEND_VECTORIAL, MODELO_EMBEDDING), ruta)
+        for nombre, ruta in (("pdf", CHROMA_PATH_PDF), ("web", CHROMA_PATH_WEB))
+    }
+    # Si una pregunta coincide claramente con el índice léxico de una sola
+    # colección, solo se busca en ella.
+    retriever = crear_retriever_unificado(colecciones, embeddings, MODELO_EMBEDDING, k=4)
+
+    return instrumentar_cadena(ensamblar_cadena(retriever), "chatbot_unificado")
+
+# --- FUNCIÓN PRINCIPAL ---
+def main():
+    """
+    Función principal que inicia el chatbot interactivo.
+    """
+    print("🤖 Iniciando chatbot con PDFs e información web...")
+
+    arranque = ArranqueEnSegundoPlano(
+        get_rag_chain, OLLAMA_BASE_URL, MODELO_OLLAMA, MODELO_EMBEDDING, CHROMA_PATH_WEB
+    ).iniciar()
+    print("\n✅ Chatbot listo. Pregúntame sobre los trámites de la UV. Escribe 'salir' para terminar.")
+    print("-" * 70)
+    rag_chain = None
+
+    while True:
+        pregunta = input("Tú: ")
+
+        if pregunta.lower() == 'salir':
+            print("\n🤖 ¡Hasta luego! Ha sido un placer ayudarte.")
+            break
+
+        if rag_chain is None:
+            try:
+                if not arranque.listo():
+                    print("Chatbot: Terminando de cargar los modelos...")
+                rag_chain = arranque.esperar()
+                arranque.reporte()
+            except Exception as e:
+                print("\n❌ ERROR CRÍTICO AL INICIAR EL CHATBOT ❌")
+                print(f"No se pudo cargar la cadena de procesamiento de lenguaje. El error fue:\n")
+                print(f"   ➡️  {e}\n")
+                print("POSIBLES CAUSAS:")
+                print(f"   1. Las carpetas '{CHROMA_PATH_PDF}' o '{CHROMA_PATH_WEB}' no existen o están corruptas.")
+                print("      Ejecuta primero 'pdf_vectordb.py' y 'web_scraper_vectordb.py'.")
+                print(f"   2. Alguna colección se indexó con un modelo distinto de '{MODELO_EMBEDDING}'.")
+                print(f"   3. El modelo de Ollama ('{MODELO_OLLAMA}' o '{MODELO_EMBEDDING}') no está disponible.")
+                sys.exit(1)
+
+        try:
+            metricas = transmitir_respuesta(rag_chain, pregunta)
+            mostrar_metricas(metricas)
+        except Exception as e:
+            print(f"\nLo siento, ocurrió un error al procesar tu pregunta.")
+            print(f"Detalle del error: {e}")
+
+if __name__ == "__main__":
+    main()
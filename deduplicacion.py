@@ -0,0 +1,199 @@
+# --- deduplicacion.py ---
+# Detección de fragmentos casi duplicados con MinHash y ensamblado del
+# contexto que se envía al modelo (fusión de fragmentos solapados y
+# presupuesto de tokens).
+
+import re
+import zlib
+
+import numpy as np
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+TAMANO_SHINGLE = 4            # Palabras por shingle
+NUM_PERMUTACIONES = 64        # Longitud de la firma MinHash
+BANDAS_LSH = 16               # 16 bandas de 4 filas: casi todo par con Jaccard >= 0.8 es candidato
+UMBRAL_JACCARD = 0.8          # Similitud estimada a partir de la cual dos fragmentos son duplicados
+SEMILLA = 1234
+PRIMO = (1 << 31) - 1         # Primo de Mersenne; a*x cabe en uint64 sin desbordarse
+MIN_SOLAPAMIENTO = 50         # Caracteres mínimos para unir dos fragmentos sin 'start_index'
+MAX_SOLAPAMIENTO = 400
+MAX_TOKENS_CONTEXTO = 1500    # Presupuesto de tokens del contexto en el prompt
+
+_rng = np.random.default_rng(SEMILLA)
+_A = _rng.integers(1, PRIMO, size=NUM_PERMUTACIONES, dtype=np.uint64)
+_B = _rng.integers(0, PRIMO, size=NUM_PERMUTACIONES, dtype=np.uint64)
+
+def contar_tokens(texto):
+    """
+    Estimación barata del número de tokens (aprox. 4 caracteres por token).
+    """
+    return max(1, len(texto) // 4)
+
+# --- MINHASH ---
+
+def firma_minhash(texto):
+    """
+    Calcula la firma MinHash de los shingles de palabras del texto, en una
+    sola pasada vectorizada con NumPy.
+    """
+    palabras = re.findall(r"\w+", texto.lower())
+    if len(palabras) < TAMANO_SHINGLE:
+        shingles = {" ".join(palabras)}
+    else:
+        shingles = {
+            " ".join(palabras[i:i + TAMANO_SHINGLE])
+            for i in range(len(palabras) - TAMANO_SHINGLE + 1)
+        }
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) % PRIMO for s in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % PRIMO).min(axis=1)
+
+class IndiceMinHash:
+    """
+    Índice LSH de firmas MinHash. Permite preguntar si un texto es casi
+    duplicado de alguno ya agregado sin compararlo contra todos.
+    """
+
+    def __init__(self, umbral=UMBRAL_JACCARD, bandas=BANDAS_LSH):
+        self.umbral = umbral
+        self.bandas = bandas
+        self.filas = NUM_PERMUTACIONES // bandas
+        self.firmas = []
+        self.fuentes = []         # Fuente de cada texto agregado (o None)
+        self.cubetas = [dict() for _ in range(bandas)]
+
+    def _claves_banda(self, firma):
+        return [
+            firma[i * self.filas:(i + 1) * self.filas].tobytes() for i in range(self.bandas)
+        ]
+
+    def buscar_duplicado(self, firma):
+        """
+        Devuelve la posición de un texto casi idéntico ya agregado, o None.
+        """
+        candidatos = set()
+        for banda, clave in enumerate(self._claves_banda(firma)):
+            candidatos.update(self.cubetas[banda].get(clave, ()))
+        for candidato in sorted(candidatos):
+            if np.mean(self.firmas[candidato] == firma) >= self.umbral:
+                return candidato
+        return None
+
+    def agregar(self, firma, fuente=None):
+        posicion = len(self.firmas)
+        self.firmas.append(firma)
+        self.fuentes.append(fuente)
+        for banda, clave in enumerate(self._claves_banda(firma)):
+            self.cubetas[banda].setdefault(clave, []).append(posicion)
+        return posicion
+
+    def agregar_si_es_nuevo(self, texto, fuente=None):
+        """
+        Agrega el texto y devuelve True, o devuelve False si es un casi duplicado.
+        """
+        firma = firma_minhash(texto)
+        if self.buscar_duplicado(firma) is not None:
+            return False
+        self.agregar(firma, fuente)
+        return True
+
+def eliminar_duplicados(fragmentos, indice=None, conservados_en=None):
+    """
+    Quita los fragmentos casi duplicados (conserva la primera aparición).
+    Si se pasa un 'indice' ya poblado, también se descartan los fragmentos
+    parecidos a los que contiene. Con 'conservados_en' (un set), se agregan
+    las otras fuentes donde quedó la copia de cada fragmento descartado.
+    """
+    indice = indice if indice is not None else IndiceMinHash()
+    unicos = []
+    for fragmento in fragmentos:
+        fuente = fragmento.metadata.get("source")
+        firma = firma_minhash(fragmento.page_content)
+        duplicado = indice.buscar_duplicado(firma)
+        if duplicado is None:
+            indice.agregar(firma, fuente)
+            unicos.append(fragmento)
+        elif conservados_en is not None and indice.fuentes[duplicado] not in (None, fuente):
+            conservados_en.add(indice.fuentes[duplicado])
+    descartados = len(fragmentos) - len(unicos)
+    if descartados:
+        print(f"Se descartaron {descartados} fragmentos casi duplicados.")
+    return unicos
+
+# --- ENSAMBLADO DEL CONTEXTO ---
+
+def _solapamiento_textual(anterior, siguiente):
+    """
+    Longitud del sufijo de 'anterior' que coincide con el inicio de 'siguiente'.
+    """
+    limite = min(MAX_SOLAPAMIENTO, len(anterior), len(siguiente))
+    for longitud in range(limite, MIN_SOLAPAMIENTO - 1, -1):
+        if anterior.endswith(siguiente[:longitud]):
+            return longitud
+    return 0
+
+def fusionar_adyacentes(documentos):
+    """
+    Une los fragmentos de una misma fuente (y página) que se solapan o son
+    contiguos. Usa 'start_index' cuando existe y, si no, busca el texto común.
+    Devuelve bloques (rango, fuente, texto) con el mejor rango de sus fragmentos.
+    """
+    grupos = {}
+    for rango, documento in enumerate(documentos):
+        clave = (documento.metadata.get("source", ""), documento.metadata.get("page"))
+        grupos.setdefault(clave, []).append((rango, documento))
+
+    bloques = []
+    for (fuente, _), lista in grupos.items():
+        con_indice = all("start_index" in d.metadata for _, d in lista)
+        if con_indice:
+            lista.sort(key=lambda item: item[1].metadata["start_index"])
+
+        actual = None
+        for rango, documento in lista:
+            texto = documento.page_content
+            inicio = documento.metadata.get("start_index")
+            if actual is not None and con_indice and inicio <= actual["fin"]:
+                fin = inicio + len(texto)
+                if fin > actual["fin"]:
+                    actual["texto"] += texto[actual["fin"] - inicio:]
+                    actual["fin"] = fin
+                actual["rango"] = min(actual["rango"], rango)
+                continue
+            if actual is not None and not con_indice:
+                solapamiento = _solapamiento_textual(actual["texto"], texto)
+                if solapamiento:
+                    actual["texto"] += texto[solapamiento:]
+                    actual["rango"] = min(actual["rango"], rango)
+                    continue
+            if actual is not None:
+                bloques.append((actual["rango"], fuente, actual["texto"]))
+            actual = {"rango": rango, "texto": texto,
+                      "fin": (inicio or 0) + len(texto)}
+        if actual is not None:
+            bloques.append((actual["rango"], fuente, actual["texto"]))
+
+    return sorted(bloques)
+
+def ensamblar_contexto(documentos, max_tokens=MAX_TOKENS_CONTEXTO):
+    """
+    Convierte los documentos recuperados en el texto del CONTEXTO: fusiona
+    los fragmentos solapados, descarta los casi duplicados y respeta el
+    presupuesto de tokens (el último bloque se recorta si no cabe entero).
+    """
+    indice = IndiceMinHash()
+    partes = []
+    tokens_usados = 0
+    for _, fuente, texto in fusionar_adyacentes(documentos):
+        if not indice.agregar_si_es_nuevo(texto):
+            continue
+        bloque = f"Fuente: {fuente}\n{texto}"
+        disponibles = max_tokens - tokens_usados
+        if disponibles <= 0:
+            break
+        if contar_tokens(bloque) > disponibles:
+            bloque = bloque[:disponibles * 4]
+        partes.append(bloque)
+        tokens_usados += contar_tokens(bloque)
+    return "\n\n".join(partes)
@@ -0,0 +1,285 @@
+# --- division_estructurada.py ---
+# División de documentos que respeta su estructura en lugar de cortar cada
+# 1000 caracteres. Las páginas web se limpian conservando encabezados y listas
+# como texto tipo Markdown ("## Requisitos", "- Acta de nacimiento"); en los
+# PDFs se detectan los títulos de sección por su forma. Cada sección se guarda
+# entera si cabe en el presupuesto de tokens, las secciones pequeñas contiguas
+# se agrupan, no hay solapamiento y cada fragmento empieza con la ruta de
+# secciones ("Baja definitiva > Requisitos"), que también va en el metadato
+# 'seccion'. Resultado: menos fragmentos, cada uno comprensible por sí solo.
+#
+# Los scripts de ingesta usan este divisor por defecto; el anterior sigue
+# disponible para comparar:
+#   RAG_DIVISOR=caracteres python web_scraper_vectordb.py
+
+import re
+
+from bs4 import Comment, NavigableString
+from langchain_core.documents import Document
+
+from deduplicacion import contar_tokens
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+MAX_TOKENS_FRAGMENTO = 256        # Igual que los 1000 caracteres del divisor anterior
+SEPARADOR_RUTA = " > "
+MAX_CARACTERES_TITULO = 80        # Una línea más larga no se toma como título en un PDF
+MAX_PALABRAS_TITULO = 10
+DIVISORES = ("estructurado", "caracteres")
+
+# --- HTML A TEXTO ESTRUCTURADO ---
+
+NIVELES_ENCABEZADO = {f"h{n}": n for n in range(1, 7)}
+ETIQUETAS_BLOQUE = {
+    "p", "div", "section", "article", "main", "table", "thead", "tbody", "tfoot",
+    "blockquote", "pre", "dl", "dt", "dd", "figure", "figcaption", "form", "fieldset",
+    "center", "address", "details", "summary",
+}
+ETIQUETAS_RESALTADO = {"strong", "b"}
+NIVEL_RESALTADO = 6               # Un párrafo que solo contiene negritas se toma como subtítulo
+
+def _normalizar_espacios(texto):
+    return " ".join(texto.split())
+
+def _es_titulo_resaltado(nodo):
+    """
+    Párrafos como <p><strong>Requisitos</strong></p>, que muchas páginas usan
+    en lugar de un <h3>.
+    """
+    hijos = [h for h in nodo.children if not (isinstance(h, NavigableString) and not h.strip())]
+    if len(hijos) != 1 or getattr(hijos[0], "name", None) not in ETIQUETAS_RESALTADO:
+        return False
+    texto = _normalizar_espacios(hijos[0].get_text(" "))
+    return 0 < len(texto) <= MAX_CARACTERES_TITULO
+
+def _agregar_item(item, lineas, profundidad, marcador="-"):
+    sangria = "  " * profundidad
+    propias = []
+    _recorrer_html(item, propias, profundidad + 1)
+    primera = True
+    for linea in propias:
+        if linea.startswith(" "):
+            # Elemento de una lista anidada: ya trae su sangría.
+            lineas.append(linea)
+        elif primera:
+            lineas.append(f"{sangria}{marcador} {linea}")
+            primera = False
+        else:
+            lineas.append(f"{sangria}{' ' * (len(marcador) + 1)}{linea}")
+
+def _recorrer_html(nodo, lineas, profundidad=0):
+    en_linea = []
+
+    def cerrar_linea():
+        texto = _normalizar_espacios(" ".join(en_linea))
+        if texto:
+            lineas.append(texto)
+        en_linea.clear()
+
+    for hijo in nodo.children:
+        if isinstance(hijo, Comment):
+            continue
+        if isinstance(hijo, NavigableString):
+            en_linea.append(str(hijo))
+            continue
+        nombre = hijo.name
+        if nombre in NIVELES_ENCABEZADO:
+            cerrar_linea()
+            texto = _normalizar_espacios(hijo.get_text(" "))
+            if texto:
+                lineas.append("#" * NIVELES_ENCABEZADO[nombre] + " " + texto)
+        elif nombre in ("ul", "ol"):
+            cerrar_linea()
+            for numero, item in enumerate(hijo.find_all("li", recursive=False), start=1):
+                _agregar_item(item, lineas, profundidad, f"{numero}." if nombre == "ol" else "-")
+        elif nombre == "li":
+            cerrar_linea()
+            _agregar_item(hijo, lineas, profundidad)
+        elif nombre == "tr":
+            cerrar_linea()
+            celdas = [_normalizar_espacios(c.get_text(" ")) for c in hijo.find_all(["td", "th"], recursive=False)]
+            fila = " | ".join(c for c in celdas if c)
+            if fila:
+                lineas.append(fila)
+        elif nombre == "br":
+            cerrar_linea()
+        elif nombre in ETIQUETAS_BLOQUE:
+            cerrar_linea()
+            if _es_titulo_resaltado(hijo):
+                lineas.append("#" * NIVEL_RESALTADO + " " + _normalizar_espacios(hijo.get_text(" ")))
+            else:
+                _recorrer_html(hijo, lineas, profundidad)
+        else:
+            en_linea.append(hijo.get_text(" "))
+    cerrar_linea()
+
+def texto_estructurado_html(soup):
+    """
+    Convierte el HTML (ya sin menús ni scripts) en líneas de texto que
+    conservan la jerarquía: '#'... para los encabezados, '- ' o '1. ' con
+    sangría para los elementos de lista y ' | ' entre las celdas de una tabla.
+    """
+    lineas = []
+    _recorrer_html(soup.body or soup, lineas)
+    return "\n".join(lineas)
+
+# --- TÍTULOS DE SECCIÓN EN TEXTO PLANO (PDF) ---
+
+_TITULO_MARKDOWN = re.compile(r"^(#{1,6})\s+(.*\S)")
+_TITULO_NUMERADO = re.compile(r"^(\d+(?:\.\d+)+)\.?\s+(\S.*)$")          # "2.1 Requisitos"
+_TITULO_CAPITULO = re.compile(r"^(CAP[IÍ]TULO|T[IÍ]TULO|SECCI[OÓ]N|ANEXO)\b", re.IGNORECASE)
+
+def nivel_titulo_pdf(linea):
+    """
+    Devuelve el nivel (1-6) si la línea parece un título de sección de un
+    PDF, o None. Se reconocen títulos numerados de varios niveles, capítulos,
+    líneas en mayúsculas y etiquetas cortas que terminan en dos puntos.
+    """
+    if len(linea) > MAX_CARACTERES_TITULO or len(linea.split()) > MAX_PALABRAS_TITULO:
+        return None
+    if linea.endswith((".", ",", ";")):
+        return None
+    numerado = _TITULO_NUMERADO.match(linea)
+    if numerado:
+        return min(6, numerado.group(1).count(".") + 1)
+    if _TITULO_CAPITULO.match(linea):
+        return 1
+    letras = [c for c in linea if c.isalpha()]
+    if len(letras) >= 4 and all(c.isupper() for c in letras):
+        return 2
+    if linea.endswith(":") and linea[0].isupper() and len(linea.split()) <= 6:
+        return 3
+    return None
+
+# --- DIVISIÓN ---
+
+def _partir_linea(linea, presupuesto):
+    """
+    Parte una línea que no cabe sola: por oraciones y, si aún no cabe, por palabras.
+    """
+    piezas, actual = [], ""
+    for unidad in re.split(r"(?<=[.;:])\s+", linea):
+        palabras = [unidad] if contar_tokens(unidad) <= presupuesto else unidad.split()
+        for palabra in palabras:
+            candidata = f"{actual} {palabra}" if actual else palabra
+            if actual and contar_tokens(candidata) > presupuesto:
+                piezas.append(actual)
+                candidata = palabra
+            actual = candidata
+    if actual:
+        piezas.append(actual)
+    return piezas
+
+def _agrupar_lineas(lineas, presupuesto):
+    """
+    Agrupa líneas completas en bloques de como máximo 'presupuesto' tokens.
+    """
+    grupos, actual = [], []
+    for linea in lineas:
+        for pieza in (_partir_linea(linea, presupuesto) if contar_tokens(linea) > presupuesto else [linea]):
+            if actual and contar_tokens("\n".join(actual + [pieza])) > presupuesto:
+                grupos.append(actual)
+                actual = []
+            actual.append(pieza)
+    if actual:
+        grupos.append(actual)
+    return grupos
+
+def _prefijo_comun(ruta, otra):
+    comun = 0
+    while comun < min(len(ruta), len(otra)) and ruta[comun] == otra[comun]:
+        comun += 1
+    return comun
+
+def _titulo_ruta(ruta):
+    return "#" * len(ruta) + " " + SEPARADOR_RUTA.join(ruta) if ruta else ""
+
+class DivisorEstructurado:
+    """
+    Divide documentos por secciones con un presupuesto en tokens. Con
+    'detectar_titulos' (PDFs y .txt) los títulos se reconocen por su forma;
+    si no, solo las líneas '#' que produce 'texto_estructurado_html'.
+    Tiene el mismo método 'split_documents' que los divisores de LangChain.
+    """
+
+    def __init__(self, max_tokens=MAX_TOKENS_FRAGMENTO, detectar_titulos=False):
+        self.max_tokens = max_tokens
+        self.detectar_titulos = detectar_titulos
+
+    def secciones(self, texto):
+        """
+        Devuelve las secciones del texto como (ruta de títulos, líneas).
+        """
+        ruta, secciones, actual = [], [], None
+        for linea in texto.splitlines():
+            linea = linea.rstrip()
+            if not linea.strip():
+                continue
+            titulo = _TITULO_MARKDOWN.match(linea)
+            nivel, texto_titulo = (len(titulo.group(1)), titulo.group(2)) if titulo else (None, None)
+            if nivel is None and self.detectar_titulos:
+                nivel, texto_titulo = nivel_titulo_pdf(linea.strip()), linea.strip()
+            if nivel is not None:
+                # Un título cierra las secciones de su nivel o inferior.
+                ruta = [(n, t) for n, t in ruta if n < nivel] + [(nivel, texto_titulo)]
+                actual = None
+                continue
+            if actual is None:
+                actual = (tuple(t for _, t in ruta), [])
+                secciones.append(actual)
+            actual[1].append(linea)
+        return secciones
+
+    def dividir(self, documento):
+        """
+        Fragmentos de un documento (una página, en el caso de los PDFs). Los
+        fragmentos no cruzan de página: así las páginas copiadas en
+        compilaciones como 'documento_unido.pdf' siguen siendo duplicados.
+        """
+        fragmentos = []
+        actual = None   # {"ruta": ..., "lineas": [...]}
+
+        def cerrar():
+            if actual:
+                texto = "\n".join(actual["lineas"])
+                metadata = {**documento.metadata, "seccion": SEPARADOR_RUTA.join(actual["ruta"]),
+                            "tokens": contar_tokens(texto)}
+                fragmentos.append(Document(page_content=texto, metadata=metadata))
+
+        for ruta, lineas in self.secciones(documento.page_content):
+            encabezado = _titulo_ruta(ruta)
+            presupuesto = self.max_tokens - (contar_tokens(encabezado) if encabezado else 0)
+            for numero, grupo in enumerate(_agrupar_lineas(lineas, max(presupuesto, 1))):
+                # Una sección que cabe entera se agrega al fragmento anterior,
+                # precedida por la parte de su ruta que no comparte con él.
+                if numero == 0 and actual:
+                    comun = _prefijo_comun(ruta, actual["ruta"])
+                    titulo = ["#" * len(ruta) + " " + SEPARADOR_RUTA.join(ruta[comun:])] if ruta[comun:] else []
+                    candidato = actual["lineas"] + titulo + grupo
+                    if contar_tokens("\n".join(candidato)) <= self.max_tokens:
+                        actual["lineas"] = candidato
+                        actual["ruta"] = ruta[:comun]
+                        continue
+                cerrar()
+                actual = {"ruta": ruta, "lineas": ([encabezado] if encabezado else []) + grupo}
+        cerrar()
+        return fragmentos
+
+    def split_documents(self, documentos):
+        return [fragmento for documento in documentos for fragmento in self.dividir(documento)]
+
+def crear_divisor(tipo="estructurado", detectar_titulos=False):
+    """
+    Devuelve el divisor 'estructurado' o el anterior por 'caracteres'
+    (RecursiveCharacterTextSplitter de 1000 caracteres con 200 de solapamiento).
+    """
+    if tipo == "estructurado":
+        return DivisorEstructurado(detectar_titulos=detectar_titulos)
+    if tipo != "caracteres":
+        raise ValueError(f"Divisor desconocido: '{tipo}' (usa uno de {DIVISORES}).")
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        add_start_index=True
+    )
@@ -0,0 +1,306 @@
+# --- indice_lexico.py ---
+# Índice invertido BM25 guardado junto a cada colección de Chroma, y un
+# retriever híbrido que fusiona resultados léxicos y vectoriales.
+#
+# Para crear el índice de una colección que ya existe:
+#   python indice_lexico.py chroma_db_web
+
+import os
+import re
+import sys
+import json
+import math
+import hashlib
+import unicodedata
+from collections import Counter
+from typing import Any, List
+from urllib.parse import urlparse
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from reordenamiento_mmr import (
+    K_CANDIDATOS_MMR, RetrieverMMR, candidatos_con_vectores, diversificar, vectores_por_id,
+)
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+NOMBRE_INDICE = "indice_lexico.json"
+K1 = 1.5                      # Saturación de la frecuencia de término en BM25
+B = 0.75                      # Normalización por longitud en BM25
+PESO_TITULO = 3               # Las palabras del nombre del trámite cuentan triple
+K_RRF = 60                    # Constante de la fusión por rango recíproco
+K_CANDIDATOS = 10             # Candidatos de cada buscador antes de fusionar
+MAX_TERMINOS_ATAJO = 4        # Solo las consultas cortas pueden saltarse el embedding
+
+STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuales", "cuando", "cuanto", "de", "del",
+    "donde", "el", "en", "es", "esta", "este", "hay", "la", "las", "lo", "los", "me", "mi",
+    "mis", "para", "pero", "por", "puedo", "que", "quien", "se", "si", "sin", "sobre",
+    "su", "sus", "tengo", "un", "una", "uno", "y", "yo", "o", "u", "le", "les", "hacer",
+    "debo", "necesito", "quiero", "son", "ser", "tramite", "tramites", "informacion",
+}
+
+SUFIJOS = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "iciones", "idades",
+    "acion", "icion", "mente", "idad", "ables", "ibles", "able", "ible", "istas",
+    "ista", "osos", "osas", "ivos", "ivas", "oso", "osa", "ivo", "iva", "es", "s",
+    "a", "o", "e",
+)
+
+# --- NORMALIZACIÓN ---
+
+def plegar_acentos(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def raiz(palabra):
+    """
+    Stemmer ligero para español: quita el primer sufijo de la lista que deje
+    una raíz de al menos 4 letras.
+    """
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 4:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+def analizar(texto):
+    """
+    Convierte un texto en la lista de términos del índice: sin acentos,
+    sin palabras vacías y reducido a raíces.
+    """
+    palabras = re.findall(r"[a-z0-9ñ]+", plegar_acentos(texto))
+    return [raiz(p) for p in palabras if p not in STOPWORDS and len(p) > 1]
+
+def titulo_de_fuente(fuente):
+    """
+    Obtiene el nombre del trámite a partir del metadato 'source': el nombre
+    del PDF sin extensión o el último segmento de la URL.
+    """
+    if fuente.startswith(("http://", "https://")):
+        segmentos = [s for s in urlparse(fuente).path.split("/") if s]
+        nombre = segmentos[-1] if segmentos else urlparse(fuente).netloc
+    else:
+        nombre = os.path.basename(fuente)
+    return re.sub(r"[-_]+", " ", os.path.splitext(nombre)[0])
+
+def clave_documento(documento):
+    """
+    Identifica un fragmento por su fuente y contenido, para poder fusionar
+    resultados que llegan de Chroma sin ID.
+    """
+    texto = documento.metadata.get("source", "") + "\0" + documento.page_content
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+# --- ÍNDICE BM25 ---
+
+class IndiceBM25:
+    """
+    Índice invertido en memoria con puntuación BM25, serializable a JSON.
+    """
+
+    def __init__(self, textos, metadatos, postings, longitudes, titulos, ids=None):
+        self.textos = textos
+        self.metadatos = metadatos
+        # IDs de Chroma de cada fragmento; los índices creados antes no los guardan.
+        self.ids = ids
+        self.postings = postings
+        self.longitudes = longitudes
+        self.titulos = titulos
+        self.longitud_media = sum(longitudes) / len(longitudes) if longitudes else 0.0
+
+    @classmethod
+    def construir(cls, textos, metadatos, ids=None):
+        postings = {}
+        longitudes = []
+        titulos = []
+        for indice, (texto, metadato) in enumerate(zip(textos, metadatos)):
+            titulo = analizar(titulo_de_fuente(metadato.get("source", "")))
+            terminos = analizar(texto) + titulo * PESO_TITULO
+            for termino, frecuencia in Counter(terminos).items():
+                postings.setdefault(termino, []).append([indice, frecuencia])
+            longitudes.append(len(terminos))
+            titulos.append(sorted(set(titulo)))
+        return cls(list(textos), list(metadatos), postings, longitudes, titulos,
+                   list(ids) if ids is not None else None)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        return cls(datos["textos"], datos["metadatos"], datos["postings"],
+                   datos["longitudes"], datos["titulos"], datos.get("ids"))
+
+    def guardar(self, ruta):
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({
+                "textos": self.textos,
+                "metadatos": self.metadatos,
+                "postings": self.postings,
+                "longitudes": self.longitudes,
+                "titulos": self.titulos,
+                "ids": self.ids,
+            }, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def buscar(self, terminos, k):
+        """
+        Devuelve [(índice del fragmento, puntuación)] de los k mejores resultados.
+        """
+        total = len(self.longitudes)
+        puntuaciones = Counter()
+        for termino in set(terminos):
+            lista = self.postings.get(termino)
+            if not lista:
+                continue
+            idf = math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+            for indice, frecuencia in lista:
+                norma = K1 * (1 - B + B * self.longitudes[indice] / self.longitud_media)
+                puntuaciones[indice] += idf * frecuencia * (K1 + 1) / (frecuencia + norma)
+        return puntuaciones.most_common(k)
+
+    def documento(self, indice):
+        return Document(page_content=self.textos[indice], metadata=dict(self.metadatos[indice]),
+                        id=self.ids[indice] if self.ids else None)
+
+def construir_indice_desde_chroma(vectorstore, chroma_path):
+    """
+    Crea el índice léxico con todos los fragmentos guardados en la colección
+    (sin calcular embeddings) y lo escribe dentro de 'chroma_path'.
+    """
+    datos = vectorstore.get(include=["documents", "metadatas"])
+    metadatos = [metadato or {} for metadato in datos["metadatas"]]
+    indice = IndiceBM25.construir(datos["documents"], metadatos, datos["ids"])
+    indice.guardar(os.path.join(chroma_path, NOMBRE_INDICE))
+    print(f"Índice léxico actualizado con {len(metadatos)} fragmentos en '{chroma_path}'.")
+    return indice
+
+# --- RETRIEVER HÍBRIDO ---
+
+class RetrieverHibrido(BaseRetriever):
+    """
+    Combina BM25 y búsqueda vectorial con fusión por rango recíproco (RRF).
+    Cuando la consulta es corta y todos sus términos aparecen en el nombre del
+    trámite del mejor resultado léxico (p. ej. "Reingreso", "Cédula Profesional"),
+    se devuelven los resultados léxicos sin calcular el embedding de la pregunta.
+    Con 'diversificar', los candidatos fusionados se reordenan con MMR y se
+    eligen hasta llenar el presupuesto de tokens, con k como máximo.
+    """
+
+    vectorstore: Any
+    indice: Any
+    k: int = 4
+    k_candidatos: int = K_CANDIDATOS
+    diversificar: bool = True
+    k_candidatos_mmr: int = K_CANDIDATOS_MMR
+
+    def es_decisivo(self, terminos, resultados):
+        if not resultados or not terminos or len(set(terminos)) > MAX_TERMINOS_ATAJO:
+            return False
+        titulo = set(self.indice.titulos[resultados[0][0]])
+        return set(terminos) <= titulo
+
+    def es_consulta_decisiva(self, query):
+        """
+        Indica si la consulta se resolverá solo con BM25, sin embedding. La
+        caché de respuestas lo consulta antes de vectorizar la pregunta.
+        """
+        terminos = analizar(query)
+        return self.es_decisivo(terminos, self.indice.buscar(terminos, 1))
+
+    def _fusionar(self, lexicos, vectoriales):
+        puntuaciones = Counter()
+        documentos = {}
+        for rango, (indice, _) in enumerate(lexicos):
+            documento = self.indice.documento(indice)
+            clave = clave_documento(documento)
+            documentos[clave] = documento
+            puntuaciones[clave] += 1 / (K_RRF + rango + 1)
+        for rango, documento in enumerate(vectoriales):
+            clave = clave_documento(documento)
+            documentos.setdefault(clave, documento)
+            puntuaciones[clave] += 1 / (K_RRF + rango + 1)
+        return documentos, puntuaciones
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        from trazas import medir_etapa
+
+        terminos = analizar(query)
+        with medir_etapa("busqueda_lexica"):
+            lexicos = self.indice.buscar(terminos, self.k_candidatos)
+
+        if self.es_decisivo(terminos, lexicos):
+            return [self.indice.documento(indice) for indice, _ in lexicos[:self.k]]
+
+        vector = self.vectorstore.embeddings.embed_query(query)
+        if not self.diversificar:
+            with medir_etapa("busqueda_vectorial"):
+                vectoriales = self.vectorstore.similarity_search_by_vector(vector, k=self.k_candidatos)
+            documentos, puntuaciones = self._fusionar(lexicos, vectoriales)
+            return [documentos[clave] for clave, _ in puntuaciones.most_common(self.k)]
+
+        with medir_etapa("busqueda_vectorial"):
+            vectoriales, _, matriz = candidatos_con_vectores(self.vectorstore, vector, self.k_candidatos_mmr)
+        documentos, puntuaciones = self._fusionar(lexicos, vectoriales)
+        claves = [clave for clave, _ in puntuaciones.most_common()]
+
+        # Los candidatos vectoriales ya traen su vector; los que solo encontró
+        # BM25 se leen de la colección por ID (sin calcular embeddings).
+        fila_vectorial = {clave_documento(d): fila for fila, d in enumerate(vectoriales)}
+        vectores = np.zeros((len(claves), len(vector)), dtype=np.float32)
+        faltantes = []
+        for posicion, clave in enumerate(claves):
+            if clave in fila_vectorial:
+                vectores[posicion] = matriz[fila_vectorial[clave]]
+            elif documentos[clave].id:
+                faltantes.append(posicion)
+        if faltantes:
+            with medir_etapa("vectores_lexicos"):
+                vectores[faltantes] = vectores_por_id(
+                    self.vectorstore, [documentos[claves[p]].id for p in faltantes], len(vector)
+                )
+
+        # Un candidato sin vector (ya no está en la colección) parecería
+        # totalmente distinto de los demás y ganaría por diversidad: se descarta.
+        con_vector = np.any(vectores != 0, axis=1)
+        claves = [clave for clave, tiene in zip(claves, con_vector) if tiene]
+        vectores = vectores[con_vector]
+        if not claves:
+            return []
+
+        # La relevancia de MMR es la puntuación RRF, escalada a [0, 1].
+        relevancias = np.array([puntuaciones[clave] for clave in claves], dtype=np.float32)
+        relevancias /= relevancias.max()
+        return diversificar([documentos[clave] for clave in claves], relevancias, vectores,
+                            max_fragmentos=self.k)
+
+def crear_retriever(vectorstore, chroma_path, k=4):
+    """
+    Devuelve el retriever híbrido si la colección tiene índice léxico; si no,
+    la búsqueda vectorial con reordenamiento MMR.
+    """
+    ruta = os.path.join(chroma_path, NOMBRE_INDICE)
+    if not os.path.exists(ruta):
+        print(f"Aviso: no existe '{ruta}'; se usará solo la búsqueda vectorial.")
+        return RetrieverMMR(vectorstore=vectorstore, k=k)
+    indice = IndiceBM25.cargar(ruta)
+    if indice.ids is None:
+        # Sin IDs no se pueden leer los vectores de los candidatos que solo
+        # encontró BM25; el índice se vuelve a crear desde la colección.
+        print(f"Aviso: '{ruta}' se creó sin IDs de fragmento; se reconstruye.")
+        indice = construir_indice_desde_chroma(vectorstore, chroma_path)
+    return RetrieverHibrido(vectorstore=vectorstore, indice=indice, k=k)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python indice_lexico.py <carpeta_chroma>")
+        sys.exit(1)
+
+    from langchain_community.vectorstores import Chroma
+
+    # Solo se leen los textos guardados; no hace falta función de embeddings.
+    construir_indice_desde_chroma(Chroma(persist_directory=sys.argv[1]), sys.argv[1])
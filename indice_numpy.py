@@ -0,0 +1,313 @@
+# --- indice_numpy.py ---
+# Índice vectorial compacto en NumPy como alternativa a Chroma para consultar.
+# La colección se exporta a una matriz float16 (o int8 con una escala por fila)
+# que se abre con memoria mapeada, más un archivo JSON con IDs, textos y
+# metadatos. Con unos pocos miles de fragmentos la búsqueda exacta por coseno
+# es más rápida que pasar por el cliente de Chroma, SQLite y el índice HNSW.
+#
+# Para exportar una colección que ya existe:
+#   python indice_numpy.py chroma_db_web [--tipo int8]
+# Para consultar con este índice en lugar de Chroma:
+#   RAG_BACKEND_VECTORIAL=numpy python web_scraper_chatbot.py
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from recuperacion_unificada import CLAVE_MODELO
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+NOMBRE_DIRECTORIO = "indice_numpy"    # Subcarpeta dentro de la carpeta de Chroma
+TIPO_POR_DEFECTO = "float16"          # "float16" o "int8"
+TIPOS_SOPORTADOS = ("float16", "int8")
+TAMANO_BLOQUE = 4096                  # Filas convertidas a float32 a la vez al puntuar
+TAMANO_LOTE_EXPORTACION = 1000        # Fragmentos leídos de Chroma por llamada
+
+# --- EXPORTACIÓN ---
+
+def ruta_indice(chroma_path):
+    return os.path.join(chroma_path, NOMBRE_DIRECTORIO)
+
+def normalizar_filas(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+def cuantizar_int8(matriz):
+    """
+    Cuantiza cada fila de forma simétrica: fila ≈ escala * enteros, con los
+    enteros en [-127, 127].
+    """
+    escalas = np.abs(matriz).max(axis=1) / 127.0
+    escalas[escalas == 0] = 1.0
+    enteros = np.clip(np.rint(matriz / escalas[:, None]), -127, 127).astype(np.int8)
+    return enteros, escalas.astype(np.float32)
+
+def exportar_desde_chroma(vectorstore, chroma_path, tipo=TIPO_POR_DEFECTO):
+    """
+    Lee todos los vectores, textos y metadatos de la colección y escribe el
+    índice NumPy en '<chroma_path>/indice_numpy'. Los vectores se guardan ya
+    normalizados, de modo que el producto punto es la similitud coseno.
+    """
+    if tipo not in TIPOS_SOPORTADOS:
+        raise ValueError(f"Tipo '{tipo}' no soportado; usa uno de {TIPOS_SOPORTADOS}.")
+
+    coleccion = vectorstore._collection
+    ids, documentos, metadatos, vectores = [], [], [], []
+    total = coleccion.count()
+    for desplazamiento in range(0, total, TAMANO_LOTE_EXPORTACION):
+        lote = coleccion.get(
+            limit=TAMANO_LOTE_EXPORTACION, offset=desplazamiento,
+            include=["embeddings", "documents", "metadatas"],
+        )
+        ids.extend(lote["ids"])
+        documentos.extend(lote["documents"])
+        metadatos.extend(metadato or {} for metadato in lote["metadatas"])
+        vectores.extend(lote["embeddings"])
+
+    if not ids:
+        raise ValueError(f"La colección de '{chroma_path}' está vacía; no hay nada que exportar.")
+    matriz = normalizar_filas(np.asarray(vectores, dtype=np.float32).reshape(len(ids), -1))
+    fuentes = sorted({metadato.get("source", "") for metadato in metadatos})
+    codigo_fuente = {fuente: codigo for codigo, fuente in enumerate(fuentes)}
+
+    # Se escribe en una carpeta temporal y se reemplaza al final, para que un
+    # chatbot que esté leyendo el índice anterior no vea archivos a medias.
+    destino = ruta_indice(chroma_path)
+    temporal = destino + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    if tipo == "int8":
+        enteros, escalas = cuantizar_int8(matriz)
+        np.save(os.path.join(temporal, "vectores.npy"), enteros)
+        np.save(os.path.join(temporal, "escalas.npy"), escalas)
+    else:
+        np.save(os.path.join(temporal, "vectores.npy"), matriz.astype(np.float16))
+    np.save(os.path.join(temporal, "fuentes.npy"),
+            np.array([codigo_fuente[m.get("source", "")] for m in metadatos], dtype=np.int32))
+    with open(os.path.join(temporal, "metadatos.json"), "w", encoding="utf-8") as archivo:
+        json.dump({
+            "tipo": tipo,
+            "dimension": int(matriz.shape[1]),
+            CLAVE_MODELO: (coleccion.metadata or {}).get(CLAVE_MODELO),
+            "fuentes": fuentes,
+            "ids": ids,
+            "documentos": documentos,
+            "metadatos": metadatos,
+        }, archivo, ensure_ascii=False)
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+
+    tamano = sum(os.path.getsize(os.path.join(destino, nombre)) for nombre in os.listdir(destino))
+    print(f"Índice NumPy ({tipo}) exportado con {len(ids)} fragmentos en '{destino}' "
+          f"({tamano / 1024 / 1024:.1f} MB).")
+
+def actualizar_si_existe(vectorstore, chroma_path):
+    """
+    Vuelve a exportar el índice NumPy tras una ingesta, solo si ya se había
+    creado uno (conservando su tipo), para que no quede desactualizado.
+    """
+    ruta = os.path.join(ruta_indice(chroma_path), "metadatos.json")
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        tipo = json.load(archivo)["tipo"]
+    exportar_desde_chroma(vectorstore, chroma_path, tipo)
+
+# --- BÚSQUEDA ---
+
+class IndiceNumpy:
+    """
+    Matriz de vectores con memoria mapeada y búsqueda exacta top-k por coseno.
+    """
+
+    def __init__(self, directorio):
+        with open(os.path.join(directorio, "metadatos.json"), "r", encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        self.tipo = datos["tipo"]
+        self.modelo = datos.get(CLAVE_MODELO)
+        self.ids = datos["ids"]
+        self.documentos = datos["documentos"]
+        self.metadatos = datos["metadatos"]
+        self.codigo_fuente = {fuente: codigo for codigo, fuente in enumerate(datos["fuentes"])}
+        self.fila_de_id = {id_: fila for fila, id_ in enumerate(self.ids)}
+        # mmap: el sistema operativo carga y comparte las páginas de la matriz
+        # bajo demanda, en lugar de copiarla entera en la memoria del proceso.
+        self.vectores = np.load(os.path.join(directorio, "vectores.npy"), mmap_mode="r")
+        self.fuentes = np.load(os.path.join(directorio, "fuentes.npy"))
+        ruta_escalas = os.path.join(directorio, "escalas.npy")
+        self.escalas = np.load(ruta_escalas) if self.tipo == "int8" else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filas_de_fuentes(self, fuentes):
+        """
+        Índices de las filas cuya fuente está en 'fuentes' (una cadena o una lista).
+        """
+        if isinstance(fuentes, str):
+            fuentes = [fuentes]
+        codigos = [self.codigo_fuente[f] for f in fuentes if f in self.codigo_fuente]
+        return np.flatnonzero(np.isin(self.fuentes, codigos))
+
+    def similitudes(self, consulta, filas=None):
+        """
+        Similitud coseno de la consulta con todas las filas (o solo con 'filas').
+        """
+        consulta = np.asarray(consulta, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma:
+            consulta = consulta / norma
+        total = len(self) if filas is None else len(filas)
+        resultado = np.empty(total, dtype=np.float32)
+        # NumPy no usa BLAS con float16/int8: se convierte por bloques a float32
+        # para que el producto sea rápido sin duplicar toda la matriz en memoria.
+        for inicio in range(0, total, TAMANO_BLOQUE):
+            fin = min(inicio + TAMANO_BLOQUE, total)
+            bloque = self.vectores[inicio:fin] if filas is None else self.vectores[filas[inicio:fin]]
+            resultado[inicio:fin] = bloque.astype(np.float32) @ consulta
+        if self.escalas is not None:
+            resultado *= self.escalas if filas is None else self.escalas[filas]
+        return resultado
+
+    def buscar(self, consulta, k=4, fuentes=None):
+        """
+        Devuelve [(fila, similitud)] de los k vectores más parecidos, de mayor a menor.
+        """
+        filas = None if fuentes is None else self.filas_de_fuentes(fuentes)
+        similitudes = self.similitudes(consulta, filas)
+        k = min(k, len(similitudes))
+        if k == 0:
+            return []
+        # argpartition es O(n); solo se ordenan los k mejores.
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        filas_resultado = mejores if filas is None else filas[mejores]
+        return [(int(fila), float(similitudes[i])) for fila, i in zip(filas_resultado, mejores)]
+
+    def vectores_de(self, filas):
+        """
+        Vectores de 'filas' en float32 y normalizados (para el reordenamiento MMR).
+        """
+        bloque = self.vectores[np.asarray(filas, dtype=np.int64)].astype(np.float32)
+        if self.escalas is not None:
+            bloque *= self.escalas[filas][:, None]
+        return normalizar_filas(bloque)
+
+    def documento(self, fila):
+        return Document(page_content=self.documentos[fila], id=self.ids[fila],
+                        metadata={**self.metadatos[fila], "id": self.ids[fila]})
+
+def _fuentes_del_filtro(filtro):
+    """
+    Acepta el mismo filtro que Chroma sobre 'source': {"source": "x"} o
+    {"source": {"$in": ["x", "y"]}}.
+    """
+    if not filtro:
+        return None
+    if set(filtro) != {"source"}:
+        raise ValueError("El índice NumPy solo admite filtros sobre 'source'.")
+    valor = filtro["source"]
+    if isinstance(valor, dict):
+        if set(valor) == {"$eq"}:
+            return valor["$eq"]
+        if set(valor) == {"$in"}:
+            return list(valor["$in"])
+        raise ValueError("Operador no soportado en el filtro de 'source'; usa '$eq' o '$in'.")
+    return valor
+
+class VectorStoreNumpy(VectorStore):
+    """
+    Vectorstore de solo lectura sobre un IndiceNumpy, con la misma interfaz de
+    búsqueda que Chroma: sirve para 'as_retriever()', el retriever híbrido y el
+    multi-colección. Las distancias usan la escala de la distancia 'l2' por
+    defecto de Chroma (2 - 2·coseno con vectores normalizados).
+    """
+
+    def __init__(self, indice, embeddings):
+        self.indice = indice
+        self._embeddings = embeddings
+
+    @classmethod
+    def cargar(cls, chroma_path, embeddings, modelo=None):
+        directorio = ruta_indice(chroma_path)
+        if not os.path.exists(os.path.join(directorio, "metadatos.json")):
+            raise FileNotFoundError(
+                f"No existe el índice NumPy en '{directorio}'. Créalo con 'python indice_numpy.py {chroma_path}'."
+            )
+        indice = IndiceNumpy(directorio)
+        if modelo is not None and indice.modelo not in (None, modelo):
+            raise ValueError(
+                f"El índice NumPy de '{chroma_path}' se creó con '{indice.modelo}', pero las consultas usan '{modelo}'."
+            )
+        return cls(indice, embeddings)
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError(
+            "El índice NumPy es de solo lectura: indexa en Chroma y vuelve a exportar."
+        )
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError(
+            "El índice NumPy se crea con exportar_desde_chroma(), no a partir de textos."
+        )
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        resultados = self.indice.buscar(embedding, k, _fuentes_del_filtro(filter))
+        return [(self.indice.documento(fila), 2.0 - 2.0 * similitud) for fila, similitud in resultados]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [d for d, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        vector = self._embeddings.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(vector, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [d for d, _ in self.similarity_search_with_score(query, k, filter)]
+
+# --- SELECCIÓN DEL BACKEND ---
+
+def abrir_vectorstore(chroma_path, embeddings, backend="chroma", modelo=None):
+    """
+    Abre la colección con Chroma o con el índice NumPy exportado de ella.
+    Si se pide NumPy y aún no existe la exportación, se crea en el momento.
+    """
+    from langchain_community.vectorstores import Chroma
+
+    if backend == "chroma":
+        return Chroma(persist_directory=chroma_path, embedding_function=embeddings)
+    if backend != "numpy":
+        raise ValueError(f"Backend vectorial desconocido: '{backend}' (usa 'chroma' o 'numpy').")
+    if not os.path.exists(os.path.join(ruta_indice(chroma_path), "metadatos.json")):
+        exportar_desde_chroma(Chroma(persist_directory=chroma_path), chroma_path)
+    return VectorStoreNumpy.cargar(chroma_path, embeddings, modelo)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta una colección de Chroma al índice NumPy.")
+    parser.add_argument("chroma_path", help="Carpeta de Chroma, p. ej. chroma_db_web.")
+    parser.add_argument("--tipo", choices=TIPOS_SOPORTADOS, default=TIPO_POR_DEFECTO,
+                        help="float16 (más preciso) o int8 (la mitad de memoria).")
+    args = parser.parse_args()
+    if not os.path.exists(args.chroma_path):
+        print(f"No existe la carpeta '{args.chroma_path}'.")
+        sys.exit(1)
+
+    from langchain_community.vectorstores import Chroma
+
+    # Solo se leen los vectores guardados; no hace falta función de embeddings.
+    exportar_desde_chroma(Chroma(persist_directory=args.chroma_path), args.chroma_path, args.tipo)
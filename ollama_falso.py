@@ -0,0 +1,225 @@
+# --- ollama_falso.py ---
+# Servidor HTTP que imita la API de Ollama con respuestas deterministas.
+# Sirve para probar el servidor RAG y los scripts sin tener los modelos descargados:
+#
+#   python ollama_falso.py --puerto 11500
+#   OLLAMA_BASE_URL=http://127.0.0.1:11500 python servidor_rag.py
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+import unicodedata
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+PUERTO_POR_DEFECTO = 11500
+DIMENSION_EMBEDDING = 768          # Igual que 'nomic-embed-text', para poder abrir las bases existentes
+RETARDO_POR_TOKEN = 0.02           # Segundos simulados por token generado
+RETARDO_POR_TOKEN_PROMPT = 0.0005  # Segundos simulados por token evaluado del prompt
+TOKENS_RESPUESTA = 40
+SLOTS_CACHE_PROMPT = 4             # Prompts recientes cuyo prefijo se reutiliza, como el caché KV de Ollama
+
+def tokenizar(texto):
+    """
+    Separa el texto en palabras en minúsculas y sin acentos.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"\w+", texto)
+
+def embedding_determinista(texto, dimension=DIMENSION_EMBEDDING):
+    """
+    Devuelve un vector normalizado de "bolsa de palabras con hashing": textos
+    que comparten palabras producen vectores parecidos, y el mismo texto
+    produce siempre el mismo vector.
+    """
+    vector = [0.0] * dimension
+    for palabra in tokenizar(texto):
+        digest = hashlib.md5(palabra.encode("utf-8")).digest()
+        indice = int.from_bytes(digest[:4], "little") % dimension
+        vector[indice] += 1.0 if digest[4] % 2 else -1.0
+    norma = sum(v * v for v in vector) ** 0.5
+    if not norma:
+        vector[0] = 1.0
+        return vector
+    return [v / norma for v in vector]
+
+def respuesta_determinista(prompt, tokens=TOKENS_RESPUESTA):
+    """
+    Genera la lista de tokens de una respuesta reproducible a partir del prompt.
+    """
+    palabras = tokenizar(prompt) or ["vacio"]
+    semilla = int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16)
+    return [palabras[(semilla + i * 7919) % len(palabras)] + " " for i in range(tokens)]
+
+def contar_tokens(texto):
+    """
+    Estimación barata del número de tokens (aprox. 4 caracteres por token).
+    """
+    return max(1, len(texto) // 4)
+
+class CachePrompts:
+    """
+    Simula el caché KV de Ollama: de cada prompt solo se "evalúa" la parte que
+    no coincide con el prefijo de alguno de los últimos prompts atendidos.
+    """
+
+    def __init__(self, slots=SLOTS_CACHE_PROMPT):
+        self.slots = slots
+        self._prompts = []
+        self._lock = threading.Lock()
+
+    def tokens_a_evaluar(self, prompt):
+        with self._lock:
+            mejor, comun = None, 0
+            for previo in self._prompts:
+                n = len(os.path.commonprefix([previo, prompt]))
+                if n > comun:
+                    mejor, comun = previo, n
+            # El slot con el prefijo más largo se reemplaza por el prompt nuevo.
+            if mejor is not None:
+                self._prompts.remove(mejor)
+            elif len(self._prompts) >= self.slots:
+                self._prompts.pop(0)
+            self._prompts.append(prompt)
+        return max(1, contar_tokens(prompt) - comun // 4)
+
+class ManejadorOllamaFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    retardo_por_token = RETARDO_POR_TOKEN
+    retardo_por_token_prompt = RETARDO_POR_TOKEN_PROMPT
+    cache_prompts = CachePrompts()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _leer_json(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(longitud) or b"{}")
+
+    def _enviar_json(self, datos, estado=200):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _enviar_linea(self, datos):
+        linea = (json.dumps(datos) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(linea):X}\r\n".encode("ascii") + linea + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._enviar_json({"models": [{"name": "phi3:mini"}, {"name": "nomic-embed-text"}]})
+        elif self.path == "/api/version":
+            self._enviar_json({"version": "0.0.0-falso"})
+        else:
+            self._enviar_json({"error": "not found"}, estado=404)
+
+    def do_POST(self):
+        cuerpo = self._leer_json()
+        if self.path == "/api/embed":
+            entradas = cuerpo.get("input", [])
+            if isinstance(entradas, str):
+                entradas = [entradas]
+            self._enviar_json({
+                "model": cuerpo.get("model"),
+                "embeddings": [embedding_determinista(texto) for texto in entradas],
+            })
+        elif self.path == "/api/embeddings":
+            self._enviar_json({"embedding": embedding_determinista(cuerpo.get("prompt", ""))})
+        elif self.path == "/api/generate":
+            self._generar(cuerpo, cuerpo.get("prompt") or "", clave="response")
+        elif self.path == "/api/chat":
+            # Se imita la plantilla de chat: cada mensaje con su rol, en orden.
+            prompt = "".join(f"<|{m.get('role')}|>\n{m.get('content', '')}<|end|>\n"
+                             for m in cuerpo.get("messages", []))
+            self._generar(cuerpo, prompt, clave="message")
+        else:
+            self._enviar_json({"error": "not found"}, estado=404)
+
+    def _generar(self, cuerpo, prompt, clave):
+        """
+        Responde a /api/generate y /api/chat, en streaming (NDJSON) o de una vez.
+        """
+        inicio = time.perf_counter_ns()
+        tokens_prompt = self.cache_prompts.tokens_a_evaluar(prompt)
+        time.sleep(tokens_prompt * self.retardo_por_token_prompt)
+        fin_prompt = time.perf_counter_ns()
+        tokens = respuesta_determinista(prompt)
+
+        def contenido(texto):
+            if clave == "message":
+                return {"message": {"role": "assistant", "content": texto}}
+            return {"response": texto}
+
+        base = {"model": cuerpo.get("model"), "created_at": datetime.now(timezone.utc).isoformat()}
+
+        if cuerpo.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(self.retardo_por_token)
+                    self._enviar_linea({**base, **contenido(token), "done": False})
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente canceló la generación.
+                return
+        else:
+            time.sleep(self.retardo_por_token * len(tokens))
+
+        fin = time.perf_counter_ns()
+        final = {
+            **base,
+            **contenido("" if cuerpo.get("stream", True) else "".join(tokens)),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": fin - inicio,
+            "load_duration": 0,
+            "prompt_eval_count": tokens_prompt,
+            "prompt_eval_duration": fin_prompt - inicio,
+            "eval_count": len(tokens),
+            "eval_duration": fin - fin_prompt,
+        }
+        if cuerpo.get("stream", True):
+            self._enviar_linea(final)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._enviar_json(final)
+
+def crear_servidor(host="127.0.0.1", puerto=PUERTO_POR_DEFECTO,
+                   retardo_por_token=RETARDO_POR_TOKEN,
+                   retardo_por_token_prompt=RETARDO_POR_TOKEN_PROMPT):
+    """
+    Crea (sin arrancar) el servidor falso. Úsese con 'serve_forever()' en un hilo.
+    """
+    manejador = type("Manejador", (ManejadorOllamaFalso,), {
+        "retardo_por_token": retardo_por_token,
+        "retardo_por_token_prompt": retardo_por_token_prompt,
+        "cache_prompts": CachePrompts(),
+    })
+    return ThreadingHTTPServer((host, puerto), manejador)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor que imita la API de Ollama para pruebas locales.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    parser.add_argument("--retardo-token", type=float, default=RETARDO_POR_TOKEN,
+                        help="Segundos por token generado.")
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.host, args.puerto, retardo_por_token=args.retardo_token)
+    print(f"Ollama falso escuchando en http://{args.host}:{args.puerto} (Ctrl-C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
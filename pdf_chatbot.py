@@ -1,29 +1,42 @@
+import os
 import sys
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
-from langchain_ollama import OllamaEmbeddings
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
+from arranque import ArranqueEnSegundoPlano, KEEP_ALIVE_SEGUNDOS
+
+# Las librerías de LangChain/Chroma se importan dentro de las funciones que las
+# usan, para que se carguen en segundo plano mientras el usuario escribe.
 
 # --- CONSTANTES DE CONFIGURACIÓN ---
-CHROMA_PATH = "chroma_db"
+CHROMA_PATH = "chroma_db_pdf"
 MODELO_OLLAMA = "phi3:mini"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+MODELO_EMBEDDING = "nomic-embed-text"  # El mismo modelo con el que pdf_vectordb.py indexa
+# "chroma" o "numpy": búsqueda exacta sobre la matriz exportada con 'indice_numpy.py'.
+BACKEND_VECTORIAL = os.environ.get("RAG_BACKEND_VECTORIAL", "chroma")
 
-def get_rag_chain():
+def get_rag_chain(embeddings=None):
     """
     Configura y devuelve la cadena de RAG completa.
+    'embeddings' permite usar otro modelo ya configurado (p. ej. el de 'respuestas_lote.py').
     """
+    from langchain_community.llms import Ollama
+    from langchain_ollama import OllamaEmbeddings
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
+    from langchain.schema.output_parser import StrOutputParser
+    from indice_lexico import crear_retriever
+    from indice_numpy import abrir_vectorstore
+    from deduplicacion import ensamblar_contexto
+    from trazas import EmbeddingsTrazados, instrumentar_cadena
+
     try:
         # Cargar la base de datos vectorial desde el disco
-        embeddings = OllamaEmbeddings(model=MODELO_OLLAMA)
-        vectorstore = Chroma(
-            persist_directory=CHROMA_PATH, 
-            embedding_function=embeddings
-        )
+        embeddings = embeddings or EmbeddingsTrazados(OllamaEmbeddings(model=MODELO_EMBEDDING, base_url=OLLAMA_BASE_URL))
+        vectorstore = abrir_vectorstore(CHROMA_PATH, embeddings, BACKEND_VECTORIAL, MODELO_EMBEDDING)
         
         # Configurar el retriever
-        retriever = vectorstore.as_retriever(search_kwargs={'k': 4})
+        # Fusiona BM25 y búsqueda vectorial; las consultas que nombran un trámite
+        # se resuelven solo con el índice léxico, sin calcular el embedding.
+        retriever = crear_retriever(vectorstore, CHROMA_PATH, k=4)
 
         # Crear la plantilla del prompt
         template = """
@@ -39,35 +52,62 @@ def get_rag_chain():
         prompt = ChatPromptTemplate.from_template(template)
 
         # Inicializar el modelo de lenguaje
-        llm = Ollama(model=MODELO_OLLAMA)
+        llm = Ollama(model=MODELO_OLLAMA, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS)
 
         # Ensamblar la cadena de RAG
         rag_chain = (
-            {"context": retriever, "question": RunnablePassthrough()}
+            {"context": retriever | RunnableLambda(ensamblar_contexto), "question": RunnablePassthrough()}
             | prompt
             | llm
             | StrOutputParser()
         )
         
-        return rag_chain
+        # Cada consulta deja su traza por etapa en 'trazas/'.
+        return instrumentar_cadena(rag_chain, "chatbot_pdf")
 
-    except FileNotFoundError:
-        print(f"Error: La base de datos en '{CHROMA_PATH}' no fue encontrada.")
-        print("Asegúrate de haber ejecutado primero el script 'preparar_vectordb.py'.")
-        sys.exit(1) # Termina el programa si no encuentra la base de datos
+    # Se lanza una excepción normal (no sys.exit): esta función corre en el hilo
+    # del arranque y el error debe llegar al 'except Exception' de quien la usa.
+    except FileNotFoundError as e:
+        raise RuntimeError(
+            f"La base de datos en '{CHROMA_PATH}' no fue encontrada. "
+            f"Asegúrate de haber ejecutado primero el script 'pdf_vectordb.py'."
+        ) from e
     except Exception as e:
-        print(f"Ocurrió un error inesperado al cargar la cadena RAG: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"Ocurrió un error inesperado al cargar la cadena RAG: {e}") from e
+
+
+def get_rag_chain_con_cache():
+    """
+    Devuelve la cadena RAG envuelta en la caché semántica de respuestas.
+    """
+    from langchain_ollama import OllamaEmbeddings
+    from cache_respuestas import CacheSemanticoRespuestas
+    from trazas import retriever_de_cadena
 
+    # Las preguntas casi idénticas a una anterior se responden desde la caché.
+    rag_chain = get_rag_chain()
+    # Las preguntas que el retriever híbrido resuelve solo con BM25 tampoco se
+    # vectorizan en la caché: así el atajo léxico ahorra de verdad el embedding.
+    retriever = retriever_de_cadena(rag_chain)
+    return CacheSemanticoRespuestas(
+        rag_chain,
+        OllamaEmbeddings(model=MODELO_EMBEDDING, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS),
+        CHROMA_PATH,
+        atajo_lexico=getattr(retriever, "es_consulta_decisiva", None),
+    )
 
 def main():
     """
     Función principal que inicia el chatbot interactivo.
     """
-    print("🤖 Iniciando chatbot... (Esto puede tardar un momento)")
+    print("🤖 Iniciando chatbot...")
     
-    # Cargar la cadena de RAG una sola vez al inicio
-    rag_chain = get_rag_chain()
+    # La cadena se construye y los modelos se precargan en segundo plano,
+    # mientras el usuario ya puede escribir su primera pregunta.
+    arranque = ArranqueEnSegundoPlano(
+        get_rag_chain_con_cache, OLLAMA_BASE_URL, MODELO_OLLAMA, MODELO_EMBEDDING, CHROMA_PATH
+    ).iniciar()
+    rag_chain = None
     
     print("\n✅ Chatbot listo. Escribe tu pregunta o 'salir' para terminar.")
     print("-" * 60)
@@ -78,8 +118,21 @@ def main():
         
         # Salir del bucle si el usuario escribe 'salir'
         if pregunta.lower() == 'salir':
+            if rag_chain is not None:
+                rag_chain.reporte()
             print("\n🤖 ¡Hasta luego!")
             break
+
+        # La primera pregunta espera a que termine el arranque, si aún no terminó
+        if rag_chain is None:
+            try:
+                if not arranque.listo():
+                    print("Chatbot: Terminando de cargar los modelos...")
+                rag_chain = arranque.esperar()
+                arranque.reporte()
+            except Exception as e:
+                print(f"Error: {e}")
+                sys.exit(1) # Sin la cadena RAG el chatbot no puede funcionar
         
         # Invocar la cadena y mostrar la respuesta
         try:
@@ -1,87 +1,487 @@
 import os
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import sys
+import json
+import shutil
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_community.vectorstores import Chroma
 from langchain_ollama import OllamaEmbeddings # Importación actualizada
+from cache_embeddings import EmbeddingsConCache
+from indice_lexico import construir_indice_desde_chroma
+from deduplicacion import IndiceMinHash, eliminar_duplicados
+from division_estructurada import crear_divisor
+from recuperacion_unificada import registrar_modelo_embedding
+from indice_numpy import actualizar_si_existe
+from trazas import TrazaIngesta
 
 # --- CONSTANTES DE CONFIGURACIÓN ---
 DATA_PATH = "data/"
-CHROMA_PATH = "chroma_db"
+CHROMA_PATH = "chroma_db_pdf"
 MODELO_OLLAMA = "phi3:mini"
+MODELO_EMBEDDING = "nomic-embed-text"
+MANIFIESTO_PATH = os.path.join(CHROMA_PATH, "manifiesto.json")
+EXTENSIONES_SOPORTADAS = (".pdf", ".txt")
+# "estructurado" (por secciones, en tokens) o "caracteres" (el divisor anterior).
+# Al cambiarlo, vuelve a indexar con '--reconstruir'.
+DIVISOR = os.environ.get("RAG_DIVISOR", "estructurado")
 
-def cargar_documentos():
-    """
-    Carga todos los documentos soportados desde la carpeta 'data'.
-    """
-    print("Cargando documentos desde la carpeta 'data'...")
-    loader_pdf = DirectoryLoader(
-        DATA_PATH, glob="**/*.pdf", loader_cls=PyPDFLoader, 
-        show_progress=True, use_multithreading=True
-    )
-    loader_txt = DirectoryLoader(
-        DATA_PATH, glob="**/*.txt", loader_cls=TextLoader, 
-        show_progress=True, use_multithreading=True
-    )
-    
-    documentos = loader_pdf.load() + loader_txt.load()
-    
-    if not documentos:
-        print("No se encontraron documentos en la carpeta 'data'.")
-        return None
-        
-    print(f"Se cargaron {len(documentos)} páginas/documentos.")
-    return documentos
+# --- CONFIGURACIÓN DE LA INGESTA EN PARALELO ---
+PROCESOS_PARSEO = min(4, os.cpu_count() or 1)  # Procesos que parsean PDFs con PyPDF
+TAMANO_LOTE_EMBEDDING = 64                     # Fragmentos por llamada de embedding y por upsert
+TAMANO_COLA = 4                                # Elementos en espera entre etapas (acota la memoria)
 
-def dividir_documentos(documentos):
+def dividir_documentos(documentos, indice_duplicados=None, mostrar=True, divisor=DIVISOR,
+                       conservados_en=None):
     """
-    Divide los documentos en fragmentos (chunks) más pequeños.
+    Divide los documentos en fragmentos (chunks) más pequeños y descarta los
+    casi duplicados (p. ej. las páginas repetidas en 'documento_unido.pdf').
+    'indice_duplicados' permite detectar también duplicados de otros archivos;
+    en 'conservados_en' se anotan los archivos donde quedaron esas copias.
     """
     if not documentos:
         return None
         
-    print("Dividiendo documentos en fragmentos (chunks)...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=200,
-        length_function=len
-    )
+    if mostrar:
+        print(f"Dividiendo documentos en fragmentos (chunks, divisor '{divisor}')...")
+    # En los PDFs los títulos de sección se reconocen por su forma.
+    text_splitter = crear_divisor(divisor, detectar_titulos=True)
     fragmentos = text_splitter.split_documents(documentos)
-    print(f"Los documentos se dividieron en {len(fragmentos)} fragmentos.")
+    # Los archivos de un solo trámite van primero, para conservar sus fragmentos
+    # en lugar de las copias de compilaciones como 'documento_unido.pdf'.
+    conteo = Counter(f.metadata.get("source") for f in fragmentos)
+    fragmentos.sort(key=lambda f: conteo[f.metadata.get("source")])
+    fragmentos = eliminar_duplicados(fragmentos, indice_duplicados, conservados_en)
+    if mostrar:
+        print(f"Los documentos se dividieron en {len(fragmentos)} fragmentos.")
     return fragmentos
 
-def crear_y_guardar_vectordb(fragmentos):
+# --- INDEXACIÓN INCREMENTAL ---
+
+def calcular_hash_archivo(ruta):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo, leyéndolo por bloques.
+    """
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def listar_archivos_fuente():
+    """
+    Devuelve, ordenadas, las rutas de todos los archivos soportados dentro de 'data'.
+    Las rutas usan el mismo formato que el metadato 'source' de los loaders.
+    """
+    rutas = []
+    for raiz, _, archivos in os.walk(DATA_PATH):
+        for nombre in archivos:
+            if nombre.lower().endswith(EXTENSIONES_SOPORTADAS):
+                rutas.append(os.path.join(raiz, nombre))
+    return sorted(rutas)
+
+def cargar_manifiesto():
+    """
+    Lee el manifiesto {ruta: {"hash": ..., "ids": [...]}} de la última indexación.
+    Si no existe, devuelve un manifiesto vacío.
+    """
+    if not os.path.exists(MANIFIESTO_PATH):
+        return {}
+    with open(MANIFIESTO_PATH, "r", encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+def guardar_manifiesto(manifiesto):
+    """
+    Escribe el manifiesto de forma atómica junto a la base de datos Chroma.
+    """
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    temporal = MANIFIESTO_PATH + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temporal, MANIFIESTO_PATH)
+
+def planificar_cambios(manifiesto):
+    """
+    Compara los archivos de 'data' con el manifiesto y clasifica cada ruta en
+    'nuevos', 'modificados', 'eliminados', 'dependientes' o 'sin_cambios'.
+    Un archivo sin cambios es 'dependiente' si alguno de sus fragmentos se
+    descartó por estar repetido en un archivo que se borra o se reemplaza:
+    se vuelve a indexar para no perder ese contenido.
+    Devuelve el plan y un diccionario {ruta: hash} de los archivos actuales.
+    """
+    hashes_actuales = {ruta: calcular_hash_archivo(ruta) for ruta in listar_archivos_fuente()}
+    plan = {"nuevos": [], "modificados": [], "eliminados": [], "dependientes": [], "sin_cambios": []}
+
+    for ruta, hash_actual in hashes_actuales.items():
+        if ruta not in manifiesto:
+            plan["nuevos"].append(ruta)
+        elif manifiesto[ruta]["hash"] != hash_actual:
+            plan["modificados"].append(ruta)
+        else:
+            plan["sin_cambios"].append(ruta)
+
+    plan["eliminados"] = sorted(ruta for ruta in manifiesto if ruta not in hashes_actuales)
+
+    # Hasta un punto fijo: reindexar un dependiente también afecta a los que dependen de él.
+    afectados = set(plan["modificados"] + plan["eliminados"])
+    while True:
+        nuevos_afectados = [
+            ruta for ruta in plan["sin_cambios"]
+            if afectados.intersection(manifiesto[ruta].get("conservados_en", []))
+        ]
+        if not nuevos_afectados:
+            break
+        for ruta in nuevos_afectados:
+            plan["sin_cambios"].remove(ruta)
+            plan["dependientes"].append(ruta)
+            afectados.add(ruta)
+    return plan, hashes_actuales
+
+def mostrar_plan(plan, manifiesto):
+    """
+    Imprime un resumen legible de los cambios que se aplicarían al índice.
+    """
+    print(f"Archivos nuevos: {len(plan['nuevos'])}")
+    for ruta in plan["nuevos"]:
+        print(f"   + {ruta}")
+    print(f"Archivos modificados: {len(plan['modificados'])}")
+    for ruta in plan["modificados"]:
+        print(f"   ~ {ruta} ({len(manifiesto[ruta]['ids'])} fragmentos a reemplazar)")
+    print(f"Archivos eliminados: {len(plan['eliminados'])}")
+    for ruta in plan["eliminados"]:
+        print(f"   - {ruta} ({len(manifiesto[ruta]['ids'])} fragmentos a borrar)")
+    print(f"Archivos sin cambios con copias en los anteriores (se reindexan): {len(plan['dependientes'])}")
+    for ruta in plan["dependientes"]:
+        print(f"   ~ {ruta} ({len(manifiesto[ruta]['ids'])} fragmentos a reemplazar)")
+    print(f"Archivos sin cambios (se omiten): {len(plan['sin_cambios'])}")
+
+def cargar_archivo(ruta):
+    """
+    Carga un único archivo de 'data' con el loader correspondiente a su extensión.
+    """
+    if ruta.lower().endswith(".pdf"):
+        return PyPDFLoader(ruta).load()
+    return TextLoader(ruta).load()
+
+def generar_ids_fragmentos(hash_archivo, fragmentos):
+    """
+    Genera IDs deterministas para los fragmentos de un archivo a partir de su hash.
+    """
+    return [f"{hash_archivo[:16]}-{indice}" for indice in range(len(fragmentos))]
+
+def obtener_vectorstore(embeddings=None):
+    """
+    Abre (o crea) la base de datos Chroma persistente usada por el índice de PDFs.
+    """
+    embeddings = embeddings or OllamaEmbeddings(model=MODELO_EMBEDDING)
+    return Chroma(persist_directory=CHROMA_PATH, embedding_function=embeddings)
+
+# --- INGESTA EN PARALELO ---
+# parseo (procesos) -> división -> embedding por lotes -> upsert por lotes en Chroma.
+# Cada etapa corre en su propio hilo y se comunica con la siguiente por una cola
+# acotada, así que la memoria no crece con el tamaño del corpus y el embedding
+# empieza en cuanto el primer PDF está parseado.
+
+_FIN = object()  # Marca de fin de la cola
+
+class EstadisticasEtapa:
+    """
+    Acumula elementos procesados y tiempo ocupado de una etapa del pipeline.
+    """
+
+    def __init__(self, nombre, unidad):
+        self.nombre = nombre
+        self.unidad = unidad
+        self.elementos = 0
+        self.segundos = 0.0
+
+    def registrar(self, elementos, inicio):
+        self.sumar(elementos, time.perf_counter() - inicio)
+
+    def sumar(self, elementos, segundos):
+        self.elementos += elementos
+        self.segundos += segundos
+
+    def __str__(self):
+        ritmo = self.elementos / self.segundos if self.segundos else 0.0
+        return (f"{self.nombre:<10} {self.elementos:>6} {self.unidad:<11} "
+                f"{self.segundos:>8.2f}s ocupados  ({ritmo:.1f} {self.unidad}/s)")
+
+def _cargar_archivo_medido(ruta):
+    """
+    Carga un archivo en el proceso de parseo y devuelve (documentos, segundos).
+    Se mide dentro del proceso para no contar la espera en la cola del pool.
+    """
+    inicio = time.perf_counter()
+    documentos = cargar_archivo(ruta)
+    return documentos, time.perf_counter() - inicio
+
+def _parsear_en_procesos(rutas, estadisticas):
+    """
+    Parsea los archivos en un pool de procesos y los entrega en el orden de
+    'rutas', con como máximo 2 x PROCESOS_PARSEO archivos en memoria.
+    """
+    with ProcessPoolExecutor(max_workers=PROCESOS_PARSEO) as executor:
+        pendientes = deque()
+        rutas = iter(rutas)
+        for ruta in rutas:
+            pendientes.append((ruta, executor.submit(_cargar_archivo_medido, ruta)))
+            if len(pendientes) >= 2 * PROCESOS_PARSEO:
+                break
+        while pendientes:
+            ruta, futuro = pendientes.popleft()
+            documentos, segundos = futuro.result()
+            estadisticas.sumar(1, segundos)
+            siguiente = next(rutas, None)
+            if siguiente is not None:
+                pendientes.append((siguiente, executor.submit(_cargar_archivo_medido, siguiente)))
+            yield ruta, documentos
+
+def ingestar_en_paralelo(rutas, hashes, vectorstore, embeddings, indice_duplicados, al_terminar_archivo):
+    """
+    Indexa 'rutas' con el pipeline por etapas. Llama a
+    'al_terminar_archivo(ruta, ids, conservados_en)' cuando todos los fragmentos
+    de un archivo ya están guardados en Chroma; 'conservados_en' son los otros
+    archivos donde quedaron los fragmentos que se descartaron por repetidos.
+    Devuelve las estadísticas de cada etapa.
+    """
+    stats = {
+        "parseo": EstadisticasEtapa("parseo", "archivos"),
+        "division": EstadisticasEtapa("división", "fragmentos"),
+        "embedding": EstadisticasEtapa("embedding", "fragmentos"),
+        "upsert": EstadisticasEtapa("upsert", "fragmentos"),
+    }
+    cola_fragmentos = queue.Queue(maxsize=TAMANO_COLA * TAMANO_LOTE_EMBEDDING)
+    cola_lotes = queue.Queue(maxsize=TAMANO_COLA)
+    errores = []
+    detener = threading.Event()
+
+    def poner(cola, elemento):
+        # Si otra etapa falló, se descarta el trabajo pendiente en lugar de bloquearse.
+        while not detener.is_set():
+            try:
+                cola.put(elemento, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def fallar(error):
+        errores.append(error)
+        detener.set()
+
+    def dividir():
+        try:
+            for ruta, documentos in _parsear_en_procesos(rutas, stats["parseo"]):
+                if detener.is_set():
+                    break
+                inicio = time.perf_counter()
+                conservados_en = set()
+                fragmentos = dividir_documentos(documentos, indice_duplicados, mostrar=False,
+                                                conservados_en=conservados_en) or []
+                ids = generar_ids_fragmentos(hashes[ruta], fragmentos)
+                stats["division"].registrar(len(fragmentos), inicio)
+                for fragmento, id_fragmento in zip(fragmentos, ids):
+                    poner(cola_fragmentos, (id_fragmento, fragmento))
+                # La marca de archivo viaja detrás de sus fragmentos.
+                poner(cola_fragmentos, ("archivo", ruta, ids, sorted(conservados_en)))
+        except Exception as e:
+            fallar(e)
+        finally:
+            # Las etapas siguientes vacían su cola hasta _FIN, así que este put no se bloquea.
+            cola_fragmentos.put(_FIN)
+
+    def embeber():
+        lote, marcas = [], []
+
+        def enviar():
+            if lote:
+                inicio = time.perf_counter()
+                vectores = embeddings.embed_documents([f.page_content for _, f in lote])
+                stats["embedding"].registrar(len(lote), inicio)
+                poner(cola_lotes, (list(lote), vectores, list(marcas)))
+            elif marcas:
+                poner(cola_lotes, ([], [], list(marcas)))
+            lote.clear()
+            marcas.clear()
+
+        while True:
+            elemento = cola_fragmentos.get()
+            if elemento is _FIN:
+                break
+            if detener.is_set():
+                continue
+            try:
+                if elemento[0] == "archivo":
+                    marcas.append(elemento[1:])
+                    if not lote:
+                        enviar()
+                    continue
+                lote.append(elemento)
+                if len(lote) >= TAMANO_LOTE_EMBEDDING:
+                    enviar()
+            except Exception as e:
+                fallar(e)
+        try:
+            if not detener.is_set():
+                enviar()
+        except Exception as e:
+            fallar(e)
+        cola_lotes.put(_FIN)
+
+    def guardar():
+        while True:
+            elemento = cola_lotes.get()
+            if elemento is _FIN:
+                break
+            if detener.is_set():
+                continue
+            lote, vectores, marcas = elemento
+            try:
+                if lote:
+                    inicio = time.perf_counter()
+                    vectorstore._collection.upsert(
+                        ids=[id_fragmento for id_fragmento, _ in lote],
+                        embeddings=vectores,
+                        documents=[f.page_content for _, f in lote],
+                        metadatas=[f.metadata for _, f in lote],
+                    )
+                    stats["upsert"].registrar(len(lote), inicio)
+                for ruta, ids, conservados_en in marcas:
+                    al_terminar_archivo(ruta, ids, conservados_en)
+            except Exception as e:
+                fallar(e)
+
+    hilos = [threading.Thread(target=objetivo, daemon=True) for objetivo in (dividir, embeber, guardar)]
+    inicio_total = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    if errores:
+        raise errores[0]
+
+    duracion = time.perf_counter() - inicio_total
+    print("\n--- Rendimiento por etapa ---")
+    for etapa in stats.values():
+        print(f"   {etapa}")
+    print(f"   Tiempo total del pipeline: {duracion:.2f}s "
+          f"({stats['upsert'].elementos / duracion if duracion else 0.0:.1f} fragmentos/s de punta a punta)")
+    return stats
+
+def actualizar_vectordb_incremental(dry_run=False):
     """
-    Crea y guarda una base de datos vectorial ChromaDB a partir de los fragmentos.
+    Sincroniza la base de datos Chroma con el contenido actual de 'data':
+    embebe solo los archivos nuevos o modificados, borra los fragmentos de los
+    archivos eliminados y omite los que no cambiaron.
     """
-    if not fragmentos:
-        print("No hay fragmentos para procesar.")
-        return
+    manifiesto = cargar_manifiesto()
+    plan, hashes_actuales = planificar_cambios(manifiesto)
+    mostrar_plan(plan, manifiesto)
+
+    if dry_run:
+        print("\nModo --dry-run: no se modificó la base de datos.")
+        return plan
+
+    if not (plan["nuevos"] or plan["modificados"] or plan["eliminados"] or plan["dependientes"]):
+        print("\nEl índice ya está actualizado. No hay nada que hacer.")
+        return plan
+
+    # La duración de cada etapa del pipeline queda registrada en 'trazas/'.
+    traza = TrazaIngesta("ingesta_pdf")
+    embeddings = EmbeddingsConCache(MODELO_EMBEDDING)
+    vectorstore = obtener_vectorstore(embeddings)
+
+    # Antes de borrar nada, los dependientes pierden su hash en el manifiesto:
+    # si la ingesta se interrumpe, la próxima ejecución los verá modificados y
+    # los volverá a indexar aunque el archivo que los originó ya no figure.
+    for ruta in plan["dependientes"]:
+        manifiesto[ruta]["hash"] = None
+    if plan["dependientes"]:
+        guardar_manifiesto(manifiesto)
 
-    print("Creando la base de datos vectorial con ChromaDB...")
-    
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
-    
-    # Crear y persistir la base de datos en un solo paso
-    vectorstore = Chroma.from_documents(
-        documents=fragmentos,
-        embedding=embeddings,
-        persist_directory=CHROMA_PATH
+    for ruta in plan["eliminados"] + plan["modificados"] + plan["dependientes"]:
+        ids_anteriores = manifiesto[ruta]["ids"]
+        if ids_anteriores:
+            vectorstore.delete(ids=ids_anteriores)
+        if ruta in plan["eliminados"]:
+            del manifiesto[ruta]
+        print(f"Fragmentos anteriores borrados: {ruta}")
+    guardar_manifiesto(manifiesto)
+
+    for ruta in plan["nuevos"]:
+        # Limpia fragmentos huérfanos de un índice creado antes de existir el manifiesto.
+        vectorstore.delete(where={"source": ruta})
+
+    # Los fragmentos que ya están en la colección sirven para descartar duplicados.
+    indice_duplicados = IndiceMinHash()
+    existentes = vectorstore.get(include=["documents", "metadatas"])
+    for texto, metadato in zip(existentes["documents"], existentes["metadatas"]):
+        indice_duplicados.agregar_si_es_nuevo(texto, (metadato or {}).get("source"))
+
+    def al_terminar_archivo(ruta, ids, conservados_en):
+        # 'conservados_en' permite reindexar este archivo si esas copias desaparecen.
+        manifiesto[ruta] = {"hash": hashes_actuales[ruta], "ids": ids, "conservados_en": conservados_en}
+        guardar_manifiesto(manifiesto)
+        print(f"Indexado: {ruta} ({len(ids)} fragmentos)")
+
+    # Los archivos más pequeños primero, por el mismo motivo que en 'dividir_documentos'.
+    rutas = sorted(plan["nuevos"] + plan["modificados"] + plan["dependientes"], key=os.path.getsize)
+    try:
+        stats = ingestar_en_paralelo(rutas, hashes_actuales, vectorstore, embeddings,
+                                     indice_duplicados, al_terminar_archivo)
+    except Exception as e:
+        traza.terminar(f"error: {type(e).__name__}", archivos=len(rutas))
+        raise
+    for nombre, etapa in stats.items():
+        traza.agregar_etapa(nombre, etapa.segundos, etapa.elementos)
+
+    embeddings.reporte()
+    registrar_modelo_embedding(vectorstore, MODELO_EMBEDDING)
+    with traza.etapa("indice_lexico"):
+        construir_indice_desde_chroma(vectorstore, CHROMA_PATH)
+    with traza.etapa("indice_numpy"):
+        actualizar_si_existe(vectorstore, CHROMA_PATH)
+    traza.terminar(archivos=len(rutas), eliminados=len(plan["eliminados"]),
+                   aciertos_cache_embeddings=embeddings.aciertos,
+                   embeddings_calculados=embeddings.fallos)
+    print(f"\n¡Base de datos actualizada en la carpeta '{CHROMA_PATH}'!")
+    return plan
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(
+        description="Actualiza de forma incremental la base de datos vectorial de los documentos en 'data'."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Muestra qué archivos se indexarían, reemplazarían o borrarían sin modificar nada."
+    )
+    parser.add_argument(
+        "--reconstruir", action="store_true",
+        help=f"Borra '{CHROMA_PATH}' y vuelve a indexar todos los documentos desde cero."
     )
-    
-    print(f"¡Base de datos guardada exitosamente en la carpeta '{CHROMA_PATH}'!")
+    return parser.parse_args()
 
 if __name__ == "__main__":
     # --- BLOQUE DE EJECUCIÓN PRINCIPAL ---
-    # Este bloque está comentado porque la base de datos ya fue creada.
-    # Para regenerarla (ej. si agregas nuevos archivos en 'data'):
-    # 1. Borra la carpeta 'chroma_db'.
-    # 2. Descomenta las siguientes líneas.
-    # 3. Vuelve a ejecutar el script.
-    
-    # documentos_cargados = cargar_documentos()
-    # fragmentos_de_texto = dividir_documentos(documentos_cargados)
-    # if fragmentos_de_texto:
-    #     crear_y_guardar_vectordb(fragmentos_de_texto)
-
-    print("Script 'preparar_vectordb.py' está completo y actualizado.")
-    print("La base de datos ya existe. Podemos proceder a la Fase 4.")
+    # Solo se vuelven a embeber los archivos nuevos o modificados de 'data'.
+    # El manifiesto con los hashes y los IDs de los fragmentos se guarda en
+    # '<CHROMA_PATH>/manifiesto.json'.
+    args = parsear_argumentos()
+
+    if args.reconstruir and not args.dry_run and os.path.exists(CHROMA_PATH):
+        print(f"Borrando la base de datos existente en '{CHROMA_PATH}'...")
+        shutil.rmtree(CHROMA_PATH)
+
+    try:
+        actualizar_vectordb_incremental(dry_run=args.dry_run)
+    except Exception as e:
+        print("\n--- ERROR CRÍTICO ---")
+        print("No se pudo actualizar la base de datos vectorial.")
+        print("Motivo:", e)
+        print(f"Verifica que Ollama esté en ejecución y que el modelo '{MODELO_EMBEDDING}' esté descargado.")
+        sys.exit(1)
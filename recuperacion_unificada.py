@@ -0,0 +1,172 @@
+# --- recuperacion_unificada.py ---
+# Retriever único sobre las colecciones de PDFs ('chroma_db_pdf') y de la web
+# ('chroma_db_web'): un solo embedding de la pregunta, búsquedas en paralelo y
+# fusión de resultados por distancia. También registra y valida el modelo de
+# embeddings con el que se construyó cada colección.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import numpy as np
+
+from indice_lexico import NOMBRE_INDICE, IndiceBM25, analizar
+from reordenamiento_mmr import K_CANDIDATOS_MMR, candidatos_con_vectores, diversificar
+from trazas import medir_etapa
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+CLAVE_MODELO = "modelo_embedding"   # Metadato de la colección con el modelo usado al indexar
+FACTOR_ENRUTAMIENTO = 2.0           # El mejor BM25 de una colección debe doblar al de las demás
+MIN_PUNTUACION_ENRUTAMIENTO = 3.0   # ...y superar este mínimo para buscar solo en ella
+
+# --- VALIDACIÓN DEL MODELO DE EMBEDDINGS ---
+
+def registrar_modelo_embedding(vectorstore, modelo):
+    """
+    Guarda en los metadatos de la colección el modelo de embeddings usado para indexarla.
+    """
+    coleccion = vectorstore._collection
+    # Chroma no permite volver a enviar los parámetros 'hnsw:*' al modificar la colección.
+    metadatos = {
+        clave: valor for clave, valor in (coleccion.metadata or {}).items()
+        if not clave.startswith("hnsw:")
+    }
+    metadatos[CLAVE_MODELO] = modelo
+    coleccion.modify(metadata=metadatos)
+
+def validar_modelo_embedding(vectorstore, modelo, vector_prueba, nombre):
+    """
+    Verifica que la colección se indexó con 'modelo'. Si la colección tiene el
+    metadato se compara el nombre; si no, al menos la dimensión de los vectores.
+    Lanza ValueError en caso de discrepancia, para no devolver resultados sin sentido.
+    """
+    coleccion = getattr(vectorstore, "_collection", None)
+    if coleccion is None:
+        # El índice NumPy valida el modelo al abrirse (VectorStoreNumpy.cargar).
+        return
+    registrado = (coleccion.metadata or {}).get(CLAVE_MODELO)
+    if registrado is not None:
+        if registrado != modelo:
+            raise ValueError(
+                f"La colección '{nombre}' se indexó con '{registrado}', pero las consultas usan '{modelo}'. "
+                f"Vuelve a indexarla o cambia el modelo de embeddings."
+            )
+        return
+
+    muestra = coleccion.get(limit=1, include=["embeddings"])["embeddings"]
+    if muestra is None or len(muestra) == 0:
+        return
+    if len(muestra[0]) != len(vector_prueba):
+        raise ValueError(
+            f"La colección '{nombre}' tiene vectores de dimensión {len(muestra[0])}, pero '{modelo}' "
+            f"produce vectores de dimensión {len(vector_prueba)}: se indexó con otro modelo."
+        )
+    print(f"Aviso: la colección '{nombre}' no registra su modelo de embeddings; "
+          f"solo se verificó la dimensión.")
+
+# --- RETRIEVER MULTI-COLECCIÓN ---
+
+class Coleccion:
+    """
+    Una colección de Chroma con su nombre y, si existe, su índice léxico
+    (usado solo para decidir a qué colección enrutar la pregunta).
+    """
+
+    def __init__(self, nombre, vectorstore, chroma_path):
+        self.nombre = nombre
+        self.vectorstore = vectorstore
+        ruta_indice = os.path.join(chroma_path, NOMBRE_INDICE)
+        self.indice = IndiceBM25.cargar(ruta_indice) if os.path.exists(ruta_indice) else None
+
+class RetrieverMultiColeccion(BaseRetriever):
+    """
+    Consulta varias colecciones de Chroma con un único embedding de la
+    pregunta, en paralelo, y devuelve los k fragmentos más cercanos del total.
+    Con 'enrutar=True', si el índice léxico de una colección puntúa mucho mejor
+    que el de las demás, se busca solo en ella. Con 'diversificar', los
+    candidatos de todas las colecciones se reordenan juntos con MMR y se
+    eligen hasta llenar el presupuesto de tokens, con k como máximo.
+    """
+
+    colecciones: List[Any]
+    embeddings: Any
+    k: int = 4
+    enrutar: bool = True
+    diversificar: bool = True
+    k_candidatos_mmr: int = K_CANDIDATOS_MMR
+
+    def elegir_colecciones(self, query):
+        if not self.enrutar or any(c.indice is None for c in self.colecciones):
+            return self.colecciones
+        terminos = analizar(query)
+        puntuaciones = []
+        for coleccion in self.colecciones:
+            mejores = coleccion.indice.buscar(terminos, 1)
+            puntuaciones.append(mejores[0][1] if mejores else 0.0)
+        orden = sorted(range(len(puntuaciones)), key=lambda i: puntuaciones[i], reverse=True)
+        mejor = puntuaciones[orden[0]]
+        segunda = puntuaciones[orden[1]] if len(orden) > 1 else 0.0
+        if mejor >= MIN_PUNTUACION_ENRUTAMIENTO and mejor >= FACTOR_ENRUTAMIENTO * segunda:
+            return [self.colecciones[orden[0]]]
+        return self.colecciones
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with medir_etapa("busqueda_lexica"):
+            colecciones = self.elegir_colecciones(query)
+        vector = self.embeddings.embed_query(query)
+        if self.diversificar:
+            return self._diversificar(colecciones, vector)
+
+        def buscar(coleccion):
+            resultados = coleccion.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                vector, k=self.k
+            )
+            for documento, _ in resultados:
+                documento.metadata["coleccion"] = coleccion.nombre
+            return resultados
+
+        # Los hilos no heredan la traza en curso: se mide la búsqueda en conjunto.
+        with medir_etapa("busqueda_vectorial"), ThreadPoolExecutor(max_workers=len(colecciones)) as executor:
+            resultados = [par for lista in executor.map(buscar, colecciones) for par in lista]
+
+        # Todas las colecciones usan el mismo modelo y la misma métrica: las
+        # distancias son comparables y menor es mejor.
+        resultados.sort(key=lambda par: par[1])
+        return [documento for documento, _ in resultados[:self.k]]
+
+    def _diversificar(self, colecciones, vector):
+        def buscar(coleccion):
+            documentos, relevancias, vectores = candidatos_con_vectores(
+                coleccion.vectorstore, vector, self.k_candidatos_mmr
+            )
+            for documento in documentos:
+                documento.metadata["coleccion"] = coleccion.nombre
+            return documentos, relevancias, vectores
+
+        with medir_etapa("busqueda_vectorial"), ThreadPoolExecutor(max_workers=len(colecciones)) as executor:
+            partes = list(executor.map(buscar, colecciones))
+
+        # Las similitudes coseno de todas las colecciones son comparables.
+        documentos = [documento for lista, _, _ in partes for documento in lista]
+        return diversificar(documentos,
+                            np.concatenate([relevancias for _, relevancias, _ in partes]),
+                            np.concatenate([vectores for _, _, vectores in partes]),
+                            max_fragmentos=self.k)
+
+def crear_retriever_unificado(colecciones, embeddings, modelo, k=4, enrutar=True):
+    """
+    Crea el retriever a partir de {nombre: (vectorstore, chroma_path)}, tras
+    validar que cada colección se indexó con el modelo de embeddings indicado.
+    """
+    vector_prueba = embeddings.embed_query("validación del modelo de embeddings")
+    lista = []
+    for nombre, (vectorstore, chroma_path) in colecciones.items():
+        validar_modelo_embedding(vectorstore, modelo, vector_prueba, nombre)
+        lista.append(Coleccion(nombre, vectorstore, chroma_path))
+    return RetrieverMultiColeccion(colecciones=lista, embeddings=embeddings, k=k, enrutar=enrutar)
@@ -0,0 +1,187 @@
+# --- reordenamiento_mmr.py ---
+# Selección diversa de fragmentos con relevancia marginal máxima (MMR).
+# Los k vecinos más cercanos suelen ser cortes consecutivos y solapados de la
+# misma página, que gastan casi todo el CONTEXTO en repetir lo mismo. Aquí se
+# piden más candidatos junto con los vectores que ya guarda la colección (sin
+# volver a calcular embeddings), se reordenan con MMR limitando los fragmentos
+# por fuente, y se eligen los que quepan en el presupuesto de tokens en lugar
+# de un k fijo (k queda como máximo de fragmentos).
+
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from deduplicacion import contar_tokens
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+K_CANDIDATOS_MMR = 20         # Candidatos vectoriales que se reordenan
+LAMBDA_MMR = 0.7              # 1 = solo relevancia, 0 = solo diversidad
+MAX_POR_FUENTE = 2            # Fragmentos como máximo de una misma página o PDF
+MAX_TOKENS_MMR = 1000         # Presupuesto de los elegidos: lo que ocupaban los 4 vecinos de antes
+
+# --- CANDIDATOS CON SUS VECTORES ---
+
+def _normalizar(matriz):
+    matriz = np.asarray(matriz, dtype=np.float32).reshape(len(matriz), -1)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+def candidatos_con_vectores(vectorstore, vector, n=K_CANDIDATOS_MMR):
+    """
+    Busca los n fragmentos más cercanos a 'vector' y devuelve (documentos,
+    similitudes coseno, matriz de sus vectores normalizados). Funciona con
+    Chroma y con el índice NumPy; los vectores salen de la colección.
+    """
+    from indice_numpy import VectorStoreNumpy
+
+    if isinstance(vectorstore, VectorStoreNumpy):
+        indice = vectorstore.indice
+        resultados = indice.buscar(vector, n)
+        filas = [fila for fila, _ in resultados]
+        documentos = [indice.documento(fila) for fila in filas]
+        return documentos, np.array([s for _, s in resultados], dtype=np.float32), indice.vectores_de(filas)
+
+    datos = vectorstore._collection.query(
+        query_embeddings=[vector], n_results=n,
+        include=["documents", "metadatas", "embeddings"],
+    )
+    documentos = [
+        Document(page_content=texto, metadata=metadato or {}, id=id_)
+        for id_, texto, metadato in zip(datos["ids"][0], datos["documents"][0], datos["metadatas"][0])
+    ]
+    if not documentos:
+        return [], np.zeros(0, dtype=np.float32), np.zeros((0, len(vector)), dtype=np.float32)
+    matriz = _normalizar(datos["embeddings"][0])
+    return documentos, matriz @ _normalizar([vector])[0], matriz
+
+def vectores_por_id(vectorstore, ids, dimension):
+    """
+    Vectores normalizados guardados para 'ids' (en el mismo orden). Las filas
+    de IDs que no estén en la colección quedan en cero.
+    """
+    from indice_numpy import VectorStoreNumpy
+
+    matriz = np.zeros((len(ids), dimension), dtype=np.float32)
+    if not ids:
+        return matriz
+    if isinstance(vectorstore, VectorStoreNumpy):
+        indice = vectorstore.indice
+        posiciones = [(i, indice.fila_de_id.get(id_)) for i, id_ in enumerate(ids)]
+        posiciones = [(i, fila) for i, fila in posiciones if fila is not None]
+        if posiciones:
+            matriz[[i for i, _ in posiciones]] = indice.vectores_de([fila for _, fila in posiciones])
+        return matriz
+    datos = vectorstore._collection.get(ids=list(ids), include=["embeddings"])
+    posicion = {id_: i for i, id_ in enumerate(ids)}
+    if len(datos["ids"]):
+        matriz[[posicion[id_] for id_ in datos["ids"]]] = _normalizar(datos["embeddings"])
+    return matriz
+
+# --- SELECCIÓN ---
+
+def costo_en_tokens(documento):
+    """
+    Tokens que ocupa el fragmento en el CONTEXTO, con su línea de fuente
+    (el mismo formato que usa 'ensamblar_contexto').
+    """
+    return contar_tokens(f"Fuente: {documento.metadata.get('source', 'desconocida')}\n{documento.page_content}")
+
+def seleccionar_mmr(relevancias, vectores, costos, fuentes, lambda_mmr=LAMBDA_MMR,
+                    max_por_fuente=MAX_POR_FUENTE, max_tokens=MAX_TOKENS_MMR, max_fragmentos=None):
+    """
+    Devuelve los índices elegidos, en orden de selección. En cada paso se toma
+    el candidato que maximiza
+        lambda * relevancia - (1 - lambda) * similitud máxima con los ya elegidos
+    entre los que aún caben en el presupuesto y no superan 'max_por_fuente'.
+    El primero (el más relevante) se elige aunque no quepa; 'diversificar' lo
+    recorta. Se eligen como máximo 'max_fragmentos'.
+    Las similitudes entre candidatos se calculan una sola vez con un producto
+    de matrices; cada paso solo actualiza vectores de longitud n.
+    """
+    n = len(relevancias)
+    if n == 0:
+        return []
+    relevancias = np.asarray(relevancias, dtype=np.float32)
+    costos = np.asarray(costos)
+    similitudes = vectores @ vectores.T
+    _, codigos_fuente = np.unique(np.asarray(fuentes, dtype=object).astype(str), return_inverse=True)
+
+    similitud_con_elegidos = np.zeros(n, dtype=np.float32)
+    disponibles = np.ones(n, dtype=bool)
+    usados_por_fuente = np.zeros(codigos_fuente.max() + 1, dtype=np.int64)
+    restantes = max_tokens
+    elegidos = []
+    while max_fragmentos is None or len(elegidos) < max_fragmentos:
+        if elegidos:
+            disponibles &= costos <= restantes
+        if not disponibles.any():
+            break
+        puntuaciones = lambda_mmr * relevancias - (1 - lambda_mmr) * similitud_con_elegidos
+        puntuaciones[~disponibles] = -np.inf
+        elegido = int(np.argmax(puntuaciones))
+        elegidos.append(elegido)
+        restantes -= costos[elegido]
+        disponibles[elegido] = False
+        np.maximum(similitud_con_elegidos, similitudes[elegido], out=similitud_con_elegidos)
+        codigo = codigos_fuente[elegido]
+        usados_por_fuente[codigo] += 1
+        if usados_por_fuente[codigo] >= max_por_fuente:
+            disponibles &= codigos_fuente != codigo
+    return elegidos
+
+def recortar_documento(documento, max_tokens):
+    """
+    Copia del documento recortada para que su costo no pase de 'max_tokens',
+    como recorta 'ensamblar_contexto' el último bloque.
+    """
+    exceso = costo_en_tokens(documento) - max_tokens
+    if exceso <= 0:
+        return documento
+    texto = documento.page_content[:max(0, len(documento.page_content) - exceso * 4)]
+    return Document(page_content=texto, metadata=documento.metadata, id=documento.id)
+
+def diversificar(documentos, relevancias, vectores, lambda_mmr=LAMBDA_MMR,
+                 max_por_fuente=MAX_POR_FUENTE, max_tokens=MAX_TOKENS_MMR, max_fragmentos=None):
+    """
+    Aplica 'seleccionar_mmr' a una lista de documentos y devuelve los elegidos.
+    """
+    elegidos = seleccionar_mmr(
+        relevancias, vectores,
+        [costo_en_tokens(d) for d in documentos],
+        [d.metadata.get("source", "") for d in documentos],
+        lambda_mmr, max_por_fuente, max_tokens, max_fragmentos,
+    )
+    elegidos = [documentos[i] for i in elegidos]
+    if elegidos:
+        elegidos[0] = recortar_documento(elegidos[0], max_tokens)
+    return elegidos
+
+# --- RETRIEVER ---
+
+class RetrieverMMR(BaseRetriever):
+    """
+    Búsqueda vectorial con reordenamiento MMR, para las colecciones sin
+    índice léxico. La relevancia es la similitud coseno con la pregunta.
+    """
+
+    vectorstore: Any
+    k: int = 4
+    k_candidatos: int = K_CANDIDATOS_MMR
+    lambda_mmr: float = LAMBDA_MMR
+    max_por_fuente: int = MAX_POR_FUENTE
+    max_tokens: int = MAX_TOKENS_MMR
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        from trazas import medir_etapa
+
+        vector = self.vectorstore.embeddings.embed_query(query)
+        with medir_etapa("busqueda_vectorial"):
+            documentos, relevancias, vectores = candidatos_con_vectores(self.vectorstore, vector, self.k_candidatos)
+        return diversificar(documentos, relevancias, vectores,
+                            self.lambda_mmr, self.max_por_fuente, self.max_tokens, self.k)
@@ -0,0 +1,253 @@
+# --- respuestas_lote.py ---
+# Responde en lote una lista de preguntas frecuentes con la cadena RAG de un
+# chatbot, para preparar las respuestas de la mesa de ayuda sin usar el bucle
+# interactivo. Busca el mayor rendimiento total en una sola instancia de Ollama:
+#   - los embeddings de todas las preguntas se calculan en una sola llamada;
+#   - mientras Ollama genera, otros hilos ya recuperan el contexto de las
+#     siguientes preguntas, y un semáforo limita las generaciones simultáneas;
+#   - cada respuesta se agrega al archivo de salida en cuanto termina, así que
+#     una ejecución interrumpida se reanuda con el mismo comando.
+#
+#   python respuestas_lote.py preguntas.jsonl --salida respuestas.jsonl --concurrencia 2
+#
+# Para que Ollama atienda varias generaciones a la vez, arráncalo con
+# OLLAMA_NUM_PARALLEL igual o mayor que --concurrencia.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.embeddings import Embeddings
+
+from cache_respuestas import normalizar_pregunta
+from arranque import MODULOS_CHATBOT, importar_chatbot
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+CONCURRENCIA = 2               # Generaciones simultáneas en Ollama
+HILOS_EXTRA_RECUPERACION = 2   # Preguntas que se preparan mientras las demás esperan turno
+TAMANO_LOTE_EMBEDDING = 256    # Preguntas por llamada a /api/embed
+
+class EmbeddingsPrecalculados(Embeddings):
+    """
+    Sirve desde memoria los vectores de las preguntas calculados por adelantado
+    en lote; cualquier otro texto se delega al modelo base.
+    """
+
+    def __init__(self, embeddings_base):
+        self.embeddings_base = embeddings_base
+        self._vectores = {}
+
+    def precalcular(self, textos, tamano_lote=TAMANO_LOTE_EMBEDDING):
+        pendientes = [t for t in dict.fromkeys(textos) if t not in self._vectores]
+        for inicio in range(0, len(pendientes), tamano_lote):
+            lote = pendientes[inicio:inicio + tamano_lote]
+            self._vectores.update(zip(lote, self.embeddings_base.embed_documents(lote)))
+
+    def embed_documents(self, texts):
+        return self.embeddings_base.embed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self._vectores.get(text)
+        return vector if vector is not None else self.embeddings_base.embed_query(text)
+
+# --- ENTRADA Y SALIDA ---
+
+def id_pregunta(pregunta):
+    """
+    ID estable de una pregunta, para reconocerla al reanudar aunque cambie el orden.
+    """
+    return hashlib.sha1(normalizar_pregunta(pregunta).encode("utf-8")).hexdigest()[:16]
+
+def cargar_preguntas(ruta):
+    """
+    Lee un JSONL con {"pregunta": ...} (y opcionalmente "id") por línea.
+    Las preguntas repetidas se responden una sola vez.
+    """
+    preguntas = {}
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        for numero, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            datos = json.loads(linea)
+            pregunta = (datos.get("pregunta") or "").strip()
+            if not pregunta:
+                print(f"Aviso: la línea {numero} de '{ruta}' no tiene 'pregunta'; se omite.")
+                continue
+            preguntas.setdefault(str(datos.get("id") or id_pregunta(pregunta)), pregunta)
+    return preguntas
+
+def cargar_completadas(ruta):
+    """
+    IDs ya respondidos en una ejecución anterior (el archivo de salida es el punto de control).
+    """
+    completadas = set()
+    if not os.path.exists(ruta):
+        return completadas
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        for linea in archivo:
+            try:
+                completadas.add(json.loads(linea)["id"])
+            except (ValueError, KeyError):
+                # Una línea cortada por una interrupción durante la escritura.
+                continue
+    return completadas
+
+class EscritorPuntoDeControl:
+    """
+    Agrega cada resultado al JSONL de salida y lo fuerza a disco de inmediato.
+    """
+
+    def __init__(self, ruta):
+        self._archivo = open(ruta, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def escribir(self, registro):
+        linea = json.dumps(registro, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._archivo.write(linea)
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+
+    def cerrar(self):
+        self._archivo.close()
+
+# --- PROCESAMIENTO ---
+
+def separar_cadena(rag_chain):
+    """
+    Devuelve (retriever, ensamblar_contexto, generación, config) de la cadena de
+    'get_rag_chain()', para poder guardar las fuentes y medir cada etapa.
+    """
+    from langchain_core.runnables import RunnableSequence
+    from trazas import desenvolver_cadena
+
+    cadena, config = desenvolver_cadena(rag_chain)
+    contexto = cadena.first.steps__["context"]
+    return contexto.first, contexto.last, RunnableSequence(*cadena.steps[1:]), config
+
+def responder_lote(rag_chain, preguntas, escritor, concurrencia=CONCURRENCIA, etiqueta=""):
+    """
+    Responde {id: pregunta} y escribe cada resultado en cuanto termina.
+    Devuelve (respondidas, errores).
+    """
+    from langchain_core.runnables import RunnableLambda
+    from trazas import describir_documento
+
+    retriever, ensamblar, generacion, config = separar_cadena(rag_chain)
+    turnos = threading.BoundedSemaphore(concurrencia)
+
+    def recuperar_y_generar(pregunta, config):
+        # 'config' es el de la ejecución raíz: la recuperación y la generación
+        # quedan como hijas suyas y el callback arma una sola traza por pregunta.
+        inicio = time.perf_counter()
+        documentos = retriever.invoke(pregunta, config=config)
+        contexto = ensamblar.invoke(documentos, config=config)
+        fin_recuperacion = time.perf_counter()
+        # La recuperación ya se hizo; solo la generación espera turno en Ollama.
+        with turnos:
+            inicio_generacion = time.perf_counter()
+            respuesta = generacion.invoke({"context": contexto, "question": pregunta}, config=config)
+        fin = time.perf_counter()
+        return {
+            "respuesta": respuesta,
+            "documentos": documentos,
+            "tiempos": {
+                "recuperacion_s": fin_recuperacion - inicio,
+                "espera_turno_s": inicio_generacion - fin_recuperacion,
+                "generacion_s": fin - inicio_generacion,
+                "total_s": fin - inicio,
+            },
+        }
+
+    consulta = RunnableLambda(recuperar_y_generar, name="consulta_lote")
+
+    def responder(id_, pregunta):
+        resultado = consulta.invoke(pregunta, config=config)
+        return {
+            "id": id_,
+            "pregunta": pregunta,
+            "respuesta": resultado["respuesta"],
+            "fuentes": [describir_documento(d) for d in resultado["documentos"]],
+            "tiempos": resultado["tiempos"],
+            "chatbot": etiqueta,
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    respondidas = errores = 0
+    executor = ThreadPoolExecutor(max_workers=concurrencia + HILOS_EXTRA_RECUPERACION)
+    try:
+        futuros = {executor.submit(responder, id_, p): id_ for id_, p in preguntas.items()}
+        for futuro in as_completed(futuros):
+            try:
+                registro = futuro.result()
+            except Exception as e:
+                # Las fallidas no se escriben: se reintentan al reanudar.
+                errores += 1
+                print(f"ERROR en la pregunta {futuros[futuro]}: {e}")
+                continue
+            escritor.escribir(registro)
+            respondidas += 1
+            print(f"[{respondidas + errores}/{len(preguntas)}] {registro['tiempos']['total_s']:.1f}s  "
+                  f"{registro['pregunta'][:70]}")
+    except KeyboardInterrupt:
+        print("\nInterrumpido. Las respuestas terminadas ya están guardadas; "
+              "vuelve a ejecutar el mismo comando para continuar.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return respondidas, errores
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Responde en lote las preguntas de un archivo JSONL.")
+    parser.add_argument("preguntas", help="JSONL con {\"pregunta\": ...} (y opcionalmente \"id\") por línea.")
+    parser.add_argument("--salida", default="respuestas_lote.jsonl",
+                        help="JSONL de salida; también es el punto de control para reanudar.")
+    parser.add_argument("--corpus", choices=sorted(MODULOS_CHATBOT), default="web")
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA,
+                        help="Generaciones simultáneas en Ollama (ver OLLAMA_NUM_PARALLEL).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parsear_argumentos()
+    chatbot = importar_chatbot(args.corpus)
+
+    preguntas = cargar_preguntas(args.preguntas)
+    completadas = cargar_completadas(args.salida)
+    pendientes = {id_: p for id_, p in preguntas.items() if id_ not in completadas}
+    print(f"{len(preguntas)} preguntas: {len(preguntas) - len(pendientes)} ya respondidas en "
+          f"'{args.salida}', {len(pendientes)} pendientes.")
+    if not pendientes:
+        sys.exit(0)
+
+    from langchain_ollama import OllamaEmbeddings
+    from trazas import EmbeddingsTrazados
+
+    embeddings = EmbeddingsPrecalculados(EmbeddingsTrazados(OllamaEmbeddings(
+        model=chatbot.MODELO_EMBEDDING, base_url=chatbot.OLLAMA_BASE_URL,
+    )))
+    rag_chain = chatbot.get_rag_chain(embeddings=embeddings)
+
+    inicio = time.perf_counter()
+    embeddings.precalcular(list(pendientes.values()))
+    print(f"Embeddings de {len(pendientes)} preguntas calculados en {time.perf_counter() - inicio:.2f}s.")
+
+    escritor = EscritorPuntoDeControl(args.salida)
+    try:
+        respondidas, errores = responder_lote(rag_chain, pendientes, escritor, args.concurrencia,
+                                              etiqueta=chatbot.__name__)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        escritor.cerrar()
+
+    duracion = time.perf_counter() - inicio
+    print(f"\n{respondidas} respuestas en {duracion:.1f}s ({60 * respondidas / duracion:.1f} respuestas/min), "
+          f"{errores} errores. Resultados en '{args.salida}'.")
+    if errores:
+        print("Vuelve a ejecutar el mismo comando para reintentar las preguntas con error.")
+        sys.exit(1)
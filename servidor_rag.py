@@ -0,0 +1,226 @@
+# --- servidor_rag.py ---
+# Servidor HTTP asíncrono que atiende muchas preguntas concurrentes con una sola
+# cadena RAG, construida una vez con 'get_rag_chain()' del chatbot elegido.
+#
+# Endpoints:
+#   POST /preguntar          {"pregunta": "..."} -> {"respuesta": "...", "tiempos": {...}}
+#   POST /preguntar/stream   {"pregunta": "..."} -> texto plano enviado token a token
+#   GET  /estado             -> generaciones en curso, en cola, rechazadas y atendidas
+#   GET  /metricas           -> duración por etapa y tokens, en formato de texto de Prometheus
+#
+# Para probarlo sin modelos, arranca primero el servidor falso de Ollama:
+#   python ollama_falso.py --puerto 11500
+#   OLLAMA_BASE_URL=http://127.0.0.1:11500 python servidor_rag.py --corpus web
+
+import time
+import asyncio
+import argparse
+
+from aiohttp import web
+from langchain_core.runnables import RunnableSequence
+
+from trazas import desenvolver_cadena, metricas_prometheus
+from arranque import MODULOS_CHATBOT, importar_chatbot
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+MAX_GENERACIONES_SIMULTANEAS = 2  # Generaciones que Ollama atiende a la vez
+MAX_EN_COLA = 16                  # Preguntas esperando turno antes de rechazar con 503
+TIMEOUT_COLA_SEGUNDOS = 60        # Espera máxima por un turno de generación
+
+class Sobrecargado(Exception):
+    """
+    Se lanza cuando la cola de generación está llena o el turno tarda demasiado.
+    """
+
+class ControlDeCarga:
+    """
+    Limita las generaciones simultáneas contra Ollama y la longitud de la cola
+    de espera. Las preguntas que no caben se rechazan en lugar de acumularse.
+    """
+
+    def __init__(self, max_generaciones, max_en_cola, timeout_cola):
+        self._semaforo = asyncio.Semaphore(max_generaciones)
+        self.max_en_cola = max_en_cola
+        self.timeout_cola = timeout_cola
+        self.en_curso = 0
+        self.en_cola = 0
+        self.rechazadas = 0
+        self.atendidas = 0
+
+    def admitir(self):
+        """
+        Reserva un lugar en la cola o lanza 'Sobrecargado' si está llena.
+        """
+        if self.en_cola >= self.max_en_cola:
+            self.rechazadas += 1
+            raise Sobrecargado(f"Hay {self.en_cola} preguntas en espera; inténtalo más tarde.")
+        self.en_cola += 1
+
+    def liberar_cola(self):
+        self.en_cola -= 1
+
+    async def turno(self):
+        """
+        Espera un turno de generación; la cola se libera al obtenerlo o al fallar.
+        """
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), timeout=self.timeout_cola)
+        except asyncio.TimeoutError:
+            self.rechazadas += 1
+            raise Sobrecargado(f"No hubo turno de generación en {self.timeout_cola}s.")
+        finally:
+            self.liberar_cola()
+        self.en_curso += 1
+
+    def terminar_turno(self):
+        self.en_curso -= 1
+        self.atendidas += 1
+        self._semaforo.release()
+
+    def estado(self):
+        return {
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "rechazadas": self.rechazadas,
+            "atendidas": self.atendidas,
+        }
+
+def separar_etapas(rag_chain):
+    """
+    Separa la cadena de 'get_rag_chain()' en la etapa de recuperación
+    ({"context": retriever, "question": ...}) y la de generación
+    (prompt | llm | parser), para limitar solo la segunda.
+    """
+    cadena, config = desenvolver_cadena(rag_chain)
+    recuperacion = cadena.first
+    generacion = RunnableSequence(*cadena.steps[1:])
+    if config:
+        # Las dos mitades conservan el callback de trazas de la cadena original;
+        # cada pregunta deja una traza de recuperación y otra de generación.
+        recuperacion = recuperacion.with_config(config)
+        generacion = generacion.with_config(config)
+    return recuperacion, generacion
+
+async def leer_pregunta(request):
+    try:
+        datos = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="El cuerpo debe ser JSON: {\"pregunta\": \"...\"}")
+    pregunta = (datos.get("pregunta") or "").strip() if isinstance(datos, dict) else ""
+    if not pregunta:
+        raise web.HTTPBadRequest(text="Falta el campo 'pregunta'.")
+    return pregunta
+
+def respuesta_sobrecarga(error):
+    return web.json_response(
+        {"error": str(error)}, status=503, headers={"Retry-After": "5"}
+    )
+
+async def recuperar_y_esperar_turno(app, pregunta):
+    """
+    Admite la pregunta en la cola, recupera su contexto (sin ocupar turno de
+    generación, de modo que las recuperaciones corren en paralelo) y espera
+    un turno libre. Lanza 'Sobrecargado' si no hay sitio.
+    """
+    control = app["control"]
+    control.admitir()
+    try:
+        entrada = await app["recuperacion"].ainvoke(pregunta)
+    except BaseException:
+        control.liberar_cola()
+        raise
+    await control.turno()
+    return entrada
+
+async def preguntar(request):
+    app = request.app
+    pregunta = await leer_pregunta(request)
+    inicio = time.perf_counter()
+    try:
+        entrada = await recuperar_y_esperar_turno(app, pregunta)
+    except Sobrecargado as e:
+        return respuesta_sobrecarga(e)
+
+    inicio_generacion = time.perf_counter()
+    try:
+        respuesta = await app["generacion"].ainvoke(entrada)
+    finally:
+        app["control"].terminar_turno()
+    fin = time.perf_counter()
+
+    return web.json_response({
+        "respuesta": respuesta,
+        "tiempos": {
+            "recuperacion_y_espera": inicio_generacion - inicio,
+            "generacion": fin - inicio_generacion,
+            "total": fin - inicio,
+        },
+    })
+
+async def preguntar_stream(request):
+    app = request.app
+    pregunta = await leer_pregunta(request)
+    try:
+        entrada = await recuperar_y_esperar_turno(app, pregunta)
+    except Sobrecargado as e:
+        return respuesta_sobrecarga(e)
+
+    try:
+        respuesta = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        await respuesta.prepare(request)
+        # Desde aiohttp 3.9 el handler no se cancela al desconectarse el cliente:
+        # el turno se libera cuando 'write()' falla y la excepción llega al finally.
+        async for parte in app["generacion"].astream(entrada):
+            await respuesta.write(parte.encode("utf-8"))
+        await respuesta.write_eof()
+    finally:
+        app["control"].terminar_turno()
+    return respuesta
+
+async def estado(request):
+    return web.json_response(request.app["control"].estado())
+
+async def metricas(request):
+    return web.Response(body=metricas_prometheus().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+def crear_app(rag_chain, max_generaciones=MAX_GENERACIONES_SIMULTANEAS,
+              max_en_cola=MAX_EN_COLA, timeout_cola=TIMEOUT_COLA_SEGUNDOS):
+    """
+    Crea la aplicación aiohttp a partir de una cadena RAG ya construida.
+    """
+    app = web.Application()
+    app["recuperacion"], app["generacion"] = separar_etapas(rag_chain)
+
+    async def iniciar_control(app):
+        # El semáforo se crea dentro del bucle de eventos del servidor.
+        app["control"] = ControlDeCarga(max_generaciones, max_en_cola, timeout_cola)
+
+    app.on_startup.append(iniciar_control)
+    app.router.add_post("/preguntar", preguntar)
+    app.router.add_post("/preguntar/stream", preguntar_stream)
+    app.router.add_get("/estado", estado)
+    app.router.add_get("/metricas", metricas)
+    return app
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Servidor HTTP para la cadena RAG de los chatbots.")
+    parser.add_argument("--corpus", choices=sorted(MODULOS_CHATBOT), default="web",
+                        help="Chatbot cuya cadena RAG se sirve.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--max-generaciones", type=int, default=MAX_GENERACIONES_SIMULTANEAS)
+    parser.add_argument("--max-en-cola", type=int, default=MAX_EN_COLA)
+    parser.add_argument("--timeout-cola", type=float, default=TIMEOUT_COLA_SEGUNDOS)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parsear_argumentos()
+    chatbot = importar_chatbot(args.corpus)
+
+    print(f"🤖 Construyendo la cadena RAG de '{chatbot.__name__}'...")
+    rag_chain = chatbot.get_rag_chain()
+    app = crear_app(rag_chain, args.max_generaciones, args.max_en_cola, args.timeout_cola)
+
+    print(f"✅ Servidor listo en http://{args.host}:{args.puerto}")
+    web.run_app(app, host=args.host, port=args.puerto, print=None)
@@ -0,0 +1,203 @@
+# --- sesion_rag.py ---
+# Modo conversación de los chatbots: las preguntas de seguimiento ("¿y cuánto
+# cuesta?") conservan el tema, y el prompt se arma para que Ollama reutilice
+# su caché KV de un turno al siguiente.
+#
+# Orden de los mensajes enviados a /api/chat en cada turno:
+#   1. instrucciones del sistema      -> idénticas byte a byte en todos los turnos
+#   2. historial (pregunta/respuesta) -> solo crece al final entre turnos
+#   3. contexto recuperado + pregunta -> lo único nuevo de cada turno
+# Ollama reutiliza el prefijo común con el prompt anterior y solo evalúa lo
+# demás; el historial se recorta por bloques (no un turno cada vez) para que
+# ese prefijo se rompa lo menos posible.
+
+import time
+import uuid
+
+from deduplicacion import contar_tokens, ensamblar_contexto
+from indice_lexico import analizar, plegar_acentos
+from trazas import describir_documento, obtener_trazador
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+PRESUPUESTO_HISTORIAL_TOKENS = 1200   # Tokens máximos del historial enviado al modelo
+MAX_TOKENS_RESPUESTA_HISTORIAL = 250  # Cada respuesta se guarda recortada en el historial
+TOKENS_CONDENSACION = 64              # Longitud máxima de la pregunta reformulada ('num_predict')
+MIN_TERMINOS_AUTONOMA = 3             # Con menos términos de contenido se considera seguimiento
+INICIOS_SEGUIMIENTO = ("y ", "e ", "entonces", "tambien", "ademas", "pero ", "o sea")
+
+INSTRUCCIONES_CONDENSACION = (
+    "No respondas todavía. Reescribe esta pregunta de seguimiento como una pregunta independiente, "
+    "que se entienda sin la conversación anterior (incluye el trámite o tema del que se habla): "
+    "\"{question}\"\n"
+    "Responde solo con la pregunta reescrita, en una línea, sin explicaciones."
+)
+
+def recortar_a_tokens(texto, max_tokens):
+    """
+    Recorta el texto a 'max_tokens' (misma estimación que contar_tokens). El
+    recorte es determinista, así que el historial se reenvía siempre igual.
+    """
+    limite = max_tokens * 4
+    return texto if len(texto) <= limite else texto[:limite].rstrip() + " [...]"
+
+class SesionRAG:
+    """
+    Conversación de varios turnos sobre un retriever y un modelo de chat.
+    Expone 'stream' e 'invoke' como la cadena RAG, de modo que puede usarse
+    con 'transmitir_respuesta'.
+    """
+
+    def __init__(self, retriever, llm, llm_condensacion, instrucciones, plantilla_turno,
+                 presupuesto_historial=PRESUPUESTO_HISTORIAL_TOKENS, servicio="sesion"):
+        self.retriever = retriever
+        self.llm = llm
+        self.llm_condensacion = llm_condensacion
+        self.instrucciones = instrucciones
+        self.plantilla_turno = plantilla_turno
+        self.presupuesto_historial = presupuesto_historial
+        self.trazador = obtener_trazador(servicio)
+        self.historial = []       # [(pregunta, respuesta recortada)]
+        self.ultimo_turno = None
+
+    def reiniciar(self):
+        self.historial = []
+
+    # --- Historial ---
+
+    def tokens_historial(self):
+        return sum(contar_tokens(p) + contar_tokens(r) for p, r in self.historial)
+
+    def _recortar_historial(self):
+        """
+        Al pasarse del presupuesto se descartan los turnos más antiguos hasta
+        quedar en la mitad: así el prefijo cambia una vez cada varios turnos.
+        """
+        if self.tokens_historial() <= self.presupuesto_historial:
+            return
+        while self.historial and self.tokens_historial() > self.presupuesto_historial // 2:
+            self.historial.pop(0)
+
+    def _mensajes_historial(self):
+        """
+        Prefijo común de todos los prompts de la sesión: sistema + historial.
+        """
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        mensajes = [SystemMessage(content=self.instrucciones)]
+        for pregunta_anterior, respuesta_anterior in self.historial:
+            mensajes.append(HumanMessage(content=pregunta_anterior))
+            mensajes.append(AIMessage(content=respuesta_anterior))
+        return mensajes
+
+    def _mensajes(self, contexto, pregunta):
+        from langchain_core.messages import HumanMessage
+
+        mensajes = self._mensajes_historial()
+        mensajes.append(HumanMessage(content=self.plantilla_turno.format(context=contexto, question=pregunta)))
+        return mensajes
+
+    # --- Condensación de preguntas de seguimiento ---
+
+    def necesita_condensar(self, pregunta):
+        """
+        Solo se llama al modelo si hay historial y la pregunta parece depender
+        de él: empieza como continuación o casi no tiene términos de contenido.
+        """
+        if not self.historial:
+            return False
+        if plegar_acentos(pregunta).lstrip("¿¡ ").startswith(INICIOS_SEGUIMIENTO):
+            return True
+        return len(set(analizar(pregunta))) < MIN_TERMINOS_AUTONOMA
+
+    def condensar(self, pregunta):
+        """
+        Reformula la pregunta con ayuda del historial. El prompt empieza igual
+        que el del turno (sistema + historial): así reutiliza el caché KV y no
+        desplaza del slot de Ollama el prefijo que usará la respuesta.
+        """
+        from langchain_core.messages import HumanMessage
+
+        mensajes = self._mensajes_historial()
+        mensajes.append(HumanMessage(content=INSTRUCCIONES_CONDENSACION.format(question=pregunta)))
+        respuesta = self.llm_condensacion.invoke(mensajes)
+        lineas = [linea.strip() for linea in respuesta.content.strip().splitlines() if linea.strip()]
+        # Si el modelo no devuelve nada útil, basta con unir la pregunta anterior.
+        return lineas[0] if lineas else f"{self.historial[-1][0]} {pregunta}"
+
+    # --- Interfaz compatible con la cadena RAG ---
+
+    def stream(self, pregunta):
+        inicio = time.perf_counter()
+        etapas = []
+        consulta = pregunta
+        if self.necesita_condensar(pregunta):
+            consulta = self.condensar(pregunta)
+            etapas.append({"etapa": "condensacion", "segundos": time.perf_counter() - inicio})
+
+        inicio_recuperacion = time.perf_counter()
+        documentos = self.retriever.invoke(consulta)
+        etapas.append({"etapa": "recuperacion", "segundos": time.perf_counter() - inicio_recuperacion,
+                       "elementos": len(documentos)})
+        mensajes = self._mensajes(ensamblar_contexto(documentos), pregunta)
+        tokens_prompt = sum(contar_tokens(m.content) for m in mensajes)
+
+        partes, info = [], {}
+        terminada = False
+        respuesta = self.llm.stream(mensajes)
+        try:
+            for parte in respuesta:
+                if parte.response_metadata.get("done"):
+                    info = parte.response_metadata
+                partes.append(parte.content)
+                yield parte.content
+            terminada = True
+        finally:
+            # Cerrar el stream corta la conexión y detiene la generación en Ollama.
+            respuesta.close()
+            for etapa, clave in (("ollama_prompt_eval", "prompt_eval_duration"),
+                                 ("ollama_generacion", "eval_duration")):
+                if info.get(clave) is not None:
+                    etapas.append({"etapa": etapa, "segundos": info[clave] / 1e9})
+            etapas.append({"etapa": "total", "segundos": time.perf_counter() - inicio})
+            self.ultimo_turno = {
+                "tipo": "turno_sesion",
+                "id": uuid.uuid4().hex[:16],
+                "pregunta": pregunta,
+                "consulta": consulta,
+                "etapas": etapas,
+                "documentos": [describir_documento(d) for d in documentos],
+                "turnos_historial": len(self.historial),
+                "tokens_historial": self.tokens_historial(),
+                "tokens_prompt_estimados": tokens_prompt,
+                "tokens_prompt": info.get("prompt_eval_count"),
+                "tokens_generados": info.get("eval_count"),
+                "resultado": "ok" if terminada else "cancelada",
+            }
+            self.trazador.registrar(self.ultimo_turno)
+
+        # Solo los turnos completos pasan al historial.
+        self.historial.append((pregunta, recortar_a_tokens("".join(partes), MAX_TOKENS_RESPUESTA_HISTORIAL)))
+        self._recortar_historial()
+
+    def invoke(self, pregunta):
+        return "".join(self.stream(pregunta))
+
+    def reporte_turno(self):
+        """
+        Imprime la evaluación del prompt del último turno: cuántos tokens tuvo
+        que procesar Ollama y cuántos reutilizó de su caché.
+        """
+        turno = self.ultimo_turno
+        if not turno:
+            return
+        tiempos = {e["etapa"]: e["segundos"] for e in turno["etapas"]}
+        partes = []
+        if turno["tokens_prompt"] is not None:
+            evaluados, total = turno["tokens_prompt"], turno["tokens_prompt_estimados"]
+            reutilizados = max(0.0, 1 - evaluados / total) if total else 0.0
+            partes.append(f"prompt: ~{total} tokens, {evaluados} evaluados "
+                          f"(~{100 * reutilizados:.0f}% desde el caché) en {tiempos.get('ollama_prompt_eval', 0):.2f}s")
+        if "condensacion" in tiempos:
+            partes.append(f"condensación: {tiempos['condensacion']:.2f}s -> \"{turno['consulta']}\"")
+        partes.append(f"historial: {len(self.historial)} turnos, {self.tokens_historial()} tokens")
+        print("[" + " | ".join(partes) + "]")
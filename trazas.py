@@ -0,0 +1,438 @@
+# --- trazas.py ---
+# Trazas por etapa de la cadena RAG y de la ingesta. Cada consulta produce una
+# línea JSON en 'trazas/trazas.jsonl' con la duración de la recuperación, el
+# embedding de la pregunta, el LLM y los tiempos que reporta Ollama (carga,
+# evaluación del prompt y generación). Los mismos datos se acumulan en métricas
+# con formato de texto de Prometheus en 'trazas/metricas_<servicio>.prom'
+# (para el "textfile collector" de node_exporter) y en GET /metricas del servidor.
+#
+# Se desactivan con la variable de entorno RAG_TRAZAS=0.
+
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from deduplicacion import contar_tokens
+from indice_lexico import clave_documento
+
+# --- CONSTANTES DE CONFIGURACIÓN ---
+TRAZAS_PATH = "trazas"
+ARCHIVO_JSONL = "trazas.jsonl"
+TRAZAS_ACTIVAS = os.environ.get("RAG_TRAZAS", "1") != "0"
+INTERVALO_PROMETHEUS_S = 5.0    # Como máximo una reescritura del archivo .prom cada 5 s
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+NANOSEGUNDOS = 1e9              # Ollama reporta sus duraciones en nanosegundos
+
+# Traza de la consulta en curso; la usa EmbeddingsTrazados para anotar el
+# embedding de la pregunta, que no genera eventos de callback propios.
+TRAZA_ACTUAL = contextvars.ContextVar("traza_actual", default=None)
+
+# --- ACUMULACIÓN Y EXPORTACIÓN ---
+
+class Histograma:
+    def __init__(self):
+        self.cubetas = [0] * len(LIMITES_HISTOGRAMA)
+        self.cuenta = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuenta += 1
+        self.suma += valor
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if valor <= limite:
+                self.cubetas[i] += 1
+
+class Trazador:
+    """
+    Recibe las trazas terminadas de un servicio ('chatbot_web', 'ingesta_pdf',
+    ...), las escribe como JSON lines y mantiene las métricas de Prometheus.
+    """
+
+    def __init__(self, servicio, ruta=TRAZAS_PATH, activo=TRAZAS_ACTIVAS):
+        self.servicio = servicio
+        self.ruta = ruta
+        self.activo = activo
+        self.duraciones = {}   # etapa -> Histograma
+        self.contadores = {}   # (nombre, etiquetas) -> valor
+        self._lock = threading.Lock()
+        self._ultima_escritura = 0.0
+        if activo:
+            os.makedirs(ruta, exist_ok=True)
+
+    def _sumar(self, nombre, valor, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def registrar(self, traza):
+        """
+        Guarda una traza: {"tipo", "id", "etapas": [{"etapa", "segundos", ...}], ...}.
+        """
+        if not self.activo:
+            return
+        traza = {"servicio": self.servicio, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), **traza}
+        linea = json.dumps(traza, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            for etapa in traza.get("etapas", []):
+                self.duraciones.setdefault(etapa["etapa"], Histograma()).observar(etapa["segundos"])
+                if "elementos" in etapa:
+                    self._sumar("rag_elementos_procesados_total", etapa["elementos"], etapa=etapa["etapa"])
+            self._sumar("rag_trazas_total", 1, tipo=traza.get("tipo", ""), resultado=traza.get("resultado", "ok"))
+            for nombre, clave in (("prompt", "tokens_prompt"), ("generados", "tokens_generados")):
+                if traza.get(clave):
+                    self._sumar("rag_tokens_total", traza[clave], tipo=nombre)
+            if traza.get("documentos"):
+                self._sumar("rag_fragmentos_recuperados_total", len(traza["documentos"]))
+            # Una sola escritura con O_APPEND por traza: las líneas de procesos
+            # distintos no se mezclan.
+            with open(os.path.join(self.ruta, ARCHIVO_JSONL), "a", encoding="utf-8") as archivo:
+                archivo.write(linea)
+            escribir = time.monotonic() - self._ultima_escritura >= INTERVALO_PROMETHEUS_S
+        if escribir:
+            self.escribir_prometheus()
+
+    def series(self):
+        """
+        Devuelve {(nombre, tipo): [líneas]} con las series de este servicio.
+        """
+        servicio = f'servicio="{self.servicio}"'
+        familias = {}
+        with self._lock:
+            for etapa, histograma in sorted(self.duraciones.items()):
+                lineas = familias.setdefault(("rag_etapa_segundos", "histogram"), [])
+                etiquetas = f'{servicio},etapa="{etapa}"'
+                for limite, cuenta in zip(LIMITES_HISTOGRAMA, histograma.cubetas):
+                    lineas.append(f'rag_etapa_segundos_bucket{{{etiquetas},le="{limite}"}} {cuenta}')
+                lineas.append(f'rag_etapa_segundos_bucket{{{etiquetas},le="+Inf"}} {histograma.cuenta}')
+                lineas.append(f"rag_etapa_segundos_sum{{{etiquetas}}} {histograma.suma:.6f}")
+                lineas.append(f"rag_etapa_segundos_count{{{etiquetas}}} {histograma.cuenta}")
+            for (nombre, etiquetas), valor in sorted(self.contadores.items()):
+                texto = ",".join([servicio] + [f'{clave}="{v}"' for clave, v in etiquetas])
+                familias.setdefault((nombre, "counter"), []).append(f"{nombre}{{{texto}}} {valor}")
+        return familias
+
+    def metricas_prometheus(self):
+        return formatear_prometheus([self])
+
+    def escribir_prometheus(self):
+        if not self.activo:
+            return
+        ruta = os.path.join(self.ruta, f"metricas_{self.servicio}.prom")
+        # Un temporal por hilo: varios hilos pueden escribir a la vez.
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(self.metricas_prometheus())
+        # El reemplazo atómico evita que el recolector lea un archivo a medias.
+        os.replace(temporal, ruta)
+        self._ultima_escritura = time.monotonic()
+
+_TRAZADORES = {}
+_LOCK_TRAZADORES = threading.Lock()
+
+def obtener_trazador(servicio):
+    """
+    Devuelve el trazador del servicio, compartido por todo el proceso.
+    """
+    with _LOCK_TRAZADORES:
+        if servicio not in _TRAZADORES:
+            trazador = Trazador(servicio)
+            _TRAZADORES[servicio] = trazador
+            # Las métricas acumuladas desde la última escritura no se pierden al salir.
+            atexit.register(trazador.escribir_prometheus)
+        return _TRAZADORES[servicio]
+
+def formatear_prometheus(trazadores):
+    """
+    Genera el formato de texto de Prometheus: cada familia de métricas aparece
+    una sola vez, con las series de todos los servicios.
+    """
+    familias = {}
+    for trazador in trazadores:
+        for clave, lineas in trazador.series().items():
+            familias.setdefault(clave, []).extend(lineas)
+    salida = []
+    for (nombre, tipo), lineas in sorted(familias.items()):
+        salida.append(f"# TYPE {nombre} {tipo}")
+        salida.extend(lineas)
+    return "\n".join(salida) + "\n" if salida else ""
+
+def metricas_prometheus():
+    """
+    Métricas de todos los trazadores del proceso, para un endpoint HTTP.
+    """
+    with _LOCK_TRAZADORES:
+        trazadores = list(_TRAZADORES.values())
+    return formatear_prometheus(trazadores)
+
+# --- TRAZAS DE LA CADENA RAG ---
+
+def describir_documento(documento):
+    """
+    ID, fuente y tamaño de un fragmento recuperado.
+    """
+    return {
+        "id": documento.id or clave_documento(documento)[:16],
+        "fuente": documento.metadata.get("source"),
+        "caracteres": len(documento.page_content),
+        "tokens": contar_tokens(documento.page_content),
+    }
+
+class TrazasCadenaRAG(BaseCallbackHandler):
+    """
+    Callback de LangChain que arma una traza por cada ejecución raíz de la
+    cadena y la entrega al trazador al terminar. Solo guarda marcas de tiempo
+    y contadores, así que puede quedarse activo en producción.
+    """
+
+    # Se ejecuta en el mismo hilo/tarea que la cadena: así TRAZA_ACTUAL
+    # se propaga a los pasos que LangChain lanza en paralelo.
+    run_inline = True
+
+    def __init__(self, trazador):
+        self.trazador = trazador
+        self.ultima_traza = None
+        self._raices = {}    # run_id -> run_id de la ejecución raíz
+        self._trazas = {}    # run_id raíz -> traza en construcción
+        self._inicios = {}   # run_id -> instante de inicio
+        self._lock = threading.Lock()
+
+    def _traza(self, run_id, parent_run_id):
+        with self._lock:
+            raiz = self._raices.get(parent_run_id, parent_run_id)
+            # Un retriever o LLM invocado sin cadena no tiene traza: no se guarda
+            # nada, porque ninguna raíz lo borraría después.
+            if raiz is None:
+                return None
+            self._raices[run_id] = raiz
+            return self._trazas.get(raiz)
+
+    def _terminar_span(self, run_id):
+        inicio = self._inicios.pop(run_id, None)
+        return time.perf_counter() - inicio if inicio is not None else 0.0
+
+    # --- Cadena ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is not None:
+            self._traza(run_id, parent_run_id)
+            return
+        traza = {
+            "tipo": "consulta",
+            "id": uuid.uuid4().hex[:16],
+            "etapas": [],
+            "_inicio": time.perf_counter(),
+        }
+        with self._lock:
+            self._raices[run_id] = run_id
+            self._trazas[run_id] = traza
+        TRAZA_ACTUAL.set(traza)
+
+    def _terminar_raiz(self, run_id, resultado):
+        with self._lock:
+            traza = self._trazas.pop(run_id, None)
+            # Se olvidan las ejecuciones hijas de esta raíz.
+            for hija in [hija for hija, raiz in self._raices.items() if raiz == run_id]:
+                del self._raices[hija]
+                self._inicios.pop(hija, None)
+        if traza is None:
+            return
+        if TRAZA_ACTUAL.get() is traza:
+            TRAZA_ACTUAL.set(None)
+        traza["etapas"].append({"etapa": "total", "segundos": time.perf_counter() - traza.pop("_inicio")})
+        # Un stream cerrado a mitad de la generación termina la cadena sin error,
+        # pero el LLM no llega a reportar su fin.
+        if traza.pop("_llm_en_curso", False) and resultado == "ok":
+            resultado = "cancelada"
+        traza["resultado"] = resultado
+        self.ultima_traza = traza
+        self.trazador.registrar(traza)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._terminar_raiz(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            # Cerrar el stream (Ctrl-C o cliente desconectado) llega como GeneratorExit.
+            cancelada = isinstance(error, (GeneratorExit, KeyboardInterrupt))
+            self._terminar_raiz(run_id, "cancelada" if cancelada else f"error: {type(error).__name__}")
+
+    # --- Recuperación ---
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        traza = self._traza(run_id, parent_run_id)
+        self._inicios[run_id] = time.perf_counter()
+        # En modo stream la cadena recibe la entrada por partes; la pregunta
+        # completa se ve al llegar al retriever.
+        if traza is not None:
+            traza["pregunta"] = query
+
+    def on_retriever_end(self, documents, *, run_id, parent_run_id=None, **kwargs):
+        segundos = self._terminar_span(run_id)
+        traza = self._traza(run_id, parent_run_id)
+        if traza is None:
+            return
+        traza["etapas"].append({"etapa": "recuperacion", "segundos": segundos, "elementos": len(documents)})
+        traza["documentos"] = [describir_documento(d) for d in documents]
+
+    # --- LLM ---
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        traza = self._traza(run_id, parent_run_id)
+        self._inicios[run_id] = time.perf_counter()
+        if traza is not None:
+            traza["_llm_en_curso"] = True
+            traza["caracteres_prompt"] = sum(len(p) for p in prompts)
+            traza["tokens_prompt_estimados"] = sum(contar_tokens(p) for p in prompts)
+
+    def on_llm_new_token(self, token, *, run_id, parent_run_id=None, **kwargs):
+        traza = self._traza(run_id, parent_run_id)
+        if traza is not None and "primer_token_s" not in traza:
+            traza["primer_token_s"] = time.perf_counter() - self._inicios.get(run_id, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        segundos = self._terminar_span(run_id)
+        traza = self._traza(run_id, parent_run_id)
+        if traza is None:
+            return
+        traza.pop("_llm_en_curso", None)
+        traza["etapas"].append({"etapa": "llm", "segundos": segundos})
+        generaciones = [g for lista in response.generations for g in lista]
+        info = (generaciones[-1].generation_info or {}) if generaciones else {}
+        # Los tiempos que mide Ollama separan la carga del modelo, la evaluación
+        # del prompt (proporcional al contexto) y la generación de tokens.
+        for etapa, clave in (("ollama_carga", "load_duration"),
+                             ("ollama_prompt_eval", "prompt_eval_duration"),
+                             ("ollama_generacion", "eval_duration")):
+            if info.get(clave) is not None:
+                traza["etapas"].append({"etapa": etapa, "segundos": info[clave] / NANOSEGUNDOS})
+        if info.get("prompt_eval_count") is not None:
+            traza["tokens_prompt"] = info["prompt_eval_count"]
+        if info.get("eval_count") is not None:
+            traza["tokens_generados"] = info["eval_count"]
+
+@contextmanager
+def medir_etapa(nombre):
+    """
+    Anota en la traza de la consulta en curso (si la hay) la duración del
+    bloque. La usan los pasos internos de la recuperación, que no generan
+    eventos de callback propios.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        traza = TRAZA_ACTUAL.get()
+        if traza is not None:
+            traza["etapas"].append({"etapa": nombre, "segundos": time.perf_counter() - inicio})
+
+class EmbeddingsTrazados(Embeddings):
+    """
+    Envuelve un modelo de embeddings y anota en la traza en curso cuánto tardó
+    el embedding de la pregunta, para separarlo de la búsqueda en Chroma.
+    """
+
+    def __init__(self, embeddings_base):
+        self.embeddings_base = embeddings_base
+
+    def embed_documents(self, texts):
+        return self.embeddings_base.embed_documents(texts)
+
+    def embed_query(self, text):
+        with medir_etapa("embedding_consulta"):
+            return self.embeddings_base.embed_query(text)
+
+def instrumentar_cadena(rag_chain, servicio):
+    """
+    Adjunta el callback de trazas a la cadena de 'get_rag_chain()'.
+    """
+    trazador = obtener_trazador(servicio)
+    if not trazador.activo:
+        return rag_chain
+    return rag_chain.with_config(callbacks=[TrazasCadenaRAG(trazador)])
+
+def desenvolver_cadena(rag_chain):
+    """
+    Devuelve (secuencia, config) de una cadena instrumentada, para quien
+    necesita recorrer sus pasos (servidor, benchmark). 'config' conserva los
+    callbacks, de modo que los pasos separados siguen generando trazas.
+    """
+    config = {}
+    while hasattr(rag_chain, "bound"):
+        config = {**rag_chain.config, **config}
+        rag_chain = rag_chain.bound
+    return rag_chain, config
+
+def ultima_traza(rag_chain):
+    """
+    Devuelve la traza de la última consulta de una cadena instrumentada (o de
+    la que envuelve la caché de respuestas) o el último turno de una sesión;
+    None si la cadena no tiene trazas.
+    """
+    if hasattr(rag_chain, "ultimo_turno"):
+        return rag_chain.ultimo_turno
+    rag_chain = getattr(rag_chain, "rag_chain", rag_chain)
+    _, config = desenvolver_cadena(rag_chain)
+    for callback in config.get("callbacks") or []:
+        if isinstance(callback, TrazasCadenaRAG):
+            return callback.ultima_traza
+    return None
+
+def retriever_de_cadena(rag_chain):
+    """
+    Devuelve el retriever de una cadena de 'get_rag_chain()' (el primer paso
+    de su rama "context"), o None si la cadena tiene otra forma.
+    """
+    cadena, _ = desenvolver_cadena(rag_chain)
+    contexto = getattr(getattr(cadena, "first", None), "steps__", {}).get("context")
+    return getattr(contexto, "first", contexto)
+
+# --- TRAZAS DE LA INGESTA ---
+
+class TrazaIngesta:
+    """
+    Traza de una ejecución de los scripts de ingesta: se marcan las etapas con
+    'with traza.etapa(...)' o se agregan ya medidas, y 'terminar()' la registra.
+    """
+
+    def __init__(self, servicio):
+        self.trazador = obtener_trazador(servicio)
+        self.traza = {"tipo": "ingesta", "id": uuid.uuid4().hex[:16], "etapas": []}
+        self._inicio = time.perf_counter()
+
+    def agregar_etapa(self, etapa, segundos, elementos=None):
+        registro = {"etapa": etapa, "segundos": segundos}
+        if elementos is not None:
+            registro["elementos"] = elementos
+        self.traza["etapas"].append(registro)
+
+    @contextmanager
+    def etapa(self, nombre):
+        """
+        Mide el bloque; se le puede asignar 'elementos' al diccionario que devuelve.
+        Si el bloque lanza una excepción, la etapa queda marcada con el error.
+        """
+        datos = {}
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        except Exception as e:
+            datos["resultado"] = f"error: {type(e).__name__}"
+            raise
+        finally:
+            self.agregar_etapa(nombre, time.perf_counter() - inicio, datos.get("elementos"))
+            if "resultado" in datos:
+                self.traza["etapas"][-1]["resultado"] = datos["resultado"]
+
+    def terminar(self, resultado="ok", **datos):
+        self.agregar_etapa("total", time.perf_counter() - self._inicio)
+        self.traza.update(datos, resultado=resultado)
+        self.trazador.registrar(self.traza)
+        self.trazador.escribir_prometheus()
@@ -1,38 +1,23 @@
+import os
 import sys
 import time
-import threading
+import argparse
+import textwrap
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
-from langchain_ollama import OllamaEmbeddings
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
+from arranque import ArranqueEnSegundoPlano, KEEP_ALIVE_SEGUNDOS
+
+# Las librerías de LangChain/Chroma se importan dentro de las funciones que las
+# usan: su carga tarda más de un segundo y se hace en segundo plano al arrancar.
 
 # --- CONSTANTES DE CONFIGURACIÓN ---
 CHROMA_PATH = "chroma_db_web"
 MODELO_OLLAMA = "phi3:mini"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 MODELO_EMBEDDING = "nomic-embed-text"
+# "chroma" o "numpy": búsqueda exacta sobre la matriz exportada con 'indice_numpy.py'.
+BACKEND_VECTORIAL = os.environ.get("RAG_BACKEND_VECTORIAL", "chroma")
 
-# --- FUNCIÓN DE CONFIGURACIÓN DE LA CADENA RAG ---
-# (CAMBIO) Se eliminó el bloque try/except para que los errores se propaguen hacia arriba.
-def get_rag_chain():
-    """
-    Configura y devuelve la cadena de RAG (Retrieval-Augmented Generation) completa.
-    Si ocurre un error durante la configuración (ej. no se encuentra Chroma),
-    la excepción será lanzada para que la función que llama la maneje.
-    """
-    embeddings = OllamaEmbeddings(model=MODELO_EMBEDDING)
-    
-    # Esta es la línea que probablemente podría fallar si la carpeta no existe.
-    vectorstore = Chroma(
-        persist_directory=CHROMA_PATH, 
-        embedding_function=embeddings
-    )
-    
-    retriever = vectorstore.as_retriever(search_kwargs={'k': 4})
-
-    template ="""
+PLANTILLA_PROMPT ="""
     Actúa como un asistente virtual experto y muy servicial de la Universidad Veracruzana. 
     Tu misión es proporcionar respuestas extremadamente detalladas y completas, utilizando únicamente la información encontrada en el CONTEXTO proporcionado.
 
@@ -52,11 +37,95 @@ def get_rag_chain():
 
     RESPUESTA DETALLADA Y COMPLETA:
     """
-    prompt = ChatPromptTemplate.from_template(template)
-    llm = Ollama(model=MODELO_OLLAMA)
+
+# Modo conversación ('--sesion'): las reglas van en el mensaje de sistema, que
+# no cambia entre turnos, y el contexto recuperado solo en el último mensaje.
+# Así Ollama reutiliza del caché KV todo el prompt salvo el turno nuevo.
+INSTRUCCIONES_SESION = textwrap.dedent("""\
+    Actúa como un asistente virtual experto y muy servicial de la Universidad Veracruzana.
+    Tu misión es proporcionar respuestas extremadamente detalladas y completas, utilizando únicamente la información encontrada en el CONTEXTO de cada pregunta.
+
+    Sigue estas reglas estrictamente:
+    1.  **Sé Exhaustivo:** Extrae y sintetiza TODA la información relevante del contexto que responda a la pregunta del usuario. No omitas detalles, requisitos, fechas o pasos mencionados.
+    2.  **Organiza la Información:** Estructura tu respuesta de una manera clara y fácil de entender. Si la pregunta es sobre un proceso, descríbelo en una lista ordenada (paso a paso). Si se listan requisitos, usa viñetas.
+    3.  **Elabora la Respuesta:** No te limites a extraer texto. Explica los conceptos con tus propias palabras (basadas en el contexto) para que la respuesta sea coherente y completa.
+    4.  **Restricción Absoluta:** Si la información necesaria para responder la pregunta no se encuentra en el CONTEXTO, DEBES responder única y exclusivamente con la frase: "No tengo información suficiente sobre eso en mis documentos." No intentes adivinar ni añadir información externa.
+    5.  **Conversación:** Usa las preguntas y respuestas anteriores solo para entender a qué se refiere el usuario (por ejemplo, "¿y cuánto cuesta?"); los datos de tu respuesta deben salir del CONTEXTO.
+    """)
+
+PLANTILLA_TURNO = """---
+CONTEXTO:
+{context}
+---
+PREGUNTA DEL USUARIO:
+{question}"""
+
+# --- FUNCIÓN DE CONFIGURACIÓN DE LA CADENA RAG ---
+# (CAMBIO) Se eliminó el bloque try/except para que los errores se propaguen hacia arriba.
+def get_rag_chain(embeddings=None):
+    """
+    Configura y devuelve la cadena de RAG (Retrieval-Augmented Generation) completa.
+    Si ocurre un error durante la configuración (ej. no se encuentra Chroma),
+    la excepción será lanzada para que la función que llama la maneje.
+    'embeddings' permite usar otro modelo ya configurado (p. ej. el de
+    'respuestas_lote.py', con los vectores de las preguntas precalculados).
+    """
+    from trazas import instrumentar_cadena
+
+    # Cada consulta deja su traza por etapa en 'trazas/'.
+    return instrumentar_cadena(ensamblar_cadena(crear_retriever_web(embeddings)), "chatbot_web")
+
+def crear_retriever_web(embeddings=None):
+    """
+    Abre la base vectorial de la web y devuelve el retriever híbrido.
+    """
+    from langchain_ollama import OllamaEmbeddings
+    from indice_lexico import crear_retriever
+    from indice_numpy import abrir_vectorstore
+    from trazas import EmbeddingsTrazados
+
+    # El envoltorio anota en la traza cuánto tarda el embedding de la pregunta.
+    embeddings = embeddings or EmbeddingsTrazados(OllamaEmbeddings(model=MODELO_EMBEDDING, base_url=OLLAMA_BASE_URL))
+    
+    # Esta es la línea que probablemente podría fallar si la carpeta no existe.
+    vectorstore = abrir_vectorstore(CHROMA_PATH, embeddings, BACKEND_VECTORIAL, MODELO_EMBEDDING)
+    
+    # Fusiona BM25 y búsqueda vectorial; las consultas que nombran un trámite
+    # se resuelven solo con el índice léxico, sin calcular el embedding.
+    return crear_retriever(vectorstore, CHROMA_PATH, k=4)
+
+def get_sesion():
+    """
+    Devuelve una conversación de varios turnos ('sesion_rag.SesionRAG') sobre
+    el mismo retriever, con el modelo de chat de Ollama.
+    """
+    from langchain_ollama import ChatOllama
+    from sesion_rag import SesionRAG, TOKENS_CONDENSACION
+
+    llm = ChatOllama(model=MODELO_OLLAMA, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS)
+    llm_condensacion = ChatOllama(
+        model=MODELO_OLLAMA, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS,
+        temperature=0, num_predict=TOKENS_CONDENSACION,
+    )
+    return SesionRAG(crear_retriever_web(), llm, llm_condensacion, INSTRUCCIONES_SESION, PLANTILLA_TURNO,
+                     servicio="chatbot_web")
+
+def ensamblar_cadena(retriever):
+    """
+    Une el retriever con el ensamblado del contexto, el prompt y el modelo.
+    También la usa 'chatbot_unificado.py' con su retriever multi-colección.
+    """
+    from langchain_community.llms import Ollama
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
+    from langchain.schema.output_parser import StrOutputParser
+    from deduplicacion import ensamblar_contexto
+
+    prompt = ChatPromptTemplate.from_template(PLANTILLA_PROMPT)
+    llm = Ollama(model=MODELO_OLLAMA, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS)
 
     rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
+        {"context": retriever | RunnableLambda(ensamblar_contexto), "question": RunnablePassthrough()}
         | prompt
         | llm
         | StrOutputParser()
@@ -64,82 +133,166 @@ def get_rag_chain():
     
     return rag_chain
 
-# --- FUNCIÓN PARA LA ANIMACIÓN DE CARGA --- (Sin cambios)
-def mostrar_barra_de_carga(evento_parada):
-    """
-    Muestra una barra de progreso animada en la consola hasta que
-    el 'evento_parada' se active.
-    """
-    bar_length = 30
-    i = 0
-    while not evento_parada.is_set():
-        progreso = i % 100
-        longitud_llena = int(bar_length * progreso // 100)
-        barra = '█' * longitud_llena + '-' * (bar_length - longitud_llena)
-        sys.stdout.write(f'\rChatbot: Procesando... |{barra}| {progreso}%')
-        sys.stdout.flush()
-        i += 2
-        time.sleep(0.1)
-
-    barra_final = '█' * bar_length
-    sys.stdout.write(f'\rChatbot: Procesando... |{barra_final}| 100%\n')
+# --- FUNCIÓN PARA MOSTRAR LA RESPUESTA EN STREAMING ---
+def transmitir_respuesta(rag_chain, pregunta):
+    """
+    Escribe en la consola cada token de la respuesta en cuanto Ollama lo genera.
+    Con Ctrl-C se cancela solo la generación en curso, no la sesión.
+    Devuelve un diccionario con las métricas del turno.
+    """
+    from trazas import ultima_traza
+
+    inicio = time.perf_counter()
+    primer_token = None
+    fragmentos = 0
+    cancelada = False
+    # Con la caché de respuestas, un acierto llega en un solo fragmento y no
+    # tiene sentido medir tokens por segundo.
+    aciertos_antes = getattr(rag_chain, "aciertos", None)
+    traza_anterior = ultima_traza(rag_chain)
+
+    sys.stdout.write("Chatbot: ")
     sys.stdout.flush()
+    stream = rag_chain.stream(pregunta)
+    try:
+        for parte in stream:
+            if primer_token is None:
+                primer_token = time.perf_counter()
+            fragmentos += 1
+            sys.stdout.write(parte)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        # Cerrar el generador corta la conexión con Ollama y detiene la generación.
+        stream.close()
+        cancelada = True
+    fin = time.perf_counter()
+    sys.stdout.write("\n")
+
+    metricas = {
+        "cancelada": cancelada,
+        "desde_cache": aciertos_antes is not None and rag_chain.aciertos > aciertos_antes,
+        "tiempo_primer_token": primer_token - inicio if primer_token is not None else None,
+        "tiempo_total": fin - inicio,
+    }
+    # Ollama informa los tokens generados y su duración al terminar; la traza
+    # del turno los guarda. Sin ellos se cuentan los fragmentos del stream.
+    traza = ultima_traza(rag_chain)
+    traza = traza if traza is not traza_anterior else None
+    duraciones = {e["etapa"]: e["segundos"] for e in (traza or {}).get("etapas", [])}
+    if traza and traza.get("tokens_generados") and duraciones.get("ollama_generacion"):
+        metricas.update(unidad="tokens", cantidad=traza["tokens_generados"],
+                        por_segundo=traza["tokens_generados"] / duraciones["ollama_generacion"])
+    else:
+        duracion_generacion = fin - primer_token if primer_token is not None else 0.0
+        metricas.update(unidad="fragmentos", cantidad=fragmentos,
+                        por_segundo=fragmentos / duracion_generacion if duracion_generacion > 0 else 0.0)
+    return metricas
+
+def mostrar_metricas(metricas):
+    """
+    Imprime el tiempo hasta el primer token y la velocidad de generación del
+    turno, o solo el tiempo total si la respuesta salió de la caché.
+    """
+    if metricas["cancelada"]:
+        print("⏹️  Generación cancelada.")
+    if metricas["tiempo_primer_token"] is None:
+        print(f"[sin tokens | total: {metricas['tiempo_total']:.2f}s]")
+        return
+    if metricas["desde_cache"]:
+        print(f"[respuesta desde la caché | total: {metricas['tiempo_total']:.2f}s]")
+        return
+    print(
+        f"[primer token: {metricas['tiempo_primer_token']:.2f}s | "
+        f"{metricas['cantidad']} {metricas['unidad']} a {metricas['por_segundo']:.1f} {metricas['unidad']}/s | "
+        f"total: {metricas['tiempo_total']:.2f}s]"
+    )
+
+def get_rag_chain_con_cache():
+    """
+    Devuelve la cadena RAG envuelta en la caché semántica de respuestas: las
+    preguntas casi idénticas a una anterior se responden desde la caché.
+    """
+    from langchain_ollama import OllamaEmbeddings
+    from cache_respuestas import CacheSemanticoRespuestas
+    from trazas import retriever_de_cadena
+
+    rag_chain = get_rag_chain()
+    # Las preguntas que el retriever híbrido resuelve solo con BM25 tampoco se
+    # vectorizan en la caché: así el atajo léxico ahorra de verdad el embedding.
+    retriever = retriever_de_cadena(rag_chain)
+    return CacheSemanticoRespuestas(
+        rag_chain,
+        OllamaEmbeddings(model=MODELO_EMBEDDING, base_url=OLLAMA_BASE_URL, keep_alive=KEEP_ALIVE_SEGUNDOS),
+        CHROMA_PATH,
+        atajo_lexico=getattr(retriever, "es_consulta_decisiva", None),
+    )
 
 # --- FUNCIÓN PRINCIPAL ---
 def main():
     """
     Función principal que inicia el chatbot interactivo.
+    Con '--sesion' recuerda la conversación para responder preguntas de seguimiento.
     """
+    parser = argparse.ArgumentParser(description="Chatbot sobre los trámites publicados en la web de la UV.")
+    parser.add_argument("--sesion", action="store_true",
+                        help="Modo conversación: recuerda las preguntas anteriores ('nueva' la reinicia).")
+    args = parser.parse_args()
+
     print("🤖 Iniciando chatbot con información web...")
-    
-    # (CAMBIO CLAVE) Se añade un bloque try/except para capturar errores de inicialización.
-    try:
-        rag_chain = get_rag_chain()
-        print("\n✅ Chatbot listo. Pregúntame sobre los trámites de la UV. Escribe 'salir' para terminar.")
-        print("-" * 70)
-    except Exception as e:
-        print("\n❌ ERROR CRÍTICO AL INICIAR EL CHATBOT ❌")
-        print(f"No se pudo cargar la cadena de procesamiento de lenguaje. El error fue:\n")
-        print(f"   ➡️  {e}\n")
-        print("POSIBLES CAUSAS:")
-        print(f"   1. La carpeta de la base de datos Chroma ('{CHROMA_PATH}') no existe o está corrupta.")
-        print("      Asegúrate de haber ejecutado primero el script que la crea (ej. 'web_scraper_vectordb.py').")
-        print(f"   2. El modelo de Ollama ('{MODELO_OLLAMA}' o '{MODELO_EMBEDDING}') no está disponible o no se ha descargado.")
-        print("      Verifica que Ollama esté en ejecución y los modelos estén instalados con 'ollama list'.")
-        sys.exit(1) # Terminamos el programa de forma controlada porque no puede funcionar.
+
+    # La cadena se construye y los modelos se precargan mientras el usuario escribe.
+    arranque = ArranqueEnSegundoPlano(
+        get_sesion if args.sesion else get_rag_chain_con_cache,
+        OLLAMA_BASE_URL, MODELO_OLLAMA, MODELO_EMBEDDING, CHROMA_PATH
+    ).iniciar()
+    print("\n✅ Chatbot listo. Pregúntame sobre los trámites de la UV. Escribe 'salir' para terminar.")
+    if args.sesion:
+        print("   Modo conversación: escribe 'nueva' para empezar otra conversación.")
+    print("-" * 70)
+    rag_chain = None
 
     while True:
         pregunta = input("Tú: ")
         
         if pregunta.lower() == 'salir':
+            if rag_chain is not None and not args.sesion:
+                rag_chain.reporte()
             print("\n🤖 ¡Hasta luego! Ha sido un placer ayudarte.")
             break
-        
-        evento_parada = threading.Event()
-        resultado = {"respuesta": None, "error": None}
 
-        def obtener_respuesta(p):
+        if args.sesion and pregunta.lower() == 'nueva':
+            if rag_chain is not None:
+                rag_chain.reiniciar()
+            print("Chatbot: Empecemos una nueva conversación.")
+            continue
+
+        if rag_chain is None:
+            # (CAMBIO CLAVE) Los errores de inicialización aparecen con la primera pregunta.
             try:
-                respuesta = rag_chain.invoke(p)
-                resultado["respuesta"] = respuesta
+                if not arranque.listo():
+                    print("Chatbot: Terminando de cargar los modelos...")
+                rag_chain = arranque.esperar()
+                arranque.reporte()
             except Exception as e:
-                resultado["error"] = e
-            finally:
-                evento_parada.set()
-
-        hilo_trabajo = threading.Thread(target=obtener_respuesta, args=(pregunta,))
-        hilo_trabajo.start()
-
-        mostrar_barra_de_carga(evento_parada)
-
-        hilo_trabajo.join()
-
-        if resultado["error"]:
+                print("\n❌ ERROR CRÍTICO AL INICIAR EL CHATBOT ❌")
+                print(f"No se pudo cargar la cadena de procesamiento de lenguaje. El error fue:\n")
+                print(f"   ➡️  {e}\n")
+                print("POSIBLES CAUSAS:")
+                print(f"   1. La carpeta de la base de datos Chroma ('{CHROMA_PATH}') no existe o está corrupta.")
+                print("      Asegúrate de haber ejecutado primero el script que la crea (ej. 'web_scraper_vectordb.py').")
+                print(f"   2. El modelo de Ollama ('{MODELO_OLLAMA}' o '{MODELO_EMBEDDING}') no está disponible o no se ha descargado.")
+                print("      Verifica que Ollama esté en ejecución y los modelos estén instalados con 'ollama list'.")
+                sys.exit(1) # Terminamos el programa de forma controlada porque no puede funcionar.
+        
+        try:
+            metricas = transmitir_respuesta(rag_chain, pregunta)
+            mostrar_metricas(metricas)
+            if args.sesion:
+                rag_chain.reporte_turno()
+        except Exception as e:
             # Este mensaje ahora es para errores DURANTE la conversación.
             print(f"\nLo siento, ocurrió un error al procesar tu pregunta.")
-            print(f"Detalle del error: {resultado['error']}")
-        else:
-            print(f"Chatbot: {resultado['respuesta']}")
+            print(f"Detalle del error: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,11 +1,29 @@
 # --- web_scraper_vectordb_mejorado.py ---
 
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_ollama import OllamaEmbeddings
+from cache_embeddings import EmbeddingsConCache
+from indice_lexico import clave_documento, construir_indice_desde_chroma
+from deduplicacion import eliminar_duplicados
+from division_estructurada import crear_divisor, texto_estructurado_html
+from recuperacion_unificada import registrar_modelo_embedding
+from indice_numpy import actualizar_si_existe
+from trazas import TrazaIngesta
 import traceback # Importamos la librería para obtener detalles del error
 
 # --- CONSTANTES DE CONFIGURACIÓN ---
@@ -59,79 +77,444 @@ URLS_A_ESCANEAR = [
 
 CHROMA_PATH = "chroma_db_web" 
 MODELO_EMBEDDING = "nomic-embed-text" 
+TAMANO_LOTE_GUARDADO = 256        # Fragmentos por llamada de embedding y escritura en Chroma
+# "estructurado" (por secciones, en tokens) o "caracteres" (el divisor anterior).
+DIVISOR = os.environ.get("RAG_DIVISOR", "estructurado")
+
+# --- CONFIGURACIÓN DE LA DESCARGA CONCURRENTE ---
+CACHE_HTTP_PATH = "cache_http"    # Caché en disco con ETag/Last-Modified y el texto ya limpio
+MAX_DESCARGAS_SIMULTANEAS = 8     # Hilos de descarga en total
+MAX_DESCARGAS_POR_HOST = 4        # Conexiones simultáneas permitidas contra un mismo host
+TIMEOUT_SEGUNDOS = 15
+MAX_REINTENTOS = 3
+FACTOR_BACKOFF = 0.5              # Espera entre reintentos: 0.5s, 1s, 2s...
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+VERSION_LIMPIEZA = 2              # Cambia cuando cambia el formato del texto limpio guardado
+
+# --- CONFIGURACIÓN DE LOS PDFs ENLAZADOS ---
+# Los PDFs se guardan por su hash SHA-256 en 'cache_http/pdf/', junto con el
+# texto de sus páginas, así que un PDF sin cambios no se vuelve a parsear.
+CACHE_PDF_PATH = os.path.join(CACHE_HTTP_PATH, "pdf")
+TAMANO_BLOQUE_DESCARGA = 64 * 1024                # Bytes que se escriben a disco en cada lectura
+PROCESOS_PARSEO_PDF = min(4, os.cpu_count() or 1)  # Procesos que parsean PDFs con PyPDF
+VERSION_PARSEO_PDF = 1                            # Cambia cuando cambia la extracción del texto
+
+class CacheHTTP:
+    """
+    Caché en disco de las páginas descargadas. Por cada URL guarda los
+    encabezados ETag/Last-Modified y el texto ya limpio, de modo que una
+    respuesta 304 (Not Modified) no requiere volver a descargar ni a parsear.
+    """
+
+    def __init__(self, ruta=CACHE_HTTP_PATH):
+        self.ruta = ruta
+        self.ruta_indice = os.path.join(ruta, "indice.json")
+        self.ruta_pdf = os.path.join(ruta, "pdf")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.ruta_pdf, "parciales"), exist_ok=True)
+        if os.path.exists(self.ruta_indice):
+            with open(self.ruta_indice, "r", encoding="utf-8") as archivo:
+                self.indice = json.load(archivo)
+        else:
+            self.indice = {}
+
+    def _ruta_texto(self, url):
+        return os.path.join(self.ruta, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".txt")
+
+    def _ruta_guardada(self, entrada, url):
+        if entrada.get("sha256"):
+            return self.ruta_archivo_pdf(entrada["sha256"])
+        return self._ruta_texto(url)
+
+    def encabezados_condicionales(self, url):
+        """
+        Devuelve los encabezados If-None-Match/If-Modified-Since para la URL, si los hay.
+        """
+        with self._lock:
+            entrada = self.indice.get(url)
+        if not entrada or not os.path.exists(self._ruta_guardada(entrada, url)):
+            return {}
+        # Un texto limpiado con otro formato no sirve: se descarga la página completa.
+        # Los PDFs se guardan tal cual, así que no dependen de la limpieza.
+        if not entrada.get("sha256") and entrada.get("version") != VERSION_LIMPIEZA:
+            return {}
+        encabezados = {}
+        if entrada.get("etag"):
+            encabezados["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            encabezados["If-Modified-Since"] = entrada["last_modified"]
+        return encabezados
+
+    def leer_texto(self, url):
+        with open(self._ruta_texto(url), "r", encoding="utf-8") as archivo:
+            return archivo.read()
 
-def raspar_y_limpiar_urls(urls):
+    def guardar(self, url, response, texto_limpio):
+        with open(self._ruta_texto(url), "w", encoding="utf-8") as archivo:
+            archivo.write(texto_limpio)
+        with self._lock:
+            self.indice[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "version": VERSION_LIMPIEZA,
+            }
+
+    # --- PDFs, direccionados por contenido ---
+
+    def ruta_archivo_pdf(self, sha256):
+        return os.path.join(self.ruta_pdf, sha256 + ".pdf")
+
+    def ruta_parcial(self, url):
+        """
+        Descarga en curso de la URL; sobrevive a una interrupción para poder reanudarla.
+        """
+        return os.path.join(self.ruta_pdf, "parciales", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+    def sha256_de(self, url):
+        with self._lock:
+            return (self.indice.get(url) or {}).get("sha256")
+
+    def guardar_pdf(self, url, response, sha256):
+        with self._lock:
+            anterior = (self.indice.get(url) or {}).get("sha256")
+            self.indice[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": sha256,
+            }
+            # La versión anterior se borra si ninguna otra URL tiene el mismo contenido.
+            if anterior and anterior != sha256 and not any(
+                entrada.get("sha256") == anterior for entrada in self.indice.values()
+            ):
+                for ruta in (self.ruta_archivo_pdf(anterior), os.path.join(self.ruta_pdf, anterior + ".json")):
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+
+    def leer_paginas_pdf(self, sha256):
+        """
+        Texto ya extraído de las páginas del PDF, o None si aún no se ha parseado.
+        """
+        ruta = os.path.join(self.ruta_pdf, sha256 + ".json")
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        return datos["paginas"] if datos.get("version") == VERSION_PARSEO_PDF else None
+
+    def guardar_paginas_pdf(self, sha256, paginas):
+        ruta = os.path.join(self.ruta_pdf, sha256 + ".json")
+        temporal = ruta + f".{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"version": VERSION_PARSEO_PDF, "paginas": paginas}, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def persistir(self):
+        with self._lock:
+            temporal = self.ruta_indice + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(self.indice, archivo, ensure_ascii=False, indent=2)
+            os.replace(temporal, self.ruta_indice)
+
+def crear_sesion():
+    """
+    Crea una sesión HTTP que reutiliza conexiones (keep-alive) y reintenta
+    con backoff exponencial ante errores de conexión y respuestas 429/5xx.
+    """
+    reintentos = Retry(
+        total=MAX_REINTENTOS,
+        backoff_factor=FACTOR_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=MAX_DESCARGAS_SIMULTANEAS,
+        pool_maxsize=MAX_DESCARGAS_POR_HOST,
+        max_retries=reintentos,
+    )
+    sesion = requests.Session()
+    sesion.headers.update(HEADERS)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+def limpiar_html(contenido):
+    """
+    Extrae el texto visible de una página HTML conservando sus encabezados
+    ('## Requisitos') y listas ('- ...'), que separan las partes de cada trámite.
+    """
+    soup = BeautifulSoup(contenido, 'html.parser')
+
+    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript']):
+        tag.decompose()
+
+    return texto_estructurado_html(soup)
+
+def es_url_pdf(url):
+    return urlparse(url).path.lower().endswith(".pdf")
+
+def descargar_y_limpiar(url, sesion, cache, semaforos_por_host):
+    """
+    Descarga una URL respetando el límite de conexiones de su host y devuelve
+    una tupla (texto_limpio, estado). Usa GET condicional contra la caché.
+    """
+    host = urlparse(url).netloc
+    with semaforos_por_host[host]:
+        response = sesion.get(
+            url, headers=cache.encabezados_condicionales(url), timeout=TIMEOUT_SEGUNDOS
+        )
+
+    if response.status_code == 304:
+        return cache.leer_texto(url), "sin cambios (304)"
+
+    response.raise_for_status()
+    texto_limpio = limpiar_html(response.content)
+    cache.guardar(url, response, texto_limpio)
+    return texto_limpio, "descargada"
+
+# --- PDFs ENLAZADOS: DESCARGA EN STREAMING Y PARSEO EN PROCESOS ---
+
+def _sha256_de_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return sha
+
+def _recibir_pdf(response, parcial, validadores, descargados):
+    """
+    Escribe el cuerpo de la respuesta en la descarga parcial, calculando el
+    SHA-256 al vuelo. Devuelve (sha, estado, tamaño total esperado o None), o
+    None si el servidor no continuó desde el byte pedido y hay que empezar de nuevo.
+    """
+    reanudada = (descargados > 0 and response.status_code == 206 and
+                 response.headers.get("Content-Range", "").startswith(f"bytes {descargados}-"))
+    if descargados and response.status_code in (206, 416) and not reanudada:
+        return None
+    response.raise_for_status()
+
+    # Tamaño del archivo completo: el total de Content-Range o, si no hay rango, Content-Length.
+    if response.headers.get("Content-Range"):
+        total = response.headers["Content-Range"].rsplit("/", 1)[-1]
+    else:
+        total = response.headers.get("Content-Length", "")
+    esperado = int(total) if total.isdigit() else None
+    if reanudada:
+        sha, modo, estado = _sha256_de_archivo(parcial), "ab", f"descargada (reanudada en {descargados} B)"
+    else:
+        sha, modo, estado = hashlib.sha256(), "wb", "descargada"
+        with open(validadores, "w", encoding="utf-8") as archivo:
+            json.dump(response.headers.get("ETag") or response.headers.get("Last-Modified"), archivo)
+    with open(parcial, modo) as archivo:
+        for bloque in response.iter_content(TAMANO_BLOQUE_DESCARGA):
+            sha.update(bloque)
+            archivo.write(bloque)
+    return sha, estado, esperado
+
+def descargar_pdf(url, sesion, cache, semaforos_por_host):
+    """
+    Descarga el PDF por bloques directamente a disco (nunca entero en memoria)
+    y lo guarda con su SHA-256 como nombre. Si una descarga anterior quedó a
+    medias, la reanuda con una petición Range; 'If-Range' garantiza que el
+    servidor envíe el archivo completo si cambió entretanto.
+    Devuelve una tupla (sha256, estado).
+    """
+    parcial = cache.ruta_parcial(url)
+    validadores = parcial + ".json"   # ETag/Last-Modified de la versión que se está descargando
+    # Sin compresión: los rangos deben referirse a los bytes del archivo.
+    encabezados = {"Accept-Encoding": "identity"}
+    descargados = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+    if descargados and os.path.exists(validadores):
+        with open(validadores, "r", encoding="utf-8") as archivo:
+            validador = json.load(archivo)
+        if validador:
+            encabezados["Range"] = f"bytes={descargados}-"
+            encabezados["If-Range"] = validador
+    else:
+        encabezados.update(cache.encabezados_condicionales(url))
+
+    host = urlparse(url).netloc
+    with semaforos_por_host[host]:
+        with sesion.get(url, headers=encabezados, timeout=TIMEOUT_SEGUNDOS, stream=True) as response:
+            if response.status_code == 304:
+                return cache.sha256_de(url), "sin cambios (304)"
+            recibido = _recibir_pdf(response, parcial, validadores, descargados)
+
+    if recibido is None:
+        # La parte descargada ya no coincide con el archivo: se empieza de nuevo.
+        os.remove(parcial)
+        return descargar_pdf(url, sesion, cache, semaforos_por_host)
+
+    sha, estado, esperado = recibido
+    recibidos = os.path.getsize(parcial)
+    if esperado is not None and recibidos != esperado:
+        # Un cuerpo cortado sin error no se guarda; si quedó corto, se reanuda en la próxima ejecución.
+        if recibidos > esperado:
+            os.remove(parcial)
+        raise IOError(f"descarga incompleta: {recibidos} de {esperado} bytes")
+
+    sha256 = sha.hexdigest()
+    # Dos URLs con el mismo contenido comparten archivo (y texto parseado).
+    os.replace(parcial, cache.ruta_archivo_pdf(sha256))
+    os.remove(validadores)
+    cache.guardar_pdf(url, response, sha256)
+    return sha256, estado
+
+def parsear_pdf(ruta):
+    """
+    Extrae el texto de cada página del PDF. Corre en un proceso aparte.
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+    return [pagina.page_content for pagina in PyPDFLoader(ruta).load()]
+
+def documentos_pdf(url, paginas):
+    return [
+        Document(page_content=texto, metadata={"source": url, "page": numero})
+        for numero, texto in enumerate(paginas)
+        if texto.strip()
+    ]
+
+def descargar_y_parsear_pdf(url, sesion, cache, semaforos_por_host, procesos):
+    """
+    Descarga el PDF y devuelve (páginas, estado). Un PDF cuyo hash ya tiene
+    texto en la caché no se vuelve a parsear; los demás se parsean en el pool
+    de procesos mientras los otros hilos siguen descargando.
+    """
+    sha256, estado = descargar_pdf(url, sesion, cache, semaforos_por_host)
+    paginas = cache.leer_paginas_pdf(sha256)
+    if paginas is not None:
+        return paginas, estado if estado.startswith("sin cambios") else f"{estado}, mismo hash"
+    paginas = procesos.submit(parsear_pdf, cache.ruta_archivo_pdf(sha256)).result()
+    cache.guardar_paginas_pdf(sha256, paginas)
+    return paginas, f"{estado}, parseada"
+
+def mostrar_tiempos(tiempos):
+    """
+    Imprime el tiempo y el estado de cada URL, de la más lenta a la más rápida.
+    """
+    print("\n--- Tiempos por URL ---")
+    for url, duracion, estado in sorted(tiempos, key=lambda t: t[1], reverse=True):
+        print(f"{duracion:7.2f}s  {estado:<20} {url}")
+
+def raspar_y_limpiar_urls(urls, max_descargas=MAX_DESCARGAS_SIMULTANEAS, fallidas=None):
     """
     Recopila el contenido de una lista de URLs, lo limpia y lo convierte
     en una lista de objetos Document de LangChain.
+    Las descargas se hacen en paralelo con un límite de conexiones por host,
+    y las páginas sin cambios se leen de la caché HTTP en disco. Los PDFs
+    enlazados se descargan a disco y se parsean en un pool de procesos; cada
+    página del PDF es un documento. Con 'fallidas' (un set), se agregan las
+    URLs que no se pudieron procesar.
     """
     print("Iniciando el proceso de web scraping...")
-    documentos_procesados = []
+    cache = CacheHTTP()
+    sesion = crear_sesion()
+    semaforos_por_host = {
+        urlparse(url).netloc: threading.BoundedSemaphore(MAX_DESCARGAS_POR_HOST) for url in urls
+    }
+    procesos = ProcessPoolExecutor(max_workers=PROCESOS_PARSEO_PDF) if any(map(es_url_pdf, urls)) else None
 
-    for url in urls:
+    def procesar(url):
+        inicio = time.perf_counter()
         try:
-            print(f"Procesando: {url}")
-            
-            # --- MEJORA 1: Identificar y saltar PDFs ---
-            if url.lower().endswith('.pdf'):
-                print(f"-> Omitiendo URL porque es un archivo PDF: {url}")
-                continue # Pasa a la siguiente URL
-
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
-
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-                tag.decompose()
-
-            texto_crudo = soup.get_text()
-            
-            lineas = (line.strip() for line in texto_crudo.splitlines())
-            fragmentos = (frase.strip() for line in lineas for frase in line.split("  "))
-            texto_limpio = '\n'.join(f for f in fragmentos if f)
-
-            if texto_limpio:
-                nuevo_documento = Document(page_content=texto_limpio, metadata={"source": url})
-                documentos_procesados.append(nuevo_documento)
-        
+            if es_url_pdf(url):
+                paginas, estado = descargar_y_parsear_pdf(url, sesion, cache, semaforos_por_host, procesos)
+                documentos = documentos_pdf(url, paginas)
+            else:
+                texto_limpio, estado = descargar_y_limpiar(url, sesion, cache, semaforos_por_host)
+                documentos = [Document(page_content=texto_limpio, metadata={"source": url})] if texto_limpio else []
         # --- MEJORA 2: Capturar CUALQUIER error para evitar que el programa se cierre ---
         except Exception as e:
-            print(f"ERROR: No se pudo procesar la URL {url}.")
-            print(f"   Motivo: {e}")
+            # Un solo print por mensaje para que no se mezclen las líneas de distintos hilos.
+            print(f"ERROR: No se pudo procesar la URL {url}.\n   Motivo: {e}")
             # traceback.print_exc() # Descomenta esta línea para ver un error mucho más detallado
+            documentos, estado = [], "error"
+            if fallidas is not None:
+                fallidas.add(url)
+        duracion = time.perf_counter() - inicio
+        print(f"Procesada ({estado}, {duracion:.2f}s): {url}")
+        return documentos, (url, duracion, estado)
+
+    inicio_total = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_descargas) as executor:
+            resultados = list(executor.map(procesar, urls))
+    finally:
+        if procesos:
+            procesos.shutdown()
+    cache.persistir()
+    sesion.close()
+
+    documentos_procesados = [documento for documentos, _ in resultados for documento in documentos]
+    paginas_pdf = sum(len(documentos) for (documentos, _), url in zip(resultados, urls) if es_url_pdf(url))
 
-    print(f"\nSe procesaron exitosamente {len(documentos_procesados)} páginas web.")
+    mostrar_tiempos([tiempo for _, tiempo in resultados])
+    print(f"Tiempo total de scraping: {time.perf_counter() - inicio_total:.2f}s")
+    print(f"\nSe procesaron exitosamente {len(documentos_procesados) - paginas_pdf} páginas web "
+          f"y {paginas_pdf} páginas de PDFs.")
     return documentos_procesados
 
-def dividir_documentos(documentos):
+def dividir_documentos(documentos, divisor=DIVISOR):
     if not documentos:
         return None
-    print("Dividiendo documentos en fragmentos (chunks)...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=200,
-        length_function=len,
-        add_start_index=True
-    )
-    fragmentos = text_splitter.split_documents(documentos)
+    print(f"Dividiendo documentos en fragmentos (chunks, divisor '{divisor}')...")
+    # En las páginas de los PDFs los títulos de sección se reconocen por su forma.
+    pdfs = [d for d in documentos if es_url_pdf(d.metadata["source"])]
+    paginas = [d for d in documentos if not es_url_pdf(d.metadata["source"])]
+    fragmentos = (crear_divisor(divisor).split_documents(paginas) +
+                  crear_divisor(divisor, detectar_titulos=True).split_documents(pdfs))
+    # Los encabezados y textos repetidos entre páginas de uv.mx se embeben una sola vez.
+    fragmentos = eliminar_duplicados(fragmentos)
     print(f"Los documentos se dividieron en {len(fragmentos)} fragmentos.")
     return fragmentos
 
-def crear_y_guardar_vectordb(fragmentos):
+def sincronizar_coleccion(vectorstore, fragmentos, fuentes_fallidas=()):
+    """
+    Deja en la colección exactamente estos fragmentos. Cada uno tiene un ID
+    determinista (hash de su fuente y su texto): los que ya están se
+    conservan, los nuevos se agregan y los demás (de una ejecución anterior o
+    del divisor anterior) se borran. Así repetir la ingesta no duplica nada.
+    Los fragmentos de 'fuentes_fallidas' (URLs que esta vez no se pudieron
+    descargar) se conservan. Devuelve (agregados, borrados).
+    """
+    por_id = {clave_documento(f): f for f in fragmentos}
+    existentes = vectorstore.get(include=["metadatas"])
+    fuente_de = {
+        id_: (metadatos or {}).get("source")
+        for id_, metadatos in zip(existentes["ids"], existentes["metadatas"])
+    }
+    obsoletos = sorted(
+        id_ for id_, fuente in fuente_de.items()
+        if id_ not in por_id and fuente not in fuentes_fallidas
+    )
+    nuevos = [id_ for id_ in por_id if id_ not in fuente_de]
+    # Primero se agrega y después se borra: si Ollama falla a mitad de camino,
+    # la colección conserva los fragmentos anteriores.
+    for inicio in range(0, len(nuevos), TAMANO_LOTE_GUARDADO):
+        lote = nuevos[inicio:inicio + TAMANO_LOTE_GUARDADO]
+        vectorstore.add_documents([por_id[id_] for id_ in lote], ids=lote)
+    for inicio in range(0, len(obsoletos), TAMANO_LOTE_GUARDADO):
+        vectorstore.delete(ids=obsoletos[inicio:inicio + TAMANO_LOTE_GUARDADO])
+    return len(nuevos), len(obsoletos)
+
+def crear_y_guardar_vectordb(fragmentos, fuentes_fallidas=()):
     if not fragmentos:
         print("No hay fragmentos para procesar.")
         return
 
     try:
-        print("Creando la base de datos vectorial con ChromaDB...")
-        embeddings = OllamaEmbeddings(model=MODELO_EMBEDDING)
-        vectorstore = Chroma.from_documents(
-            documents=fragmentos,
-            embedding=embeddings,
-            persist_directory=CHROMA_PATH
-        )
+        print("Actualizando la base de datos vectorial con ChromaDB...")
+        # Solo los fragmentos que no están en la caché de embeddings se envían a Ollama.
+        embeddings = EmbeddingsConCache(MODELO_EMBEDDING)
+        vectorstore = Chroma(persist_directory=CHROMA_PATH, embedding_function=embeddings)
+        agregados, borrados = sincronizar_coleccion(vectorstore, fragmentos, fuentes_fallidas)
+        print(f"Fragmentos agregados: {agregados}, borrados: {borrados}, "
+              f"sin cambios: {len(fragmentos) - agregados}.")
+        if fuentes_fallidas:
+            print(f"Se conservaron los fragmentos anteriores de {len(fuentes_fallidas)} URLs que fallaron.")
+        embeddings.reporte()
+        registrar_modelo_embedding(vectorstore, MODELO_EMBEDDING)
+        construir_indice_desde_chroma(vectorstore, CHROMA_PATH)
+        actualizar_si_existe(vectorstore, CHROMA_PATH)
         print(f"¡Base de datos guardada exitosamente en la carpeta '{CHROMA_PATH}'!")
     
     # --- MEJORA 3: Capturar error si Ollama no está disponible ---
@@ -144,16 +527,48 @@ def crear_y_guardar_vectordb(fragmentos):
         print("2. Abre otra terminal y ejecuta el comando 'ollama serve'.")
         print("3. Verifica que el modelo 'nomic-embed-text' esté descargado ('ollama pull nomic-embed-text').")
         print("---------------------\n")
+        # La traza de la ingesta debe registrar el fallo.
+        raise
 
 
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(
+        description="Descarga las páginas de URLS_A_ESCANEAR y actualiza su base de datos vectorial."
+    )
+    parser.add_argument(
+        "--reconstruir", action="store_true",
+        help=f"Borra '{CHROMA_PATH}' y vuelve a crear la colección desde cero."
+    )
+    return parser.parse_args()
+
 # --- BLOQUE DE EJECUCIÓN PRINCIPAL ---
 if __name__ == "__main__":
-    documentos_web = raspar_y_limpiar_urls(URLS_A_ESCANEAR)
-    
-    if documentos_web:
-        fragmentos_de_texto = dividir_documentos(documentos_web)
-        
-        if fragmentos_de_texto:
-            crear_y_guardar_vectordb(fragmentos_de_texto)
+    args = parsear_argumentos()
+    if args.reconstruir and os.path.exists(CHROMA_PATH):
+        print(f"Borrando la base de datos existente en '{CHROMA_PATH}'...")
+        shutil.rmtree(CHROMA_PATH)
+
+    # La duración de cada etapa queda registrada en 'trazas/'.
+    traza = TrazaIngesta("ingesta_web")
+    try:
+        # Las URLs que fallen en esta ejecución conservan sus fragmentos anteriores.
+        urls_fallidas = set()
+        with traza.etapa("descarga") as etapa:
+            documentos_web = raspar_y_limpiar_urls(URLS_A_ESCANEAR, fallidas=urls_fallidas)
+            etapa["elementos"] = len(documentos_web)
+
+        if documentos_web:
+            with traza.etapa("division") as etapa:
+                fragmentos_de_texto = dividir_documentos(documentos_web)
+                etapa["elementos"] = len(fragmentos_de_texto)
+
+            if fragmentos_de_texto:
+                with traza.etapa("embedding_e_indexado") as etapa:
+                    crear_y_guardar_vectordb(fragmentos_de_texto, urls_fallidas)
+                    etapa["elementos"] = len(fragmentos_de_texto)
+    except Exception as e:
+        traza.terminar(f"error: {type(e).__name__}", urls=len(URLS_A_ESCANEAR))
+        sys.exit(1)
+    traza.terminar(urls=len(URLS_A_ESCANEAR))
             
     print("\nProceso completado. Tu base de datos vectorial está lista para ser usada.")
\ No newline at end of file